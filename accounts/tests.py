@@ -1,3 +1,51 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from cart.models import Item, Order
+from movies.models import Movie
+
+
+@override_settings(ORDERS_PAGE_SIZE=10)
+class OrderHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10 + n, description='A movie.',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(5)
+        ]
+
+    def place_orders(self, count, items_per_order):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, total=0)
+            for movie in self.movies[:items_per_order]:
+                Item.objects.create(order=order, movie=movie, price=7, quantity=2)
+
+    def test_query_count_is_independent_of_order_size(self):
+        self.client.force_login(self.user)
+        # session + user, orders page, items joined with their movies
+        for orders, items_per_order in ((1, 1), (5, 3), (15, 5)):
+            self.place_orders(orders, items_per_order)
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('accounts.orders'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_shows_price_paid_not_current_price(self):
+        self.place_orders(1, 1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('accounts.orders'))
+        self.assertContains(response, '<td>$7</td>', html=True)
+
+    def test_orders_are_paginated_newest_first(self):
+        self.place_orders(12, 1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('accounts.orders'))
+        page = response.context['template_data']['page']
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page.object_list[0], Order.objects.latest('date', 'id'))
+
+        response = self.client.get(reverse('accounts.orders'), {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['template_data']['page']), 2)
@@ -3,7 +3,10 @@ from django.contrib.auth import login as auth_login, authenticate, logout as aut
 from .forms import CustomUserCreationForm, CustomErrorList
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.db.models import Prefetch
+from cart.models import Item
+from moviesstore.pagination import paginate
 
 # logs out the current user and redirects to the home page.
 @login_required
@@ -54,6 +57,14 @@ def signup(request):
 
 @login_required
 def orders(request):
-    template_data = {}
-    template_data = {'title': 'Orders', 'orders': request.user.orders.all()}
+    # One page of orders, newest first (keyset on the indexed date column),
+    # with their items and movies prefetched: three queries however many
+    # orders or items the user has.
+    user_orders = request.user.orders.prefetch_related(
+        Prefetch('items', queryset=Item.objects.select_related('movie').only(
+            'id', 'order_id', 'price', 'quantity', 'movie__id', 'movie__name'))
+    )
+    page = paginate(user_orders, ('-date', '-id'), request.GET.get('cursor'),
+                    settings.ORDERS_PAGE_SIZE)
+    template_data = {'title': 'Orders', 'orders': page.object_list, 'page': page}
     return render(request, 'accounts/orders.html', {'template_data': template_data})
\ No newline at end of file
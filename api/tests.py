@@ -0,0 +1,184 @@
+import json
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from cart.models import CartLine, Order
+from movies.models import Movie, Review
+
+
+class CatalogApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='secret')
+        cls.movies = {
+            name: Movie.objects.create(name=name, genre=genre, price=price, description=name,
+                                       image_url='https://example.com/poster.jpg')
+            for name, genre, price in (('Alien', 'SCIFI', '4.99'), ('Heat', 'ACTION', '9.99'),
+                                       ('Ronin', 'ACTION', '12.00'))
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_filters_selects_fields_and_pages(self):
+        url = reverse('api.movies')
+        data = self.client.get(url, {'fields': 'name,price', 'page_size': 2}).json()
+        self.assertEqual(data['results'], [{'name': 'Alien', 'price': '4.99'},
+                                           {'name': 'Heat', 'price': '9.99'}])
+        data = self.client.get(url, {'fields': 'name', 'page_size': 2,
+                                     'cursor': data['next']}).json()
+        self.assertEqual(data['results'], [{'name': 'Ronin'}])
+        self.assertIsNone(data['next'])
+
+        data = self.client.get(url, {'genre': 'ACTION', 'min_price': '10', 'fields': 'id'}).json()
+        self.assertEqual(data['results'], [{'id': self.movies['Ronin'].id}])
+
+        response = self.client.get(url, {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_if_none_match_returns_304_from_the_row_version(self):
+        url = reverse('api.movie', args=[self.movies['Heat'].id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['average_rating'], None)
+        etag = response['ETag']
+        # Only the row is read; nothing is serialized.
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Tags come from the data, not from this process's cache: they
+        # survive a restart, and a change made elsewhere still shows.
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with mock.patch('moviesstore.page_cache.invalidate'):
+            Review.objects.create(movie=self.movies['Heat'], user=self.user, rating=4,
+                                  comment='Tense.')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['average_rating'], 4)
+
+    def test_list_tags_follow_the_rows_on_the_page(self):
+        url = reverse('api.movies')
+        params = {'fields': 'name', 'page_size': 2}
+        etag = self.client.get(url, params)['ETag']
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another field selection is another representation.
+        other = self.client.get(url, {**params, 'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+
+        self.movies['Heat'].price = '8.99'
+        self.movies['Heat'].save()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url, params)['ETag']
+        # A movie after the page changes its next cursor, hence the tag.
+        self.movies['Ronin'].delete()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_review_lifecycle(self):
+        movie = self.movies['Alien']
+        url = reverse('api.reviews', args=[movie.id])
+        body = json.dumps({'rating': 5, 'comment': 'In space.'})
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+        self.client.force_login(self.user)
+        response = self.client.post(url, json.dumps({'rating': 6, 'comment': 'x'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        review_url = response['Location']
+        self.assertEqual(response.json()['user'], 'critic')
+
+        etag = self.client.get(review_url)['ETag']
+        self.assertEqual(self.client.get(review_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.patch(review_url, json.dumps({'rating': 3}),
+                                     content_type='application/json')
+        self.assertEqual(response.json()['rating'], 3)
+        self.assertEqual(response.json()['comment'], 'In space.')
+        self.assertEqual(self.client.get(review_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        movie.refresh_from_db()
+        self.assertEqual(movie.rating_sum, 3)
+
+        self.client.force_login(User.objects.create_user('stranger'))
+        self.assertEqual(self.client.delete(review_url).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.delete(review_url).status_code, 204)
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+    def test_unsupported_method(self):
+        response = self.client.post(reverse('api.movies'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'GET')
+
+
+class CartApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10, description='A movie.',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(2)
+        ]
+
+    def put_line(self, movie, quantity):
+        return self.client.put(reverse('api.cart_line', args=[movie.id]),
+                               json.dumps({'quantity': quantity}),
+                               content_type='application/json')
+
+    def test_cart_and_checkout(self):
+        response = self.client.post(reverse('api.session'),
+                                    json.dumps({'username': 'buyer', 'password': 'secret'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['user'], 'buyer')
+
+        self.assertEqual(self.put_line(self.movies[0], 0).status_code, 400)
+        self.put_line(self.movies[0], 2)
+        response = self.put_line(self.movies[1], 1)
+        self.assertEqual(response.json()['total'], '30.00')
+        etag = response['ETag']
+        response = self.client.get(reverse('api.cart'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.put_line(self.movies[1], 3)
+        self.assertEqual(self.client.get(reverse('api.cart'), HTTP_IF_NONE_MATCH=etag).status_code,
+                         200)
+
+        body = json.dumps({'checkout_token': str(uuid.uuid4())})
+        first = self.client.post(reverse('api.orders'), body, content_type='application/json')
+        second = self.client.post(reverse('api.orders'), body, content_type='application/json')
+        self.assertEqual((first.status_code, second.status_code), (201, 200))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first.json()['total'], 50)
+        self.assertEqual(len(first.json()['items']), 2)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertFalse(CartLine.objects.exists())
+
+        data = self.client.get(reverse('api.orders')).json()
+        self.assertEqual([order['id'] for order in data['results']], [first.json()['id']])
+
+    def test_checkout_token_used_by_another_user(self):
+        body = json.dumps({'checkout_token': str(uuid.uuid4())})
+        for user in (self.user, User.objects.create_user('other')):
+            self.client.force_login(user)
+            self.put_line(self.movies[0], 1)
+            response = self.client.post(reverse('api.orders'), body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_orders_require_login(self):
+        self.assertEqual(self.client.get(reverse('api.orders')).status_code, 401)
+        self.client.force_login(self.user)
+        other = User.objects.create_user('other')
+        order = Order.objects.create(user=other, total=0)
+        self.assertEqual(self.client.get(reverse('api.order', args=[order.id])).status_code, 404)
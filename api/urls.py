@@ -0,0 +1,14 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('session/', views.session, name='api.session'),
+    path('movies/', views.movies, name='api.movies'),
+    path('movies/<int:id>/', views.movie, name='api.movie'),
+    path('movies/<int:id>/reviews/', views.reviews, name='api.reviews'),
+    path('reviews/<int:review_id>/', views.review, name='api.review'),
+    path('cart/', views.cart, name='api.cart'),
+    path('cart/lines/<int:movie_id>/', views.cart_line, name='api.cart_line'),
+    path('orders/', views.orders, name='api.orders'),
+    path('orders/<int:order_id>/', views.order, name='api.order'),
+]
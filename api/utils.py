@@ -0,0 +1,174 @@
+"""
+Plumbing shared by the JSON API views (api/views.py).
+
+Rows are read with .values() and rendered through a FieldSet, which maps
+each API field to the columns it needs. A ?fields= selection therefore
+narrows the SELECT as well as the output.
+
+Every GET response carries a strong ETag, and a request whose
+If-None-Match matches gets a 304 before anything is serialized. Tags are
+derived from the data, so they hold across processes and restarts:
+movies and reviews are tagged with the last_updated_date of every row in
+the response (rating changes bump the movie's too), and per-user
+responses (cart, orders) with a hash of the rows they are built from. A
+list's tag also covers its cursors, so rows added or removed next to the
+page change it.
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+
+from moviesstore.pagination import get_page_size, paginate
+
+
+class ApiError(Exception):
+    """An error reported to the client as {"error": message}."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def error_response(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(methods, login_required=False):
+    """
+    Restrict a view to `methods`, answer anonymous users with 401 (instead
+    of a redirect to the login page) when `login_required`, and turn
+    ApiError and Http404 into JSON errors.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = error_response(f'Method {request.method} not allowed.', 405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            if login_required and not request.user.is_authenticated:
+                return error_response('Authentication required.', 401)
+            try:
+                return view_func(request, *args, **kwargs)
+            except ApiError as error:
+                return error_response(error.message, error.status)
+            except Http404:
+                return error_response('Not found.', 404)
+        return wrapper
+    return decorator
+
+
+def read_json(request):
+    """The JSON object sent as the request body."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise ApiError('The request body is not valid JSON.')
+    if not isinstance(data, dict):
+        raise ApiError('The request body must be a JSON object.')
+    return data
+
+
+class FieldSet:
+    """
+    The fields of one API resource. Each field is given either as the
+    column it is read from, or as (columns, render) where render(row)
+    computes the value from those columns.
+    """
+
+    def __init__(self, **fields):
+        self.fields = {}
+        for name, spec in fields.items():
+            if isinstance(spec, str):
+                spec = ((spec,), None)
+            self.fields[name] = spec
+
+    def select(self, request):
+        """The field names chosen with ?fields=a,b (default: all)."""
+        requested = request.GET.get('fields')
+        if not requested:
+            return list(self.fields)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Unknown field(s): {', '.join(unknown)}. "
+                           f"Available: {', '.join(self.fields)}.")
+        return names
+
+    def columns(self, names, *required):
+        """The columns to pass to .values() for `names`, plus `required`."""
+        columns = dict.fromkeys(required)
+        for name in names:
+            columns.update(dict.fromkeys(self.fields[name][0]))
+        return list(columns)
+
+    def render(self, row, names):
+        data = {}
+        for name in names:
+            columns, render = self.fields[name]
+            data[name] = render(row) if render else row[columns[0]]
+        return data
+
+
+def make_etag(*parts):
+    """A strong ETag over `parts` (anything with a stable repr)."""
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def not_modified(request, etag, private=False):
+    """A 304 response if the client's If-None-Match matches `etag`, else None."""
+    header = request.headers.get('If-None-Match')
+    if header is None:
+        return None
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    if etag in tags or '*' in tags:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+        return response
+    return None
+
+
+def json_response(data, etag=None, status=200, private=False):
+    """
+    A JSON response. Responses with an `etag` may be kept by clients but
+    must be revalidated on every use; `private` ones (a user's cart or
+    orders) must not be kept by shared caches.
+    """
+    response = JsonResponse(data, status=status)
+    if etag is not None:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+    if private:
+        patch_cache_control(response, private=True)
+    return response
+
+
+def page_response(request, queryset, ordering, render, version, private=False):
+    """
+    One keyset page of a .values() queryset (?cursor=, ?page_size=) as
+    {"results": render(rows), "next": cursor, "previous": cursor}, tagged
+    with version(row) of the rows on the page.
+    """
+    page_size = get_page_size(request, settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+    page = paginate(queryset, ordering, request.GET.get('cursor'), page_size)
+    etag = make_etag(request.get_full_path(), [version(row) for row in page.object_list],
+                     page.next_cursor, page.previous_cursor)
+    response = not_modified(request, etag, private=private)
+    if response:
+        return response
+    return json_response({
+        'results': render(page.object_list),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }, etag=etag, private=private)
+
+
+def row_version(row):
+    """The version of a movie or review row: its id and last_updated_date."""
+    return row['id'], row['last_updated_date']
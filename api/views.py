@@ -0,0 +1,298 @@
+"""
+JSON API for the mobile client: the catalog, reviews, the cart and order
+history. See api/utils.py for field selection, ETags and pagination.
+"""
+from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from cart.models import Item, Order
+from cart.utils import (cart_lines, clear_cart, get_cart, get_cart_lines, parse_checkout_token,
+                        parse_quantity, place_order, set_cart_quantity)
+from movies import facets, search
+from movies.models import Movie, Review
+from movies.posters import poster_url
+
+from .utils import (ApiError, FieldSet, api_view, json_response, make_etag, not_modified,
+                    page_response, read_json, row_version)
+
+
+def _image(row):
+    if row['image']:
+        return default_storage.url(row['image'])
+    if row['image_url']:
+        return poster_url(row['image_url'])
+    return None
+
+
+def _average_rating(row):
+    if not row['review_count']:
+        return None
+    return row['rating_sum'] / row['review_count']
+
+
+MOVIE_FIELDS = FieldSet(
+    id='id',
+    name='name',
+    price='price',
+    genre='genre',
+    description='description',
+    image=(('image', 'image_url'), _image),
+    review_count='review_count',
+    average_rating=(('review_count', 'rating_sum'), _average_rating),
+)
+
+REVIEW_FIELDS = FieldSet(
+    id='id',
+    movie='movie_id',
+    user='user__username',
+    rating='rating',
+    comment='comment',
+    created_date='created_date',
+    last_updated_date='last_updated_date',
+)
+
+
+def _no_content():
+    return HttpResponse(status=204)
+
+
+@api_view(['GET', 'POST', 'DELETE'])
+def session(request):
+    """
+    GET: the logged-in user and a CSRF token for the X-CSRFToken header of
+    writes. POST {"username", "password"}: log in. DELETE: log out.
+    """
+    if request.method == 'POST':
+        data = read_json(request)
+        user = authenticate(request, username=data.get('username'), password=data.get('password'))
+        if user is None:
+            raise ApiError('The username or password is incorrect.')
+        auth_login(request, user)
+    elif request.method == 'DELETE':
+        auth_logout(request)
+        return _no_content()
+    username = request.user.username if request.user.is_authenticated else None
+    return json_response({'user': username, 'csrf_token': get_token(request)}, private=True)
+
+
+@api_view(['GET'])
+def movies(request):
+    """
+    Movies ordered by (name, id), or best match first with ?search=,
+    filtered like the catalog page (search, any number of genre, min_price,
+    max_price).
+    """
+    names = MOVIE_FIELDS.select(request)
+    search_term = request.GET.get('search', '')
+    movies = Movie.objects.all()
+    ordering = ('name', 'id')
+    if search_term:
+        movies = search.search(movies, search_term)
+        ordering = search.RANK_ORDERING
+    movies = facets.filter_movies(movies,
+                                  facets.parse_genres(request.GET.getlist('genre')),
+                                  facets.parse_price(request.GET.get('min_price')),
+                                  facets.parse_price(request.GET.get('max_price')))
+    movies = movies.values(*MOVIE_FIELDS.columns(names, *ordering, 'last_updated_date'))
+    return page_response(request, movies, ordering,
+                         lambda rows: [MOVIE_FIELDS.render(row, names) for row in rows],
+                         row_version)
+
+
+@api_view(['GET'])
+def movie(request, id):
+    names = MOVIE_FIELDS.select(request)
+    columns = MOVIE_FIELDS.columns(names, 'id', 'last_updated_date')
+    row = get_object_or_404(Movie.objects.values(*columns), id=id)
+    etag = make_etag(request.get_full_path(), row_version(row))
+    response = not_modified(request, etag)
+    if response:
+        return response
+    return json_response(MOVIE_FIELDS.render(row, names), etag=etag)
+
+
+def _parse_review(data, partial=False):
+    """The rating and comment of a review body, validated like the review form."""
+    fields = {}
+    if 'rating' in data or not partial:
+        rating = data.get('rating')
+        if type(rating) is not int or not 1 <= rating <= 5:
+            raise ApiError('rating must be an integer from 1 to 5.')
+        fields['rating'] = rating
+    if 'comment' in data or not partial:
+        comment = data.get('comment')
+        max_length = Review._meta.get_field('comment').max_length
+        if not isinstance(comment, str) or not comment.strip() or len(comment) > max_length:
+            raise ApiError(f'comment must be a non-empty string of at most {max_length} characters.')
+        fields['comment'] = comment
+    return fields
+
+
+def _review_row(review_id, names):
+    columns = REVIEW_FIELDS.columns(names, 'id', 'last_updated_date')
+    return get_object_or_404(Review.objects.values(*columns), id=review_id)
+
+
+@api_view(['GET', 'POST'])
+def reviews(request, id):
+    """
+    GET: the reviews of a movie, newest first.
+    POST {"rating", "comment"}: review the movie (logged-in users).
+    """
+    if request.method == 'POST':
+        if not request.user.is_authenticated:
+            raise ApiError('Authentication required.', 401)
+        movie = get_object_or_404(Movie, id=id)
+        review = Review(movie=movie, user=request.user, **_parse_review(read_json(request)))
+        # The movie's rating aggregates are updated in the same transaction.
+        with transaction.atomic():
+            review.save()
+        names = list(REVIEW_FIELDS.fields)
+        response = json_response(REVIEW_FIELDS.render(_review_row(review.id, names), names),
+                                 status=201)
+        response['Location'] = reverse('api.review', args=[review.id])
+        return response
+
+    names = REVIEW_FIELDS.select(request)
+    get_object_or_404(Movie.objects.only('id'), id=id)
+    reviews = (Review.objects.filter(movie_id=id)
+               .values(*REVIEW_FIELDS.columns(names, 'created_date', 'id', 'last_updated_date')))
+    return page_response(request, reviews, ('-created_date', '-id'),
+                         lambda rows: [REVIEW_FIELDS.render(row, names) for row in rows],
+                         row_version)
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+def review(request, review_id):
+    """
+    GET: one review, tagged with its last_updated_date.
+    PATCH {"rating"?, "comment"?} and DELETE: the author's own review.
+    """
+    if request.method == 'GET':
+        names = REVIEW_FIELDS.select(request)
+        row = _review_row(review_id, names)
+        etag = make_etag(request.get_full_path(), row_version(row))
+        response = not_modified(request, etag)
+        if response:
+            return response
+        return json_response(REVIEW_FIELDS.render(row, names), etag=etag)
+
+    if not request.user.is_authenticated:
+        raise ApiError('Authentication required.', 401)
+    review = get_object_or_404(Review, id=review_id)
+    if review.user_id != request.user.id:
+        raise ApiError('You can only change your own reviews.', 403)
+    if request.method == 'DELETE':
+        with transaction.atomic():
+            review.delete()
+        return _no_content()
+
+    for field, value in _parse_review(read_json(request), partial=True).items():
+        setattr(review, field, value)
+    with transaction.atomic():
+        review.save()
+    names = list(REVIEW_FIELDS.fields)
+    row = _review_row(review_id, names)
+    return json_response(REVIEW_FIELDS.render(row, names), etag=make_etag(
+        reverse('api.review', args=[review_id]), row_version(row)))
+
+
+def _cart_response(request):
+    rows = list(cart_lines(request).values('id', 'movie_id', 'movie__name', 'movie__price',
+                                           'quantity'))
+    etag = make_etag('cart', rows)
+    response = not_modified(request, etag, private=True)
+    if response:
+        return response
+    lines = [{'movie': row['movie_id'], 'name': row['movie__name'], 'price': row['movie__price'],
+              'quantity': row['quantity']} for row in rows]
+    total = sum(row['movie__price'] * row['quantity'] for row in rows)
+    return json_response({'lines': lines, 'total': total}, etag=etag, private=True)
+
+
+@api_view(['GET', 'DELETE'])
+def cart(request):
+    """GET: the lines of the current cart and its total. DELETE: empty it."""
+    if request.method == 'DELETE':
+        clear_cart(request)
+        return _no_content()
+    return _cart_response(request)
+
+
+@api_view(['PUT', 'DELETE'])
+def cart_line(request, movie_id):
+    """PUT {"quantity"}: set the quantity of a movie. DELETE: remove it."""
+    if request.method == 'DELETE':
+        cart_lines(request).filter(movie_id=movie_id).delete()
+        return _no_content()
+    movie = get_object_or_404(Movie, id=movie_id)
+    quantity = read_json(request).get('quantity')
+    if type(quantity) is not int or parse_quantity(quantity) is None:
+        raise ApiError('quantity must be an integer from 1 to the maximum per movie.')
+    set_cart_quantity(get_cart(request, create=True), movie, quantity)
+    return _cart_response(request)
+
+
+def _order_items(order_ids):
+    """{order id: [item, ...]} of the given orders, in one query."""
+    items = {order_id: [] for order_id in order_ids}
+    rows = (Item.objects.filter(order_id__in=order_ids).order_by('id')
+            .values('order_id', 'movie_id', 'movie__name', 'price', 'quantity'))
+    for row in rows:
+        items[row['order_id']].append({'movie': row['movie_id'], 'name': row['movie__name'],
+                                       'price': row['price'], 'quantity': row['quantity']})
+    return items
+
+
+def _render_orders(rows):
+    items = _order_items([row['id'] for row in rows])
+    return [{'id': row['id'], 'date': row['date'], 'total': row['total'],
+             'items': items[row['id']]} for row in rows]
+
+
+@api_view(['GET', 'POST'], login_required=True)
+def orders(request):
+    """
+    GET: the user's orders, newest first, with their items.
+    POST {"checkout_token"}: buy the cart. Resubmitting a token returns the
+    order it already created.
+    """
+    if request.method == 'POST':
+        checkout_token = parse_checkout_token(read_json(request).get('checkout_token'))
+        if checkout_token is None:
+            raise ApiError('checkout_token must be a UUID.')
+        order = Order.objects.filter(checkout_token=checkout_token, user=request.user).first()
+        created = False
+        if order is None:
+            lines = get_cart_lines(request)
+            if not lines:
+                raise ApiError('The cart is empty.')
+            if any(parse_quantity(line.quantity) is None for line in lines):
+                raise ApiError('The cart holds an invalid quantity.')
+            order, created = place_order(request.user, checkout_token, lines)
+        row = Order.objects.values('id', 'date', 'total').get(id=order.id)
+        response = json_response(_render_orders([row])[0], status=201 if created else 200,
+                                 private=True)
+        response['Location'] = reverse('api.order', args=[order.id])
+        return response
+
+    # Orders and their items are not changed after checkout, so the order
+    # rows identify the page; the items are only read for a 200.
+    return page_response(request, request.user.orders.values('id', 'date', 'total'),
+                         ('-date', '-id'), _render_orders,
+                         lambda row: (row['id'], row['date'], row['total']), private=True)
+
+
+@api_view(['GET'], login_required=True)
+def order(request, order_id):
+    row = get_object_or_404(request.user.orders.values('id', 'date', 'total'), id=order_id)
+    etag = make_etag(request.get_full_path(), row)
+    response = not_modified(request, etag, private=True)
+    if response:
+        return response
+    return json_response(_render_orders([row])[0], etag=etag, private=True)
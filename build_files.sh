@@ -0,0 +1,6 @@
+#!/bin/sh
+# Vercel build step (see vercel.json): collect the static files, with
+# content-hashed names and .gz/.br variants, into staticfiles/.
+set -e
+python3 -m pip install -r requirements.txt
+python3 manage.py collectstatic --noinput --clear
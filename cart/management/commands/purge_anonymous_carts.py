@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from cart.utils import purge_anonymous_carts
+
+
+class Command(BaseCommand):
+    help = ('Delete anonymous carts not changed in the last CART_ANONYMOUS_TTL seconds. '
+            'Run it daily, e.g. from cron.')
+
+    def handle(self, *args, **options):
+        deleted = purge_anonymous_carts()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} anonymous carts.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart import sales
+
+from .export_orders import parse_date
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily sales rollups behind the admin sales dashboard from '
+            'the order items, e.g. after orders were edited in the admin.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date,
+                            help='First day to rebuild (YYYY-MM-DD, default: all).')
+        parser.add_argument('--end', type=parse_date,
+                            help='Last day to rebuild (YYYY-MM-DD, default: all).')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        movie_rows, genre_rows = sales.rebuild(options['start'], options['end'],
+                                               batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {movie_rows} movie and {genre_rows} genre rollup rows in {elapsed:.2f}s.'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_order_user_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checkout_token',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:43
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_order_checkout_token'),
+        ('movies', '0008_review_movie_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cart',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('token', models.UUIDField(blank=True, editable=False, null=True, unique=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('last_updated_date', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cart', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('cart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='cart.cart')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cart', 'movie'), name='cartline_unique_movie')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    Item = apps.get_model('cart', 'Item')
+    DailyMovieSales = apps.get_model('cart', 'DailyMovieSales')
+    DailyGenreSales = apps.get_model('cart', 'DailyGenreSales')
+    db = schema_editor.connection.alias
+    items = (Item.objects.using(db)
+             .annotate(day=TruncDate('order__date', tzinfo=timezone.get_current_timezone()))
+             .order_by())
+    for model, group, field in ((DailyMovieSales, 'movie_id', 'movie_id'),
+                                (DailyGenreSales, 'movie__genre', 'genre')):
+        rows = (items.values('day', group)
+                .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity')))
+                .values_list('day', group, 'units', 'revenue'))
+        model.objects.using(db).bulk_create(
+            [model(day=day, **{field: key}, units=units, revenue=revenue)
+             for day, key, units, revenue in rows],
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_cart_cartline'),
+        ('movies', '0009_movie_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyGenreSales',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('genre', models.CharField(choices=[('ACTION', 'Action'), ('FAMILY', 'Family'), ('ADVENTURE', 'Adventure'), ('COMEDY', 'Comedy'), ('DRAMA', 'Drama'), ('HORROR', 'Horror'), ('SCIFI', 'Sci-Fi'), ('ROMANCE', 'Romance'), ('FANTASY', 'Fantasy')], max_length=20)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily genre sales',
+                'constraints': [models.UniqueConstraint(fields=('day', 'genre'), name='dailygenresales_day_genre')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyMovieSales',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='movies.movie')),
+            ],
+            options={
+                'verbose_name_plural': 'daily movie sales',
+                'constraints': [models.UniqueConstraint(fields=('day', 'movie'), name='dailymoviesales_day_movie')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
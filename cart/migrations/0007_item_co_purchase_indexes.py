@@ -0,0 +1,22 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_sales_rollups'),
+        ('movies', '0010_movie_neighbors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['movie', 'order'], name='item_movie_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['order', 'movie'], name='item_order_movie_idx'),
+        ),
+    ]
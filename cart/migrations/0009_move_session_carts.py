@@ -0,0 +1,83 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import migrations
+from django.utils import timezone
+
+# Keys of the old {movie id: quantity} cart and of the anonymous cart's
+# token (cart.utils.CART_TOKEN_SESSION_KEY) in the session.
+OLD_CART_SESSION_KEY = 'cart'
+CART_TOKEN_SESSION_KEY = 'cart_token'
+
+
+def _quantities(old_cart):
+    quantities = {}
+    for movie_id, quantity in (old_cart.items() if isinstance(old_cart, dict) else ()):
+        try:
+            movie_id, quantity = int(movie_id), int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity >= 1:
+            quantities[movie_id] = min(quantity, settings.CART_MAX_QUANTITY)
+    return quantities
+
+
+def move_session_carts(apps, schema_editor):
+    """
+    Carts used to live in the session as {movie id: quantity}. Copy those of
+    unexpired sessions into the logged-in user's Cart, or into a new
+    anonymous Cart whose token is written back into the session. Lines
+    already in a Cart win over the session's. Only database-backed sessions
+    can be reached; with other session engines the old carts are dropped.
+    """
+    Session = apps.get_model('sessions', 'Session')
+    Cart = apps.get_model('cart', 'Cart')
+    CartLine = apps.get_model('cart', 'CartLine')
+    Movie = apps.get_model('movies', 'Movie')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    db_alias = schema_editor.connection.alias
+    store = SessionStore()
+
+    sessions = Session.objects.using(db_alias).filter(expire_date__gt=timezone.now())
+    for session in sessions.iterator():
+        data = store.decode(session.session_data)
+        if OLD_CART_SESSION_KEY not in data:
+            continue
+        quantities = _quantities(data.pop(OLD_CART_SESSION_KEY))
+        movie_ids = set(Movie.objects.using(db_alias).filter(id__in=quantities)
+                        .values_list('id', flat=True))
+        quantities = {movie_id: quantity for movie_id, quantity in quantities.items()
+                      if movie_id in movie_ids}
+        if quantities:
+            user_id = data.get('_auth_user_id')
+            if user_id is not None and User.objects.using(db_alias).filter(pk=user_id).exists():
+                cart, _ = Cart.objects.using(db_alias).get_or_create(user_id=user_id)
+            else:
+                token = data.get(CART_TOKEN_SESSION_KEY)
+                cart = None
+                if token is not None:
+                    cart = Cart.objects.using(db_alias).filter(token=token, user__isnull=True).first()
+                if cart is None:
+                    cart = Cart.objects.using(db_alias).create(token=uuid.uuid4())
+                    data[CART_TOKEN_SESSION_KEY] = str(cart.token)
+            CartLine.objects.using(db_alias).bulk_create(
+                (CartLine(cart=cart, movie_id=movie_id, quantity=quantity)
+                 for movie_id, quantity in quantities.items()),
+                ignore_conflicts=True)
+        session.session_data = store.encode(data)
+        session.save(update_fields=['session_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0008_order_user_checkout_token'),
+        ('movies', '0013_movie_last_updated_date'),
+        ('sessions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(move_session_carts, migrations.RunPython.noop),
+    ]
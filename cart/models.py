@@ -35,6 +35,20 @@ class Order(models.Model):
         db_index=True
     )
     date = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Token rendered into the checkout form; a resubmitted form finds the
+    # order it already created instead of creating a duplicate. Tokens
+    # come from the client, so they are only unique per user.
+    checkout_token = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Order history pages through a user's orders newest first.
+            models.Index(fields=['user', '-date', '-id'], name='order_user_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'checkout_token'],
+                                    name='order_user_checkout_token'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.username}"
@@ -58,5 +72,98 @@ class Item(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Covering indexes for the co-purchase self-join
+            # (movies.recommendations): from a movie to its orders, and from
+            # an order to its movies.
+            models.Index(fields=['movie', 'order'], name='item_movie_order_idx'),
+            models.Index(fields=['order', 'movie'], name='item_order_movie_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.movie.name} (Order: {self.order.id})"
+
+
+class Cart(models.Model):
+    """
+    A shopping cart, owned by a user or, before login, by the anonymous
+    token stored in the visitor's session. Anonymous carts left untouched
+    for CART_ANONYMOUS_TTL seconds are removed by purge_anonymous_carts.
+    """
+    id = models.AutoField(primary_key=True)
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart',
+        null=True,
+        blank=True
+    )
+    token = models.UUIDField(unique=True, null=True, blank=True, editable=False)
+    created_date = models.DateTimeField(auto_now_add=True)
+    last_updated_date = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        owner = self.user.username if self.user_id else f"anonymous {self.token}"
+        return f"Cart #{self.id} of {owner}"
+
+
+class CartLine(models.Model):
+    """
+    One movie in a cart; quantity is updated in place.
+    """
+    id = models.AutoField(primary_key=True)
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='lines')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    quantity = models.PositiveSmallIntegerField(validators=[MinValueValidator(1)])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'movie'], name='cartline_unique_movie'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.movie.name} (Cart: {self.cart_id})"
+
+
+class DailyMovieSales(models.Model):
+    """
+    Units sold and revenue of one movie on one (local) day. Maintained by
+    cart.sales when an order is placed; rebuild_sales_rollups recomputes it.
+    """
+    id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='daily_sales')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily movie sales'
+        constraints = [
+            # Also the index the dashboard's date-range queries use.
+            models.UniqueConstraint(fields=['day', 'movie'], name='dailymoviesales_day_movie'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.units} of {self.movie_id}"
+
+
+class DailyGenreSales(models.Model):
+    """
+    Units sold and revenue of one genre on one (local) day, maintained
+    together with DailyMovieSales.
+    """
+    id = models.AutoField(primary_key=True)
+    day = models.DateField()
+    genre = models.CharField(max_length=20, choices=Movie.GENRE_CHOICES)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily genre sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'genre'], name='dailygenresales_day_genre'),
+        ]
+
     def __str__(self):
-        return f"{self.quantity} of {self.movie.name} (Order: {self.order.id})"
\ No newline at end of file
+        return f"{self.day}: {self.units} of {self.genre}"
@@ -0,0 +1,174 @@
+"""
+Daily sales rollups (DailyMovieSales, DailyGenreSales).
+
+place_order() calls record_order() in the transaction that creates the
+order, so the rollups are committed or rolled back together with it. An
+order costs one upsert statement per table, whatever its size, and the
+cost does not grow as sales accumulate.
+
+Changes made outside checkout (orders or items edited in the admin) are
+not tracked; rebuild() recomputes a date range from the Item table.
+
+The admin sales dashboard only reads these tables, and the (day, ...)
+unique constraints double as the indexes for its date-range queries.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyGenreSales, DailyMovieSales, Item
+
+
+UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+
+def _add_many(model, key_field, totals):
+    """
+    Add {key: [units, revenue]} to the rows of `model` for one day. On
+    SQLite and PostgreSQL this is a single INSERT ... ON CONFLICT DO UPDATE
+    run for all keys; other databases get an UPDATE (or INSERT) per key.
+    """
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor in UPSERT_VENDORS:
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        key_column = quote(model._meta.get_field(key_field).column)
+        day_column, units_column, revenue_column = map(quote, ('day', 'units', 'revenue'))
+        sql = (
+            f"INSERT INTO {table} ({day_column}, {key_column}, {units_column}, {revenue_column}) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT ({day_column}, {key_column}) DO UPDATE SET "
+            f"{units_column} = {table}.{units_column} + excluded.{units_column}, "
+            f"{revenue_column} = {table}.{revenue_column} + excluded.{revenue_column}"
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (connection.ops.adapt_datefield_value(day), key, units, revenue)
+                for (day, key), (units, revenue) in totals.items()
+            ])
+        return
+
+    for (day, key), (units, revenue) in totals.items():
+        lookup = {'day': day, key_field: key}
+        increment = {'units': F('units') + units, 'revenue': F('revenue') + revenue}
+        if model.objects.filter(**lookup).update(**increment):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, units=units, revenue=revenue)
+        except IntegrityError:
+            # Another checkout created the row first.
+            model.objects.filter(**lookup).update(**increment)
+
+
+def record_order(order, items):
+    """Add the items of a newly placed order to the rollups of its day."""
+    day = timezone.localdate(order.date)
+    by_movie = defaultdict(lambda: [0, 0])
+    by_genre = defaultdict(lambda: [0, 0])
+    for item in items:
+        # Item.price is an integer column; count what is actually stored.
+        revenue = int(item.price) * item.quantity
+        for totals in (by_movie[day, item.movie_id], by_genre[day, item.movie.genre]):
+            totals[0] += item.quantity
+            totals[1] += revenue
+    _add_many(DailyMovieSales, 'movie_id', by_movie)
+    _add_many(DailyGenreSales, 'genre', by_genre)
+
+
+def _day_bounds(start, end):
+    """Aware datetimes covering the local days [start, end]."""
+    bounds = {}
+    if start is not None:
+        bounds['order__date__gte'] = timezone.make_aware(
+            datetime.datetime.combine(start, datetime.time.min))
+    if end is not None:
+        bounds['order__date__lt'] = timezone.make_aware(
+            datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min))
+    return bounds
+
+
+def rebuild(start=None, end=None, batch_size=2000):
+    """
+    Recompute the rollups of the local days [start, end] (default: all)
+    from the Item table. Returns the number of (movie rows, genre rows).
+    """
+    days = {}
+    if start is not None:
+        days['day__gte'] = start
+    if end is not None:
+        days['day__lte'] = end
+    items = (Item.objects.filter(**_day_bounds(start, end))
+             .annotate(day=TruncDate('order__date', tzinfo=timezone.get_current_timezone()))
+             .order_by())
+
+    with transaction.atomic():
+        DailyMovieSales.objects.filter(**days).delete()
+        DailyGenreSales.objects.filter(**days).delete()
+        counts = []
+        for model, group, field in ((DailyMovieSales, 'movie_id', 'movie_id'),
+                                    (DailyGenreSales, 'movie__genre', 'genre')):
+            rows = (items.values('day', group)
+                    .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity')))
+                    .values_list('day', group, 'units', 'revenue'))
+            count = 0
+            batch = []
+            for day, key, units, revenue in rows.iterator(chunk_size=batch_size):
+                batch.append(model(day=day, **{field: key}, units=units, revenue=revenue))
+                if len(batch) >= batch_size:
+                    count += len(model.objects.bulk_create(batch))
+                    batch = []
+            count += len(model.objects.bulk_create(batch))
+            counts.append(count)
+    return tuple(counts)
+
+
+def dashboard(days=30, today=None, top=10):
+    """
+    Figures for the admin sales dashboard over the last `days` days,
+    computed from the rollup tables only (four queries in total).
+    """
+    end = today or timezone.localdate()
+    start = end - datetime.timedelta(days=days - 1)
+    week_start = end - datetime.timedelta(days=6)
+    genre_sales = DailyGenreSales.objects.filter(day__range=(start, end))
+    genre_labels = dict(DailyGenreSales._meta.get_field('genre').choices)
+
+    totals = genre_sales.aggregate(units=Sum('units'), revenue=Sum('revenue'))
+
+    by_genre = list(genre_sales.values('genre')
+                    .annotate(units=Sum('units'), revenue=Sum('revenue'))
+                    .order_by('-revenue', 'genre'))
+    for row in by_genre:
+        row['label'] = genre_labels.get(row['genre'], row['genre'])
+
+    # Revenue per day and genre, pivoted into one row per day.
+    columns = [row['genre'] for row in by_genre]
+    daily = {}
+    for day, genre, revenue in genre_sales.order_by('day').values_list('day', 'genre', 'revenue'):
+        daily.setdefault(day, dict.fromkeys(columns, 0))[genre] = revenue
+    daily_rows = [{'day': day, 'revenues': [revenues[genre] for genre in columns],
+                   'total': sum(revenues.values())}
+                  for day, revenues in sorted(daily.items(), reverse=True)]
+
+    top_movies = list(DailyMovieSales.objects.filter(day__range=(week_start, end))
+                      .values('movie_id', 'movie__name')
+                      .annotate(units=Sum('units'), revenue=Sum('revenue'))
+                      .order_by('-revenue', 'movie_id')[:top])
+
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'units': totals['units'] or 0,
+        'revenue': totals['revenue'] or 0,
+        'by_genre': by_genre,
+        'genre_columns': [row['label'] for row in by_genre],
+        'daily': daily_rows,
+        'week_start': week_start,
+        'top_movies': top_movies,
+    }
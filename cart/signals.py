@@ -0,0 +1,11 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .utils import merge_anonymous_cart
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry what a visitor put in the cart before logging in over to their account."""
+    if request is not None:
+        merge_anonymous_cart(request, user)
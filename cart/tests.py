@@ -1,3 +1,358 @@
+import csv
+import datetime
+import io
+import uuid
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+
+from movies.models import Movie
+from . import exports, sales
+from .utils import place_order, purge_anonymous_carts
+from .models import Cart, CartLine, DailyGenreSales, DailyMovieSales, Item, Order
+
+
+class PurchaseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10, description='A movie.',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        for movie in self.movies:
+            self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': '2'})
+
+    def purchase(self, token):
+        return self.client.post(reverse('cart.purchase'), {'checkout_token': str(token)})
+
+    def test_purchase_creates_order_and_items(self):
+        response = self.purchase(uuid.uuid4())
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get()
+        self.assertEqual(order.total, 60)
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(CartLine.objects.exists())
+
+    def test_items_are_written_in_one_insert(self):
+        item_table = connection.ops.quote_name(Item._meta.db_table)
+        with CaptureQueriesContext(connection) as queries:
+            self.purchase(uuid.uuid4())
+        inserts = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith(f'INSERT INTO {item_table}')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Item.objects.count(), 3)
+
+    def test_token_reused_by_another_user_places_their_own_order(self):
+        token = uuid.uuid4()
+        self.purchase(token)
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(other)
+        self.client.post(reverse('cart.add', args=[self.movies[0].id]), {'quantity': '1'})
+        response = self.purchase(token)
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(user=other)
+        self.assertEqual(response.context['template_data']['order_id'], order.id)
+        self.assertEqual(order.total, 10)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_place_order_reraises_unrelated_integrity_errors(self):
+        lines = list(CartLine.objects.select_related('movie'))
+        with mock.patch.object(Item.objects, 'bulk_create', side_effect=IntegrityError('boom')):
+            with self.assertRaises(IntegrityError):
+                place_order(self.user, uuid.uuid4(), lines)
+        self.assertFalse(Order.objects.exists())
+
+    def test_double_submit_creates_one_order(self):
+        token = uuid.uuid4()
+        first = self.purchase(token)
+        second = self.purchase(token)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Item.objects.count(), 3)
+        self.assertEqual(first.context['template_data']['order_id'],
+                         second.context['template_data']['order_id'])
+
+    def test_rejects_invalid_quantity(self):
+        CartLine.objects.filter(movie=self.movies[0]).update(quantity=50)
+        response = self.purchase(uuid.uuid4())
+        self.assertRedirects(response, reverse('cart.index'))
+        self.assertFalse(Order.objects.exists())
+
+    def test_get_does_not_purchase(self):
+        response = self.client.get(reverse('cart.purchase'))
+        self.assertRedirects(response, reverse('cart.index'))
+        self.assertFalse(Order.objects.exists())
+
+
+class CartTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10, description='A movie.',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(3)
+        ]
+
+    def add(self, movie, quantity):
+        return self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': str(quantity)})
+
+    def test_add_updates_line_in_place(self):
+        self.add(self.movies[0], 1)
+        self.add(self.movies[0], 3)
+        line = CartLine.objects.get()
+        self.assertEqual(line.quantity, 3)
+
+    def test_cart_page_reads_lines_in_one_query(self):
+        self.client.force_login(self.user)
+        for movie in self.movies:
+            self.add(movie, 2)
+        # session + user, cart lines joined with cart and movies
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('cart.index'))
+        self.assertEqual(response.context['template_data']['cart_total'], 60)
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        Cart.objects.create(user=self.user).lines.create(movie=self.movies[0], quantity=1)
+        self.add(self.movies[0], 4)
+        self.add(self.movies[1], 2)
+        self.client.post(reverse('accounts.login'), {'username': 'buyer', 'password': 'secret'})
+
+        cart = Cart.objects.get()
+        self.assertEqual(cart.user, self.user)
+        self.assertEqual(dict(cart.lines.values_list('movie_id', 'quantity')),
+                         {self.movies[0].id: 4, self.movies[1].id: 2})
+
+
+class AnonymousCartLifetimeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='secret')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10, description='A movie.',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(3)
+        ]
+
+    def age(self, cart, days):
+        Cart.objects.filter(pk=cart.pk).update(
+            last_updated_date=timezone.now() - datetime.timedelta(days=days))
+
+    def test_purge_deletes_only_stale_anonymous_carts(self):
+        stale = Cart.objects.create(token=uuid.uuid4())
+        stale.lines.create(movie=self.movies[0], quantity=1)
+        recent = Cart.objects.create(token=uuid.uuid4())
+        owned = Cart.objects.create(user=self.user)
+        self.age(stale, 15)
+        self.age(recent, 13)
+        self.age(owned, 90)
+
+        out = io.StringIO()
+        call_command('purge_anonymous_carts', stdout=out)
+        self.assertIn('Deleted 1 anonymous carts', out.getvalue())
+        self.assertEqual(set(Cart.objects.all()), {recent, owned})
+        self.assertFalse(CartLine.objects.filter(cart_id=stale.id).exists())
+
+    def test_adding_to_a_cart_keeps_it_alive(self):
+        self.client.post(reverse('cart.add', args=[self.movies[0].id]), {'quantity': '1'})
+        cart = Cart.objects.get()
+        self.age(cart, 15)
+        self.client.post(reverse('cart.add', args=[self.movies[1].id]), {'quantity': '1'})
+        self.assertEqual(purge_anonymous_carts(), 0)
+        self.assertEqual(cart.lines.count(), 2)
+
+    def test_migration_moves_session_carts_into_the_tables(self):
+        move_session_carts = import_module('cart.migrations.0009_move_session_carts').move_session_carts
+        anonymous = SessionStore()
+        anonymous['cart'] = {str(self.movies[0].id): '2', str(self.movies[1].id): '50',
+                             '999999': '1', 'x': 'y'}
+        anonymous.create()
+        logged_in = SessionStore()
+        logged_in.update({'_auth_user_id': str(self.user.pk), 'cart': {str(self.movies[2].id): '1'}})
+        logged_in.create()
+        Cart.objects.create(user=self.user).lines.create(movie=self.movies[2], quantity=3)
+
+        move_session_carts(apps, mock.Mock(connection=connection))
+
+        data = SessionStore(anonymous.session_key).load()
+        self.assertNotIn('cart', data)
+        cart = Cart.objects.get(token=data['cart_token'])
+        # Unknown movies are dropped and quantities capped at CART_MAX_QUANTITY.
+        self.assertEqual(dict(cart.lines.values_list('movie_id', 'quantity')),
+                         {self.movies[0].id: 2, self.movies[1].id: 10})
+        self.client.cookies['sessionid'] = anonymous.session_key
+        response = self.client.get(reverse('cart.index'))
+        self.assertEqual(response.context['template_data']['cart_total'], 120)
+
+        self.assertNotIn('cart', SessionStore(logged_in.session_key).load())
+        # The line already in the user's cart wins.
+        self.assertEqual(dict(self.user.cart.lines.values_list('movie_id', 'quantity')),
+                         {self.movies[2].id: 3})
+
+
+class OrderExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('finance', password='secret')
+        buyer = User.objects.create_user('=buyer')
+        movies = [Movie.objects.create(name=f'Movie {n}', price=5, description='A movie.',
+                                       image_url=f'https://example.com/{n}.jpg')
+                  for n in range(2)]
+        cls.orders = []
+        for days_ago in (10, 3, 1):
+            order = Order.objects.create(user=buyer, total=25)
+            Order.objects.filter(pk=order.pk).update(
+                date=timezone.now() - datetime.timedelta(days=days_ago))
+            Item.objects.create(order=order, movie=movies[0], price=5, quantity=3)
+            Item.objects.create(order=order, movie=movies[1], price=5, quantity=2)
+            cls.orders.append(order)
+
+    def export(self, *args):
+        out = io.StringIO()
+        call_command('export_orders', *args, stdout=out)
+        return list(csv.reader(io.StringIO(out.getvalue())))
+
+    def test_command_writes_one_row_per_item(self):
+        rows = self.export()
+        self.assertEqual(rows[0][:3], ['order_id', 'order_date', 'user_id'])
+        self.assertEqual(len(rows), 7)
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['order_id'], str(self.orders[0].id))
+        self.assertEqual(first['movie_name'], 'Movie 0')
+        self.assertEqual(first['line_total'], '15')
+        # Cells that spreadsheets would run as formulas are escaped.
+        self.assertEqual(first['username'], "'=buyer")
+
+    def test_command_filters_by_order_date(self):
+        start = timezone.localdate() - datetime.timedelta(days=5)
+        # One query turns the dates into an order id range, one streams the rows.
+        with self.assertNumQueries(2):
+            rows = self.export('--start', start.isoformat())
+        self.assertEqual({row[0] for row in rows[1:]},
+                         {str(self.orders[1].id), str(self.orders[2].id)})
+        self.assertEqual(self.export('--end', '2000-01-01'), [list(exports.HEADER)])
+
+    def test_admin_action_streams_selected_orders(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:cart_order_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.orders[0].pk, self.orders[2].pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({row[0] for row in rows[1:]},
+                         {str(self.orders[0].id), str(self.orders[2].id)})
+
+
+class OrderAdminChangelistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('finance', password='secret')
+        cls.movies = [Movie.objects.create(name=f'Movie {n}', price=5, description='A movie.',
+                                           image_url=f'https://example.com/{n}.jpg')
+                      for n in range(3)]
+        cls.add_orders(3)
+
+    @classmethod
+    def add_orders(cls, count):
+        for _ in range(count):
+            buyer = User.objects.create_user(f'buyer{User.objects.count()}')
+            order = Order.objects.create(user=buyer, total=20)
+            for movie in cls.movies:
+                Item.objects.create(order=order, movie=movie, price=5, quantity=2)
+
+    def test_changelist_query_count_does_not_grow_with_orders(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:cart_order_changelist')
+        # Columns 3 and 4 sort by the annotated total and item count.
+        orderings = [{}, {'o': '3'}, {'o': '-4'}]
+        # session + user, two counts (filtered and total), orders with
+        # their annotated totals and users, items with movies, and the
+        # date hierarchy's range and days
+        for params in orderings:
+            with self.assertNumQueries(8):
+                response = self.client.get(url, params)
+            self.assertEqual(len(response.context['cl'].result_list), 3)
+
+        self.add_orders(6)
+        for params in orderings:
+            with self.assertNumQueries(8):
+                response = self.client.get(url, params)
+            self.assertContains(response, 'Movie 2 (Qty: 2)', count=9)
+        totals = [order._total_amount for order in response.context['cl'].result_list]
+        self.assertEqual(totals, [30] * 9)
+
+
+class SalesRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('finance', password='secret')
+        cls.buyer = User.objects.create_user('buyer', password='secret')
+        cls.action = Movie.objects.create(name='Heat', price=8, genre='ACTION', description='',
+                                          image_url='https://example.com/heat.jpg')
+        cls.comedy = Movie.objects.create(name='Airplane', price=5, genre='COMEDY', description='',
+                                          image_url='https://example.com/airplane.jpg')
+
+    def buy(self, *quantities):
+        self.client.force_login(self.buyer)
+        for movie, quantity in zip((self.action, self.comedy), quantities):
+            self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': str(quantity)})
+        self.client.post(reverse('cart.purchase'), {'checkout_token': str(uuid.uuid4())})
+
+    def rollups(self):
+        return (
+            sorted(DailyMovieSales.objects.values_list('day', 'movie_id', 'units', 'revenue')),
+            sorted(DailyGenreSales.objects.values_list('day', 'genre', 'units', 'revenue')),
+        )
+
+    def test_purchases_update_the_rollups(self):
+        self.buy(2, 1)
+        self.buy(1, 0)
+        today = timezone.localdate()
+        movie_rows, genre_rows = self.rollups()
+        self.assertEqual(movie_rows, sorted([(today, self.action.id, 3, 24),
+                                             (today, self.comedy.id, 1, 5)]))
+        self.assertEqual(genre_rows, [(today, 'ACTION', 3, 24), (today, 'COMEDY', 1, 5)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.buy(2, 3)
+        self.buy(1, 1)
+        incremental = self.rollups()
+        DailyGenreSales.objects.update(units=0)
+        self.assertEqual(sales.rebuild(), (2, 2))
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_dashboard_reads_only_the_rollups(self):
+        self.buy(2, 1)
+        self.client.force_login(self.admin)
+        url = reverse('admin:cart_order_sales_dashboard')
+        response = self.client.get(url, {'days': 7})
+        self.assertContains(response, 'Heat')
+        self.assertContains(response, '<strong>$21</strong> revenue')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if 'cart_item' in q['sql']])
 
-# Create your tests here.
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(url).status_code, 302)
@@ -1,6 +1,175 @@
-def calculate_cart_total(cart, movies_in_cart):
+import datetime
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Cart, CartLine, Order, Item
+from .sales import record_order
+
+# Session key holding the token of an anonymous visitor's cart.
+CART_TOKEN_SESSION_KEY = 'cart_token'
+
+
+def _cart_lookup(request):
+    """
+    Return the filter kwargs identifying the request's cart, or None if an
+    anonymous visitor has no cart yet.
+    """
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    token = request.session.get(CART_TOKEN_SESSION_KEY)
+    if token is None:
+        return None
+    return {'token': token}
+
+
+def get_cart(request, create=False):
+    """
+    Return the Cart of the current user (or anonymous visitor). With
+    `create`, a missing cart is created; otherwise None is returned.
+    """
+    lookup = _cart_lookup(request)
+    if lookup is not None:
+        cart = Cart.objects.filter(**lookup).first()
+        if cart is not None or not create:
+            return cart
+    elif not create:
+        return None
+
+    if request.user.is_authenticated:
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        return cart
+    cart = Cart.objects.create(token=uuid.uuid4())
+    # The session is written once, when the anonymous cart is created.
+    request.session[CART_TOKEN_SESSION_KEY] = str(cart.token)
+    return cart
+
+
+def cart_lines(request):
+    """
+    Return a queryset of the lines of the current cart, in the order they
+    were added (the cart is matched through its user or token in a JOIN).
+    """
+    lookup = _cart_lookup(request)
+    if lookup is None:
+        return CartLine.objects.none()
+    lookup = {f'cart__{field}': value for field, value in lookup.items()}
+    return CartLine.objects.filter(**lookup).order_by('id')
+
+
+def get_cart_lines(request):
+    """
+    Return the lines of the current cart with their movies, in one indexed
+    query.
+    """
+    if _cart_lookup(request) is None:
+        return []
+    return list(cart_lines(request).select_related('movie'))
+
+
+def set_cart_quantity(cart, movie, quantity):
+    """Insert or update a single cart line, and mark the cart as in use."""
+    CartLine.objects.update_or_create(cart=cart, movie=movie, defaults={'quantity': quantity})
+    # Keeps an anonymous cart from being purged while it is being filled.
+    Cart.objects.filter(pk=cart.pk).update(last_updated_date=timezone.now())
+
+
+def clear_cart(request):
+    lookup = _cart_lookup(request)
+    if lookup is None:
+        return
+    lookup = {f'cart__{field}': value for field, value in lookup.items()}
+    CartLine.objects.filter(**lookup).delete()
+
+
+def merge_anonymous_cart(request, user):
+    """
+    Move the lines of the visitor's anonymous cart into `user`'s cart.
+    Quantities chosen anonymously replace those already in the user's cart.
+    """
+    token = request.session.pop(CART_TOKEN_SESSION_KEY, None)
+    if token is None:
+        return
+    with transaction.atomic():
+        anonymous_cart = Cart.objects.filter(token=token, user__isnull=True).first()
+        if anonymous_cart is None:
+            return
+        user_cart, _ = Cart.objects.get_or_create(user=user)
+        movie_ids = anonymous_cart.lines.values('movie_id')
+        user_cart.lines.filter(movie_id__in=movie_ids).delete()
+        anonymous_cart.lines.update(cart=user_cart)
+        anonymous_cart.delete()
+
+
+def purge_anonymous_carts(now=None):
+    """
+    Delete anonymous carts (and their lines) not changed in the last
+    CART_ANONYMOUS_TTL seconds; their sessions have expired by then.
+    Returns the number of carts deleted.
+    """
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(seconds=settings.CART_ANONYMOUS_TTL)
+    stale = Cart.objects.filter(user__isnull=True, last_updated_date__lt=cutoff)
+    return stale.delete()[1].get(Cart._meta.label, 0)
+
+
+def calculate_cart_total(cart_lines):
     total = 0
-    for movie in movies_in_cart:
-        quantity = cart[str(movie.id)]
-        total += movie.price * int(quantity)
-    return total
\ No newline at end of file
+    for line in cart_lines:
+        total += line.movie.price * line.quantity
+    return total
+
+
+def parse_quantity(value):
+    """
+    Return `value` as a quantity between 1 and CART_MAX_QUANTITY,
+    or None if it is not one.
+    """
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    if 1 <= quantity <= settings.CART_MAX_QUANTITY:
+        return quantity
+    return None
+
+
+def parse_checkout_token(value):
+    """Return the checkout token posted by the cart form as a UUID, or None."""
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def place_order(user, checkout_token, cart_lines):
+    """
+    Create an order and all of its items as one atomic unit.
+
+    `cart_lines` are CartLine objects with validated quantities. Items are
+    written with a single bulk INSERT and the purchased lines are removed
+    from the cart in the same transaction, which also adds the sale to the
+    daily rollups (cart.sales). If a concurrent request of the same user
+    already created an order with the same checkout token, that order is
+    returned instead and nothing is written. Returns (order, created).
+    """
+    total = calculate_cart_total(cart_lines)
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(user=user, total=total, checkout_token=checkout_token)
+            items = Item.objects.bulk_create([
+                Item(order=order, movie=line.movie, price=line.movie.price, quantity=line.quantity)
+                for line in cart_lines
+            ])
+            record_order(order, items)
+            CartLine.objects.filter(id__in=[line.id for line in cart_lines]).delete()
+    except IntegrityError:
+        # A concurrent submit with the same token won the race; any other
+        # integrity error is not ours to hide.
+        order = Order.objects.filter(checkout_token=checkout_token, user=user).first()
+        if order is None:
+            raise
+        return order, False
+    return order, True
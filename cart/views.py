@@ -1,57 +1,51 @@
 from django.shortcuts import render
 from django.shortcuts import get_object_or_404, redirect
 from movies.models import Movie
-from .utils import calculate_cart_total
-from .models import Order, Item
+import uuid
+from .utils import (calculate_cart_total, clear_cart, get_cart, get_cart_lines,
+                    parse_checkout_token, parse_quantity, place_order, set_cart_quantity)
+from .models import Order
 from django.contrib.auth.decorators import login_required
 
 def index(request):
-    cart_total = 0
-    movies_in_cart = []
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
-    if (movie_ids != []):
-        movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-        cart_total = calculate_cart_total(cart, movies_in_cart)
-
-    template_data = {'title': 'Cart', 'movies_in_cart': movies_in_cart, 'cart_total': cart_total}
+    cart_lines = get_cart_lines(request)
+    cart_total = calculate_cart_total(cart_lines)
+
+    template_data = {'title': 'Cart', 'cart_lines': cart_lines, 'cart_total': cart_total,
+                     'checkout_token': uuid.uuid4()}
     return render(request, 'cart/index.html',{'template_data': template_data})
 
 def add_to_cart(request, id):
-    get_object_or_404(Movie, id=id)
-    cart = request.session.get('cart', {})
-    cart[id] = request.POST['quantity']
-    request.session['cart'] = cart
+    movie = get_object_or_404(Movie, id=id)
+    quantity = parse_quantity(request.POST.get('quantity'))
+    if quantity is None:
+        return redirect('movies.show', id=id)
+    set_cart_quantity(get_cart(request, create=True), movie, quantity)
     return redirect('cart.index') #CHRIS: maybe change to home.index
 
 def clear(request):
-    request.session['cart'] = {}
+    clear_cart(request)
     return redirect('cart.index')
 
 @login_required
 def purchase(request):
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
-    if movie_ids == []:
+    if request.method != 'POST':
         return redirect('cart.index')
 
-    movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-    cart_total = calculate_cart_total(cart, movies_in_cart)
-
-    order = Order()
-    order.user = request.user
-    order.total = cart_total
-    order.save()
+    checkout_token = parse_checkout_token(request.POST.get('checkout_token'))
+    if checkout_token is None:
+        return redirect('cart.index')
 
-    for movie in movies_in_cart:
-        item = Item()
-        item.movie = movie
-        item.price = movie.price
-        item.order = order
-        item.quantity = cart[str(movie.id)]
-        item.save()
+    # A double submit finds the order the first submit created, even
+    # though that submit already emptied the cart.
+    order = Order.objects.filter(checkout_token=checkout_token, user=request.user).first()
+    if order is None:
+        cart_lines = get_cart_lines(request)
+        if cart_lines == []:
+            return redirect('cart.index')
+        if any(parse_quantity(line.quantity) is None for line in cart_lines):
+            return redirect('cart.index')
+        order, _ = place_order(request.user, checkout_token, cart_lines)
 
-    request.session['cart'] = {}
     template_data = {'title': 'Purchase confirmation', 'order_id': order.id}
     return render(request, 'cart/purchase.html', {'template_data': template_data})
-
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        # Register the signal handlers that keep the featured pool fresh.
+        from . import signals  # noqa: F401
@@ -0,0 +1,80 @@
+"""
+Featured-movie sampler for the home page.
+
+The IDs of every movie eligible for the featured grid (it has an uploaded
+image or an image URL) are kept in an in-process pool, so picking random
+movies is O(1) and only the chosen rows are fetched, by primary key.
+The pool is reloaded when it is older than FEATURED_POOL_TTL seconds or
+when a Movie is saved or deleted. Invalidation bumps a version number in
+the default cache. Other worker processes only notice it if that cache is
+shared between them (FileBasedCache, Redis, Memcached). With the default
+per-process LocMemCache, a change made in one worker reaches the others
+after at most FEATURED_POOL_TTL seconds; a movie deleted meanwhile is
+skipped when sampling.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from movies.models import Movie
+
+POOL_VERSION_KEY = 'home:featured_pool_version'
+
+_lock = threading.Lock()
+_pool = {'version': None, 'loaded_at': 0.0, 'ids': []}
+
+
+def eligible_movies():
+    """Movies that can be shown in the featured grid."""
+    # An unset image is stored as '' rather than NULL.
+    has_image = Q(image__isnull=False) & ~Q(image='')
+    has_image_url = Q(image_url__isnull=False) & ~Q(image_url='')
+    return Movie.objects.filter(has_image | has_image_url)
+
+
+def _current_version():
+    # If the key was evicted, a new value makes every pool stale.
+    return cache.get_or_set(POOL_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def get_pool():
+    """Return the list of eligible movie IDs, reloading it if it is stale."""
+    version = _current_version()
+    now = time.monotonic()
+    ttl = settings.FEATURED_POOL_TTL
+    with _lock:
+        if _pool['version'] == version and now - _pool['loaded_at'] < ttl:
+            return _pool['ids']
+    ids = list(eligible_movies().values_list('id', flat=True))
+    with _lock:
+        _pool.update(version=version, loaded_at=now, ids=ids)
+    return ids
+
+
+def invalidate_pool():
+    """
+    Make this process, and every process sharing the cache, reload the
+    pool on its next request.
+    """
+    try:
+        cache.incr(POOL_VERSION_KEY)
+    except ValueError:
+        # The key expired or was never set; any fresh value is a new version.
+        cache.set(POOL_VERSION_KEY, time.time_ns(), timeout=None)
+    with _lock:
+        _pool['version'] = None
+
+
+def sample_featured(count=3):
+    """Return up to `count` random eligible movies in a single query."""
+    ids = get_pool()
+    chosen = random.sample(ids, min(count, len(ids)))
+    if not chosen:
+        return []
+    movies = Movie.objects.in_bulk(chosen)
+    # A movie deleted since the pool was loaded is simply skipped.
+    return [movies[movie_id] for movie_id in chosen if movie_id in movies]
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from movies.models import Movie
+from .featured import invalidate_pool
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def refresh_featured_pool(sender, **kwargs):
+    """A movie was added, changed or removed: the featured pool is stale."""
+    invalidate_pool()
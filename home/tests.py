@@ -1,3 +1,98 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from movies.models import Movie, UserRecommendation
+from . import featured
+
+
+class HomeRecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10, description='-',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(4)]
+
+    def test_logged_in_user_sees_precomputed_recommendations(self):
+        UserRecommendation.objects.bulk_create(
+            UserRecommendation(user=self.user, movie=movie, rank=rank, score=1.0 - rank / 10)
+            for rank, movie in enumerate(reversed(self.movies)))
+        self.client.force_login(self.user)
+        # session + user, recommendations joined with their movies
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('home.index'))
+        self.assertContains(response, 'Recommended for You')
+        self.assertEqual(response.context['template_data']['recommended_movies'],
+                         list(reversed(self.movies)))
+
+    def test_users_without_recommendations_see_featured_movies(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home.index'))
+        self.assertContains(response, 'Featured Movies')
+        self.assertEqual(len(response.context['template_data']['featured_movies']), 3)
+
+        self.client.logout()
+        response = self.client.get(reverse('home.index'))
+        self.assertContains(response, 'Featured Movies')
+
+
+class FeaturedPoolTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {n}', price=10, description='-',
+                                 image_url=f'https://example.com/{n}.jpg')
+            for n in range(4)]
+        # Created without clean(): no image of either kind.
+        cls.imageless = Movie.objects.create(name='Blank', price=10, description='-')
+
+    def setUp(self):
+        cache.clear()
+        featured.invalidate_pool()
+
+    def test_samples_distinct_eligible_movies(self):
+        self.assertCountEqual(featured.get_pool(), [movie.id for movie in self.movies])
+        # The pool is loaded; only the chosen rows are read.
+        with self.assertNumQueries(1):
+            sample = featured.sample_featured(3)
+        self.assertEqual(len(sample), 3)
+        self.assertEqual(len(set(sample)), 3)
+        self.assertTrue(set(sample) <= set(self.movies))
+        self.assertCountEqual(featured.sample_featured(10), self.movies)
+
+    def test_pool_is_reloaded_after_the_ttl(self):
+        featured.get_pool()
+        with self.assertNumQueries(0):
+            featured.get_pool()
+        with self.settings(FEATURED_POOL_TTL=0), self.assertNumQueries(1):
+            featured.get_pool()
+
+    def test_movie_save_and_delete_invalidate_the_pool(self):
+        featured.get_pool()
+        added = Movie.objects.create(name='New', price=10, description='-',
+                                     image_url='https://example.com/new.jpg')
+        self.assertIn(added.id, featured.get_pool())
+
+        self.movies[0].delete()
+        self.assertNotIn(self.movies[0].id, featured.get_pool())
+
+        # Another process shares the version through the cache.
+        pool = featured.get_pool()
+        cache.incr(featured.POOL_VERSION_KEY)
+        with self.assertNumQueries(1):
+            self.assertEqual(featured.get_pool(), pool)
 
-# Create your tests here.
+    def test_deleted_movie_is_skipped_until_the_pool_reloads(self):
+        featured.get_pool()
+        # As if deleted by a worker that does not share this cache.
+        with mock.patch('home.signals.invalidate_pool'):
+            Movie.objects.filter(pk__in=[movie.pk for movie in self.movies[1:]]).delete()
+        self.assertEqual(len(featured.get_pool()), 4)
+        self.assertEqual(featured.sample_featured(4), [self.movies[0]])
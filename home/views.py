@@ -1,20 +1,25 @@
 from django.shortcuts import render
-from movies.models import Movie
-from django.db.models import Q
+from .featured import sample_featured
+from movies.recommendations import for_user
+from moviesstore.page_cache import cache_catalog_page
 
 
 def index(request):
-    # Select 3 random movies that have either an uploaded image or an image URL.
-    featured_movies = Movie.objects.filter(
-        Q(image__isnull=False) | Q(image_url__isnull=False)
-    ).order_by('?')[:3]
+    # Logged-in users see the movies precomputed for them from their
+    # reviews (movies.recommendations); everyone else, and users without
+    # recommendations yet, see 3 random movies that have either an uploaded
+    # image or an image URL. The sampler picks from a cached pool of IDs
+    # instead of ORDER BY RANDOM().
+    recommended_movies = for_user(request.user) if request.user.is_authenticated else []
 
     template_data = {
         'title': 'Movies Store',
-        'featured_movies': featured_movies,
+        'recommended_movies': recommended_movies,
+        'featured_movies': [] if recommended_movies else sample_featured(3),
     }
     return render(request, 'home/index.html', {'template_data': template_data})
 
+@cache_catalog_page
 def about(request):
     template_data = {}
     template_data['title'] = 'About'
@@ -0,0 +1,192 @@
+"""
+Typeahead suggestions for the catalog search box.
+
+Every process keeps an in-memory index of the movie names: a sorted list
+of search keys searched with bisect, so suggestions never touch the
+database. A movie has one key per word of its name, running from that word
+to the end ("the dark knight", "dark knight", "knight"), so typing "dark"
+finds "The Dark Knight". Keys are case- and accent-folded and cut to
+KEY_LENGTH characters.
+
+Matches are ranked by whether the name itself starts with the prefix,
+then by number of reviews, then by name. The last AUTOCOMPLETE_CACHE_SIZE
+prefixes looked up are remembered, so the broad one- and two-letter
+prefixes are only ranked once.
+
+Saving or deleting a Movie bumps a version number in the cache (see
+movies/signals.py), which every process sharing that cache notices. The
+next lookup starts a reload in a background thread and keeps answering
+from the old index until the reload is done. A process builds its first
+index the same way and has no suggestions until then, so no lookup ever
+waits for the database. Review counts used for ranking are refreshed
+whenever the index is reloaded.
+"""
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Movie
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_KEY = 'movies:autocomplete_version'
+KEY_LENGTH = 40
+# Sorts after every key starting with a given prefix.
+_KEY_END = '\U0010ffff'
+
+_WORD_RE = re.compile(r'\w+')
+# Every word of a normalized name but the first.
+_WORD_START_RE = re.compile(r'(?<= )\w')
+
+_lock = threading.Lock()
+_state = {'index': None, 'rebuilding': False}
+
+
+def normalize(text):
+    """Case- and accent-folded words of `text`, separated by single spaces."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(_WORD_RE.findall(text))
+
+
+class PrefixIndex:
+    """Sorted search keys of a snapshot of the catalog, with an LRU of lookups."""
+
+    def __init__(self, movies, version, cache_size):
+        self.version = version
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        keys = []
+        ranks = []
+        for movie_id, name, review_count in movies:
+            folded = normalize(name)
+            # Compared as a whole: name starts with the prefix, most
+            # reviewed, name, id. Shared by all keys of the movie.
+            first = (False, -review_count, folded, movie_id, name)
+            rest = (True,) + first[1:]
+            keys.append(folded[:KEY_LENGTH])
+            ranks.append(first)
+            for match in _WORD_START_RE.finditer(folded):
+                keys.append(folded[match.start():match.start() + KEY_LENGTH])
+                ranks.append(rest)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[i] for i in order]
+        self.ranks = [ranks[i] for i in order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, prefix, limit):
+        """Return up to `limit` (id, name) pairs matching a normalized prefix."""
+        cache_key = (prefix, limit)
+        with self._cache_lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+
+        low = bisect.bisect_left(self.keys, prefix)
+        high = bisect.bisect_left(self.keys, prefix + _KEY_END, low)
+        # A movie can match through several of its words; take a few extra
+        # candidates so that dropping duplicates still leaves `limit`.
+        candidates = heapq.nsmallest(limit * 2, self.ranks[low:high])
+        results = []
+        seen = set()
+        for _, _, _, movie_id, name in candidates:
+            if movie_id not in seen:
+                seen.add(movie_id)
+                results.append((movie_id, name))
+        if len(results) < limit and len(candidates) < high - low:
+            results = []
+            seen = set()
+            for _, _, _, movie_id, name in sorted(self.ranks[low:high]):
+                if movie_id not in seen:
+                    seen.add(movie_id)
+                    results.append((movie_id, name))
+        results = results[:limit]
+
+        with self._cache_lock:
+            self._cache[cache_key] = results
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+
+def _current_version():
+    # If the key was evicted, a new value makes every index stale.
+    return cache.get_or_set(INDEX_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def build(version=None):
+    """Load the catalog into a new PrefixIndex and make it the current one."""
+    version = _current_version() if version is None else version
+    start = time.perf_counter()
+    movies = Movie.objects.order_by().values_list('id', 'name', 'review_count')
+    index = PrefixIndex(movies.iterator(chunk_size=5000), version,
+                        settings.AUTOCOMPLETE_CACHE_SIZE)
+    with _lock:
+        _state['index'] = index
+    logger.info('Autocomplete index built: %d keys in %.2fs',
+                len(index), time.perf_counter() - start)
+    return index
+
+
+def _rebuild_in_background(version):
+    try:
+        build(version)
+    except Exception:
+        logger.exception('Could not rebuild the autocomplete index')
+    finally:
+        with _lock:
+            _state['rebuilding'] = False
+        # This thread's database connection is not reused by a request.
+        connections.close_all()
+
+
+def _schedule_rebuild(version):
+    threading.Thread(target=_rebuild_in_background, args=(version,),
+                     name='autocomplete-rebuild', daemon=True).start()
+
+
+def get_index():
+    """
+    The current index (None before the first one is built), starting a
+    reload in the background if the catalog has changed.
+    """
+    version = _current_version()
+    with _lock:
+        index = _state['index']
+        if (index is not None and index.version == version) or _state['rebuilding']:
+            return index
+        _state['rebuilding'] = True
+    _schedule_rebuild(version)
+    return index
+
+
+def invalidate():
+    """Make every process reload its index on its next lookup."""
+    try:
+        cache.incr(INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(INDEX_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def suggest(term, limit=None):
+    """Up to `limit` movies whose name, or a word in it, starts with `term`."""
+    prefix = normalize(term)[:KEY_LENGTH]
+    if not prefix:
+        return []
+    index = get_index()
+    if index is None:
+        return []
+    limit = limit or settings.AUTOCOMPLETE_RESULTS
+    return [{'id': movie_id, 'name': name} for movie_id, name in index.lookup(prefix, limit)]
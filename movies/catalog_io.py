@@ -0,0 +1,230 @@
+"""
+Bulk import and export of the movie catalog as CSV or JSON Lines.
+
+Rows are streamed: files are read and written one row at a time and the
+database is touched once per batch, so memory use does not grow with the
+size of the file. Each imported row is validated like the admin would
+(known genre, a valid price, exactly one of image and image_url, see
+Movie.clean) and upserted by a natural key: the movie name by default, or
+the id. A batch costs one SELECT for the existing movies, one bulk_create,
+one bulk_update and one refresh of the search index.
+
+bulk_create and bulk_update skip model signals, so the search index, the
+catalog page cache, the featured pool and the autocomplete index are
+refreshed here instead. When an import replaces a movie's uploaded image,
+its renditions are dropped and their files deleted. No renditions are
+generated for imported images: pages show the original file until
+generate_image_renditions is run.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import router, transaction
+from django.utils import timezone
+
+from home.featured import invalidate_pool
+from moviesstore import page_cache
+
+from . import autocomplete, images, search
+from .models import MAX_PRICE, Movie
+
+FIELDS = ('id', 'name', 'price', 'description', 'genre', 'image', 'image_url')
+UPDATE_FIELDS = ('name', 'price', 'description', 'genre', 'image', 'image_url')
+KEYS = ('name', 'id')
+FORMATS = ('csv', 'jsonl')
+
+# Genres may be given by code ('SCIFI') or label ('Sci-Fi'), in any case.
+GENRES = {}
+for _code, _label in Movie.GENRE_CHOICES:
+    GENRES[_code.lower()] = _code
+    GENRES[_label.lower()] = _code
+DEFAULT_GENRE = Movie._meta.get_field('genre').default
+
+_validate_url = URLValidator()
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(path):
+    return 'jsonl' if str(path).lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(file, file_format):
+    """Yield (line number, dict) for every row of an open text file."""
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, RowError(f'invalid JSON: {error}')
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError('not a JSON object')
+
+
+def _text(row, field):
+    value = row.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def clean_row(row):
+    """Validate one input row; return the Movie field values or raise RowError."""
+    if isinstance(row, RowError):
+        raise row
+    values = {}
+
+    movie_id = _text(row, 'id')
+    if movie_id:
+        try:
+            values['id'] = int(movie_id)
+        except ValueError:
+            raise RowError(f'invalid id {movie_id!r}')
+
+    values['name'] = _text(row, 'name')
+    if not values['name']:
+        raise RowError('name is required')
+    if len(values['name']) > 255:
+        raise RowError('name is longer than 255 characters')
+
+    try:
+        price = Decimal(_text(row, 'price'))
+    except InvalidOperation:
+        raise RowError(f"invalid price {row.get('price')!r}")
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        raise RowError(f'price {price} is out of range')
+    values['price'] = price.quantize(Decimal('0.01'))
+
+    genre = _text(row, 'genre')
+    if genre:
+        if genre.lower() not in GENRES:
+            raise RowError(f'unknown genre {genre!r}')
+        values['genre'] = GENRES[genre.lower()]
+    else:
+        values['genre'] = DEFAULT_GENRE
+
+    values['description'] = _text(row, 'description')
+    values['image'] = _text(row, 'image')
+    values['image_url'] = _text(row, 'image_url') or None
+    # Same rule as Movie.clean.
+    if values['image'] and values['image_url']:
+        raise RowError('set either image or image_url, not both')
+    if not values['image'] and not values['image_url']:
+        raise RowError('either image or image_url is required')
+    if values['image_url']:
+        try:
+            _validate_url(values['image_url'])
+        except ValidationError:
+            raise RowError(f"invalid image_url {values['image_url']!r}")
+    return values
+
+
+def _differs(movie, values):
+    for field in UPDATE_FIELDS:
+        current = getattr(movie, field)
+        if field == 'image':
+            current = current.name or ''
+        if current != values[field]:
+            return True
+    return False
+
+
+def _upsert_batch(batch, key, using, counts):
+    existing = {}
+    lookup = {f'{key}__in': list(batch)}
+    movies = (Movie.objects.using(using).filter(**lookup)
+              .only('id', 'image_renditions', *UPDATE_FIELDS).order_by('id'))
+    for movie in movies:
+        # With duplicate names in the catalog the oldest movie is updated.
+        existing.setdefault(getattr(movie, key), movie)
+
+    to_create = []
+    to_update = []
+    stale_renditions = []
+    now = timezone.now()
+    for key_value, values in batch.items():
+        movie = existing.get(key_value)
+        if movie is None:
+            if key != 'id':
+                # Ids from another database (e.g. an export) would collide.
+                values.pop('id', None)
+            to_create.append(Movie(**values))
+        elif _differs(movie, values):
+            if (movie.image.name or '') != values['image'] and movie.image_renditions:
+                stale_renditions.append(movie.image_renditions)
+                movie.image_renditions = {}
+            for field in UPDATE_FIELDS:
+                setattr(movie, field, values[field])
+            movie.last_updated_date = now
+            to_update.append(movie)
+        else:
+            counts['unchanged'] += 1
+
+    with transaction.atomic(using=using):
+        Movie.objects.using(using).bulk_create(to_create)
+        Movie.objects.using(using).bulk_update(
+            to_update, (*UPDATE_FIELDS, 'image_renditions', 'last_updated_date'))
+        search.index_movies([(movie.id, movie.name, movie.description)
+                             for movie in to_create + to_update], using)
+        for renditions in stale_renditions:
+            transaction.on_commit(lambda renditions=renditions: images.delete_renditions(renditions),
+                                  using=using)
+    counts['created'] += len(to_create)
+    counts['updated'] += len(to_update)
+
+
+def import_rows(rows, key='name', batch_size=2000, using=None, dry_run=False, on_error=None):
+    """
+    Upsert (line number, row) pairs as produced by read_rows(). Invalid rows
+    are skipped and passed to on_error(line_number, message). Returns counts
+    of rows read and of created, updated, unchanged and invalid rows.
+    """
+    using = using or router.db_for_write(Movie)
+    counts = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0}
+    batch = {}
+
+    for line_number, row in rows:
+        counts['rows'] += 1
+        try:
+            values = clean_row(row)
+            if key == 'id' and 'id' not in values:
+                raise RowError('id is required when importing by id')
+        except RowError as error:
+            counts['invalid'] += 1
+            if on_error is not None:
+                on_error(line_number, str(error))
+            continue
+        # A key repeated within the batch: the later row wins.
+        batch[values[key]] = values
+        if len(batch) >= batch_size:
+            if not dry_run:
+                _upsert_batch(batch, key, using, counts)
+            batch = {}
+    if batch and not dry_run:
+        _upsert_batch(batch, key, using, counts)
+
+    if counts['created'] or counts['updated']:
+        page_cache.invalidate()
+        invalidate_pool()
+        autocomplete.invalidate()
+    return counts
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    """Yield every movie as a dict of FIELDS, in id order."""
+    queryset = Movie.objects.all() if queryset is None else queryset
+    for values in queryset.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size):
+        row = dict(zip(FIELDS, values))
+        row['price'] = str(row['price'])
+        row['image'] = row['image'] or ''
+        row['image_url'] = row['image_url'] or ''
+        yield row
@@ -0,0 +1,129 @@
+"""
+Faceted browsing of the catalog: genres (any number of them) and a price
+range, with the number of matching movies next to every option.
+
+Each facet's counts reflect the search term and the other facet's
+selection but not its own, so selecting "Action" still shows how many
+Comedy movies there are to add. Counting takes one grouped query per
+facet: GROUP BY genre for the genres, and one conditional COUNT per band
+for the price bands. Both are answered from the (genre, price) index.
+
+Counts are cached in the catalog cache under the page cache's generation
+number (moviesstore/page_cache.py), so they go stale together with the
+catalog pages whenever a movie or review changes. This lets paging
+through a filtered listing reuse them.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from moviesstore import page_cache
+from moviesstore.db_router import primary_pinned
+
+from . import search
+from .models import MAX_PRICE, Movie
+
+
+def price_bands():
+    """[(minimum, maximum)] from MOVIES_PRICE_BAND_EDGES; None is open-ended."""
+    edges = [None, *(Decimal(str(edge)) for edge in settings.MOVIES_PRICE_BAND_EDGES), None]
+    return list(zip(edges, edges[1:]))
+
+
+def parse_genres(values):
+    """Known genre codes among `values`, in GENRE_CHOICES order."""
+    return [code for code, _ in Movie.GENRE_CHOICES if code in values]
+
+
+def parse_price(value):
+    """A price from the query string, or None if missing or invalid."""
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+    if not price.is_finite() or not 0 <= price <= MAX_PRICE:
+        return None
+    return price
+
+
+def _price_filter(min_price, max_price):
+    """Movies priced from `min_price` (inclusive) to under `max_price`."""
+    condition = Q()
+    if min_price is not None:
+        condition &= Q(price__gte=min_price)
+    if max_price is not None:
+        condition &= Q(price__lt=max_price)
+    return condition
+
+
+def filter_movies(movies, genres, min_price, max_price):
+    if genres:
+        movies = movies.filter(genre__in=genres)
+    return movies.filter(_price_filter(min_price, max_price))
+
+
+def _compute(search_term, genres, min_price, max_price):
+    movies = Movie.objects.order_by()
+    if search_term:
+        movies = search.search(movies, search_term, ranked=False)
+
+    by_genre = dict(filter_movies(movies, [], min_price, max_price)
+                    .values_list('genre').annotate(count=Count('id')))
+
+    bands = price_bands()
+    by_band = filter_movies(movies, genres, None, None).aggregate(**{
+        f'band_{n}': Count('id', filter=_price_filter(low, high))
+        for n, (low, high) in enumerate(bands)
+    })
+    return by_genre, [by_band[f'band_{n}'] for n in range(len(bands))]
+
+
+def _cache_key(search_term, genres, min_price, max_price):
+    raw = '|'.join([search_term, ','.join(genres), str(min_price), str(max_price),
+                    ','.join(map(str, settings.MOVIES_PRICE_BAND_EDGES))])
+    return f'facets:{page_cache.generation()}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def counts(search_term, genres, min_price, max_price):
+    """
+    Return ({genre code: count}, [count per price band]) for the movies
+    matching `search_term`, counting genres within the price range and
+    price bands within the selected genres.
+    """
+    # Like the page cache, requests pinned to the primary neither read
+    # nor fill the cache.
+    if primary_pinned():
+        return _compute(search_term, genres, min_price, max_price)
+    cache = caches[settings.CATALOG_CACHE_ALIAS]
+    key = _cache_key(search_term, genres, min_price, max_price)
+    result = cache.get(key)
+    if result is None:
+        result = _compute(search_term, genres, min_price, max_price)
+        cache.set(key, result, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return result
+
+
+def options(search_term, genres, min_price, max_price):
+    """
+    The genre and price band options for the catalog page, each a dict
+    with its count and whether it is selected.
+    """
+    by_genre, by_band = counts(search_term, genres, min_price, max_price)
+    genre_facets = [
+        {'code': code, 'label': label, 'count': by_genre.get(code, 0), 'selected': code in genres}
+        for code, label in Movie.GENRE_CHOICES
+    ]
+    price_facets = []
+    for (low, high), count in zip(price_bands(), by_band):
+        if low is None:
+            label = f'Under ${high}'
+        elif high is None:
+            label = f'${low} and up'
+        else:
+            label = f'${low} to ${high}'
+        price_facets.append({'label': label, 'min': low, 'max': high, 'count': count,
+                             'selected': (low, high) == (min_price, max_price)})
+    return genre_facets, price_facets
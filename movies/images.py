@@ -0,0 +1,144 @@
+"""
+Fixed-size renditions of uploaded movie images.
+
+When a movie gets a new uploaded image, every size in
+MOVIE_IMAGE_RENDITIONS is generated as WebP and JPEG next to it (under
+movie_images/renditions/) with a content hash in the filename, so the files
+can be cached forever. The paths are stored in Movie.image_renditions:
+
+    {'source': 'movie_images/poster.jpg',
+     'card': {'width': 300, 'height': 200,
+              'webp': 'movie_images/renditions/12-card-3f2a....webp',
+              'jpeg': 'movie_images/renditions/12-card-9c41....jpg'},
+     ...}
+
+Templates and the admin pick a size with the movie_picture tag
+(movies/templatetags/movie_images.py) and fall back to the original file
+when no rendition exists yet.
+
+Renditions that no longer match the image (it was replaced or cleared,
+or the movie was deleted) are removed from storage.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Movie
+
+RENDITIONS_DIR = 'movie_images/renditions'
+
+FORMATS = (
+    # (key in image_renditions, Pillow format, file extension, save options)
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+# What an unreadable or hostile upload raises while being rendered.
+# Pillow's DecompressionBombError is not an OSError.
+RENDER_ERRORS = (OSError, Image.DecompressionBombError)
+
+
+def renditions_are_current(movie):
+    """True if the stored renditions were generated from the current image."""
+    renditions = movie.image_renditions or {}
+    return bool(movie.image) and renditions.get('source') == movie.image.name
+
+
+def _save_rendition(movie_id, size_name, image, pillow_format, extension, options):
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **options)
+    data = buffer.getvalue()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    name = posixpath.join(RENDITIONS_DIR, f'{movie_id}-{size_name}-{digest}.{extension}')
+    # Content-addressed: an existing file with this name has these bytes.
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def generate_renditions(movie):
+    """
+    Render every configured size of `movie.image` and return the
+    image_renditions dict describing them (the movie is not saved).
+    """
+    boxes = settings.MOVIE_IMAGE_RENDITIONS
+    largest = (max(w for w, h in boxes.values()), max(h for w, h in boxes.values()))
+    with movie.image.open('rb') as source:
+        original = Image.open(source)
+        # Let the JPEG decoder downscale while decoding big uploads.
+        original.draft('RGB', largest)
+        original = ImageOps.exif_transpose(original)
+        original = original.convert('RGB')
+        original.load()
+
+    renditions = {'source': movie.image.name}
+    for size_name, box in boxes.items():
+        image = original.copy()
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+        rendition = {'width': image.width, 'height': image.height}
+        for key, pillow_format, extension, options in FORMATS:
+            rendition[key] = _save_rendition(movie.id, size_name, image,
+                                             pillow_format, extension, options)
+        renditions[size_name] = rendition
+    return renditions
+
+
+def rendition_files(renditions):
+    """The storage names of every file listed in an image_renditions dict."""
+    return {rendition[key]
+            for size_name, rendition in (renditions or {}).items() if size_name != 'source'
+            for key, *_ in FORMATS if key in rendition}
+
+
+def delete_renditions(renditions, keep=()):
+    """Delete the files of `renditions` from storage, except those in `keep`."""
+    for name in rendition_files(renditions) - set(keep):
+        default_storage.delete(name)
+
+
+def update_renditions(movie, force=False, using=None):
+    """
+    Bring the stored renditions of `movie` in line with its image and
+    delete the files they replace. Returns True if anything was written.
+    Uses a queryset update so that model signals do not fire again; call
+    it outside a transaction, since the old files go straight away.
+    """
+    movies = Movie.objects.using(using).filter(pk=movie.pk)
+    stale = movie.image_renditions
+    if not movie.image:
+        if stale:
+            movie.image_renditions = {}
+            movies.update(image_renditions={})
+            delete_renditions(stale)
+            return True
+        return False
+    if renditions_are_current(movie) and not force:
+        return False
+    movie.image_renditions = generate_renditions(movie)
+    movies.update(image_renditions=movie.image_renditions)
+    # Unchanged sizes keep their content-addressed names.
+    delete_renditions(stale, keep=rendition_files(movie.image_renditions))
+    return True
+
+
+def rendition_urls(movie, size_name):
+    """
+    Return {'webp': url, 'jpeg': url, 'width': w, 'height': h} for one
+    size, or None if the movie has no current rendition of that size.
+    """
+    if not renditions_are_current(movie):
+        return None
+    rendition = movie.image_renditions.get(size_name)
+    if not rendition:
+        return None
+    return {
+        'webp': default_storage.url(rendition['webp']),
+        'jpeg': default_storage.url(rendition['jpeg']),
+        'width': rendition['width'],
+        'height': rendition['height'],
+    }
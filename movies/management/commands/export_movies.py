@@ -0,0 +1,52 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from movies import catalog_io
+from movies.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Write every movie to a CSV or JSON Lines file that import_movies can read back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help="Output file, or '-' for standard output (default).")
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='Output format (default: from the file extension, csv for stdout).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path == '-' else catalog_io.guess_format(path))
+        start = time.perf_counter()
+        try:
+            file = self.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+
+        rows = catalog_io.export_rows(Movie.objects.using(options['database']))
+        count = 0
+        try:
+            if file_format == 'csv':
+                writer = csv.DictWriter(file, fieldnames=catalog_io.FIELDS, lineterminator='\n')
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            else:
+                for row in rows:
+                    file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                    count += 1
+        finally:
+            if file is not self.stdout:
+                file.close()
+
+        if path != '-':
+            elapsed = time.perf_counter() - start
+            rate = count / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported {count} movies to {path} in {elapsed:.2f}s ({rate:.0f} rows/s).'))
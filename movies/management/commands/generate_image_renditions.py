@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies import images
+from movies.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized WebP/JPEG renditions of uploaded movie images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('movie_ids', nargs='*', type=int,
+                            help='Only process these movies (default: all with an uploaded image).')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions even if they look current.')
+
+    def handle(self, *args, **options):
+        movies = (Movie.objects.exclude(image='').exclude(image__isnull=True)
+                  .only('id', 'name', 'image', 'image_renditions').order_by('id'))
+        if options['movie_ids']:
+            movies = movies.filter(id__in=options['movie_ids'])
+
+        start = time.perf_counter()
+        rendered = failed = 0
+        for movie in movies.iterator(chunk_size=200):
+            try:
+                if images.update_renditions(movie, force=options['force']):
+                    rendered += 1
+            except images.RENDER_ERRORS as error:
+                failed += 1
+                self.stderr.write(f'Movie {movie.id} ({movie.name}): {error}')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} movies ({failed} failed) in {elapsed:.2f}s.'))
@@ -0,0 +1,61 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from movies import catalog_io
+
+
+class Command(BaseCommand):
+    help = ('Create or update movies from a CSV or JSON Lines file with the columns '
+            f"{', '.join(catalog_io.FIELDS)}. Rows are matched on --key.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for standard input.")
+        parser.add_argument('--format', choices=catalog_io.FORMATS,
+                            help='Input format (default: from the file extension, csv for stdin).')
+        parser.add_argument('--key', choices=catalog_io.KEYS, default='name',
+                            help='Natural key matching rows to existing movies.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the file without writing anything.')
+        parser.add_argument('--max-errors', type=int, default=20,
+                            help='Number of invalid rows to print.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path == '-' else catalog_io.guess_format(path))
+        printed = 0
+
+        def on_error(line_number, message):
+            nonlocal printed
+            if printed < options['max_errors']:
+                self.stderr.write(f'Line {line_number}: {message}')
+                printed += 1
+
+        start = time.perf_counter()
+        try:
+            # utf-8-sig drops the byte order mark spreadsheet exports start with.
+            file = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        try:
+            counts = catalog_io.import_rows(
+                catalog_io.read_rows(file, file_format), key=options['key'],
+                batch_size=options['batch_size'], using=options['database'],
+                dry_run=options['dry_run'], on_error=on_error)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        elapsed = time.perf_counter() - start
+
+        rate = counts['rows'] / elapsed if elapsed else 0
+        summary = (f"{counts['rows']} rows in {elapsed:.2f}s ({rate:.0f} rows/s): "
+                   f"{counts['created']} created, {counts['updated']} updated, "
+                   f"{counts['unchanged']} unchanged, {counts['invalid']} invalid.")
+        if options['dry_run']:
+            summary = f'Dry run, nothing written. {summary}'
+        style = self.style.WARNING if counts['invalid'] else self.style.SUCCESS
+        self.stdout.write(style(summary))
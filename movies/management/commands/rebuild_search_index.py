@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from movies import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for Movie.name and Movie.description.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to rebuild the index on.')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of movies inserted per batch.')
+
+    def handle(self, *args, **options):
+        if not search.fts_enabled(options['database']):
+            self.stdout.write(self.style.WARNING(
+                'Full-text index is only available on SQLite; nothing to do.'))
+            return
+        start = time.perf_counter()
+        count = search.rebuild_index(using=options['database'],
+                                     batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} movies in {elapsed:.2f}s.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from movies import ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the review count, rating sum and rating histogram stored on every movie.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('movie_ids', nargs='*', type=int,
+                            help='Only reconcile these movies (default: all).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to reconcile.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of movies aggregated per query.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        fixed = ratings.recompute(options['movie_ids'] or None,
+                                  using=options['database'],
+                                  batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Corrected rating aggregates on {fixed} movies in {elapsed:.2f}s.'))
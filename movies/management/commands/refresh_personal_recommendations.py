@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from movies import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Recompute every user\'s "recommended for you" movies on the home page '
+            'from the review ratings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int,
+                            help='Movies kept per user (default: PERSONAL_RECOMMENDATIONS_TOP_N).')
+        parser.add_argument('--neighbors', type=int,
+                            help='Similar movies kept per rated movie '
+                                 '(default: PERSONAL_RECOMMENDATIONS_NEIGHBORS).')
+        parser.add_argument('--max-reviews', type=int,
+                            help='Most recent reviews used per user '
+                                 '(default: PERSONAL_RECOMMENDATIONS_MAX_REVIEWS).')
+        parser.add_argument('--min-co-raters', type=int,
+                            help='Users who must have rated two movies for them to count as '
+                                 'similar (default: PERSONAL_RECOMMENDATIONS_MIN_CO_RATERS).')
+        parser.add_argument('--batch-size', type=int,
+                            help='Movies or users handled per query '
+                                 '(default: PERSONAL_RECOMMENDATIONS_BATCH_SIZE).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to refresh.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = recommendations.refresh_personal(top_n=options['top_n'],
+                                                  neighbors=options['neighbors'],
+                                                  max_reviews=options['max_reviews'],
+                                                  min_co_raters=options['min_co_raters'],
+                                                  batch_size=options['batch_size'],
+                                                  using=options['database'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed the recommendations of {counts['users']} users "
+            f"({counts['recommendations']} rows) in {elapsed:.2f}s."))
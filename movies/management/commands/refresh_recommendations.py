@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from movies import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Recompute the "customers who bought this also bought" neighbors of the '
+            'movies bought since the last run (of every movie with --full).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every movie, not only those bought since the last run.')
+        parser.add_argument('--top-k', type=int,
+                            help='Neighbors kept per movie (default: CO_PURCHASE_TOP_K).')
+        parser.add_argument('--min-support', type=int,
+                            help='Orders two movies must share (default: CO_PURCHASE_MIN_SUPPORT).')
+        parser.add_argument('--batch-size', type=int,
+                            help='Movies recomputed per query (default: CO_PURCHASE_BATCH_SIZE).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database alias to refresh.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        counts = recommendations.refresh(full=options['full'],
+                                         top_k=options['top_k'],
+                                         min_support=options['min_support'],
+                                         batch_size=options['batch_size'],
+                                         using=options['database'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed the neighbors of {counts['movies']} movies "
+            f"({counts['neighbors']} rows) in {elapsed:.2f}s."))
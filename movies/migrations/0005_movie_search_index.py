@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+# Frozen copy of the DDL in movies/search.py.
+CREATE_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movies_movie_fts USING fts5("
+    "name, description, "
+    "tokenize='unicode61 remove_diacritics 2', "
+    "prefix='2 3')"
+)
+DROP_TABLE_SQL = "DROP TABLE IF EXISTS movies_movie_fts"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE_SQL)
+    schema_editor.execute(
+        "INSERT INTO movies_movie_fts(rowid, name, description) "
+        "SELECT id, name, description FROM movies_movie"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_alter_movie_genre'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movie_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['name', 'id'], name='movie_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['genre', 'name', 'id'], name='movie_genre_name_id_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:40
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Review = apps.get_model('movies', 'Review')
+    db_alias = schema_editor.connection.alias
+    rows = (Review.objects.using(db_alias)
+            .values('movie_id')
+            .annotate(
+                review_count=Count('id'),
+                rating_sum=Sum('rating'),
+                **{f'rating_{stars}_count': Count('id', filter=Q(rating=stars))
+                   for stars in range(1, 6)},
+            ))
+    for row in rows:
+        Movie.objects.using(db_alias).filter(pk=row.pop('movie_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_movie_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', '-created_date', '-id'], name='review_movie_created_idx'),
+        ),
+    ]
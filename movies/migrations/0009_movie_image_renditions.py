@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_review_movie_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_movie_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('last_order_id', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieNeighbor',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('co_purchases', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='movies.movie')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('movie', 'rank'), name='movieneighbor_movie_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_movie_neighbors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', 'movie'], name='review_user_movie_idx'),
+        ),
+        migrations.AddField(
+            model_name='userrecommendation',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie'),
+        ),
+        migrations.AddField(
+            model_name='userrecommendation',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='userrecommendation',
+            constraint=models.UniqueConstraint(fields=('user', 'rank'), name='userrecommendation_user_rank'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_movie_genre_price_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='last_updated_date',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
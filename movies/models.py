@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
@@ -25,6 +27,12 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 #     def __str__(self):
 #         return str(self.id) + ' - ' + self.movie.name
 
+# Review aggregates on Movie, written only by movies.ratings.
+AGGREGATE_FIELDS = (
+    'review_count', 'rating_sum',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+)
+
 class Movie(models.Model):
     """
     Represents a movie in the store.
@@ -52,6 +60,47 @@ class Movie(models.Model):
 
     image = models.ImageField(upload_to='movie_images/', blank=True, null=True)
     image_url = models.URLField(blank=True, null=True)
+    # Resized copies of `image`, maintained by movies.images.
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Denormalized review aggregates, maintained by movies.ratings whenever a
+    # review is created, edited or deleted (reconcile_ratings recomputes them).
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Row version behind the API's ETags (api/utils.py). Writes that skip
+    # save() (rating aggregates, catalog imports) set it themselves.
+    last_updated_date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog walks (name, id), optionally
+            # narrowed to a single genre.
+            models.Index(fields=['name', 'id'], name='movie_name_id_idx'),
+            models.Index(fields=['genre', 'name', 'id'], name='movie_genre_name_id_idx'),
+            # Faceted browsing filters on genres and a price range, and
+            # counts movies per genre and price band (movies.facets).
+            models.Index(fields=['genre', 'price'], name='movie_genre_price_idx'),
+        ]
+
+    def save(self, *, force_insert=False, force_update=False, using=None, update_fields=None):
+        """
+        Save the movie. An update never writes the review aggregates, so an
+        instance loaded before a review was posted cannot reset them; only
+        movies.ratings changes them, with F() expressions.
+        """
+        if not self._state.adding and not force_insert:
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if not field.primary_key]
+            update_fields = [name for name in update_fields if name not in AGGREGATE_FIELDS]
+        super().save(force_insert=force_insert, force_update=force_update, using=using,
+                     update_fields=update_fields)
 
     def clean(self):
         """Ensure that either `image` or `image_url` is set, but not both."""
@@ -60,10 +109,28 @@ class Movie(models.Model):
         if not self.image and not self.image_url:
             raise ValidationError("You must provide either an image or an image URL.")
 
+    @property
+    def average_rating(self):
+        """Mean review rating, or None if the movie has no reviews."""
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def rating_histogram(self):
+        """Number of reviews per star rating, as {1: n1, ..., 5: n5}."""
+        return {stars: getattr(self, f'rating_{stars}_count') for stars in range(1, 6)}
+
     def __str__(self):
         return self.name
 
 
+# Largest price the price column can hold (9999.99).
+_price_field = Movie._meta.get_field('price')
+MAX_PRICE = (Decimal(10) ** (_price_field.max_digits - _price_field.decimal_places)
+             - Decimal(1).scaleb(-_price_field.decimal_places))
+
+
 class Review(models.Model):
     """
     Represents a user's review for a particular movie.
@@ -88,5 +155,82 @@ class Review(models.Model):
     created_date = models.DateTimeField(auto_now_add=True)
     last_updated_date = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # The movie detail page pages through reviews newest first.
+            models.Index(fields=['movie', '-created_date', '-id'], name='review_movie_created_idx'),
+            # Personal recommendations skip movies the user has reviewed.
+            models.Index(fields=['user', 'movie'], name='review_user_movie_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so an edit can move the movie's rating
+        # aggregates from the old rating to the new one.
+        loaded = dict(zip(field_names, values))
+        instance._loaded_rating = loaded.get('rating')
+        instance._loaded_movie_id = loaded.get('movie_id')
+        return instance
+
+    def __str__(self):
+        return f"Review by {self.user.username} on {self.movie.name}"
+
+class MovieNeighbor(models.Model):
+    """
+    One of the movies most often bought together with `movie`, ranked from
+    0. Precomputed from the order items by movies.recommendations
+    (refresh_recommendations), never written by requests.
+    """
+    id = models.AutoField(primary_key=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    # Orders containing both movies, and their cosine similarity
+    # co_purchases / sqrt(orders of movie * orders of neighbor).
+    co_purchases = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index the detail page reads a movie's neighbors by.
+            models.UniqueConstraint(fields=['movie', 'rank'], name='movieneighbor_movie_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} -> {self.neighbor_id} (#{self.rank})"
+
+
+class UserRecommendation(models.Model):
+    """
+    A movie recommended to `user` from their review ratings, ranked from
+    0. Precomputed by movies.recommendations
+    (refresh_personal_recommendations), never written by requests.
+    """
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index the home page reads a user's feed by.
+            models.UniqueConstraint(fields=['user', 'rank'], name='userrecommendation_user_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} for user {self.user_id} (#{self.rank})"
+
+
+class RecommendationState(models.Model):
+    """
+    Single row recording the last order already folded into MovieNeighbor,
+    so that a refresh only revisits movies bought since.
+    """
+    id = models.AutoField(primary_key=True)
+    last_order_id = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
-        return f"Review by {self.user.username} on {self.movie.name}"
\ No newline at end of file
+        return f"Recommendations through order #{self.last_order_id}"
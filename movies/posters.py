@@ -0,0 +1,213 @@
+"""
+Fetch-once local cache for posters referenced by Movie.image_url.
+
+Pages never point browsers at the remote origin directly. They link to
+/movies/poster/<token>/, where the token is the signed poster URL. That
+view serves the local copy with long-lived cache headers. If there is no
+local copy yet, it queues a background download and redirects to the
+origin once.
+
+Downloads are resized to fit POSTER_CACHE_MAX_SIZE and stored as JPEG in
+POSTER_CACHE_DIR. Each file has a JSON sidecar that records the ETag and
+Last-Modified headers of the origin. Copies older than
+POSTER_CACHE_REFRESH seconds are revalidated in the background with a
+conditional request. When the directory grows beyond
+POSTER_CACHE_MAX_BYTES, the least recently served posters are evicted.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+SIGNING_SALT = 'movies.posters'
+USER_AGENT = 'GTMoviesStore-PosterCache/1.0'
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+_eviction_lock = threading.Lock()
+
+
+def cache_dir():
+    path = Path(settings.POSTER_CACHE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def cache_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def _paths(url):
+    key = cache_key(url)
+    directory = cache_dir()
+    return directory / f'{key}.jpg', directory / f'{key}.json'
+
+
+def poster_url(url):
+    """Local URL that serves the poster found at the remote `url`."""
+    # Signer (unlike signing.dumps) adds no timestamp, so the same poster
+    # always gets the same URL and browsers can cache it.
+    token = signing.Signer(salt=SIGNING_SALT).sign_object(url, compress=True)
+    return reverse('movies.poster', args=[token])
+
+
+def url_from_token(token):
+    """Return the remote URL signed into `token`, or None if it was tampered with."""
+    try:
+        return signing.Signer(salt=SIGNING_SALT).unsign_object(token)
+    except signing.BadSignature:
+        return None
+
+
+def read_metadata(url):
+    _, meta_path = _paths(url)
+    try:
+        return json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def cached_file(url):
+    """
+    Return (path, metadata) of the local copy of `url`, or None. Stale
+    copies are still returned; a revalidation is queued for them.
+    """
+    image_path, _ = _paths(url)
+    metadata = read_metadata(url)
+    if metadata is None or not image_path.exists():
+        return None
+    if time.time() - metadata['fetched_at'] > settings.POSTER_CACHE_REFRESH:
+        schedule_fetch(url)
+    # The file's mtime is its "last served" time for LRU eviction.
+    try:
+        os.utime(image_path)
+    except OSError:
+        pass
+    return image_path, metadata
+
+
+def _resize(data):
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', settings.POSTER_CACHE_MAX_SIZE)
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail(settings.POSTER_CACHE_MAX_SIZE, Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def fetch(url):
+    """
+    Download (or revalidate) the poster at `url` and store the resized
+    copy. Returns 'stored', 'not-modified' or 'failed'.
+    """
+    image_path, meta_path = _paths(url)
+    metadata = read_metadata(url) if image_path.exists() else None
+
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    if metadata is not None:
+        if metadata.get('etag'):
+            request.add_header('If-None-Match', metadata['etag'])
+        if metadata.get('last_modified'):
+            request.add_header('If-Modified-Since', metadata['last_modified'])
+
+    try:
+        with urllib.request.urlopen(request, timeout=settings.POSTER_CACHE_TIMEOUT) as response:
+            data = response.read(settings.POSTER_CACHE_MAX_DOWNLOAD + 1)
+            headers = response.headers
+    except urllib.error.HTTPError as error:
+        if error.code == 304 and metadata is not None:
+            metadata['fetched_at'] = time.time()
+            _write_atomic(meta_path, json.dumps(metadata).encode())
+            return 'not-modified'
+        logger.warning('Poster fetch of %s failed: HTTP %s', url, error.code)
+        return 'failed'
+    except (urllib.error.URLError, OSError) as error:
+        logger.warning('Poster fetch of %s failed: %s', url, error)
+        return 'failed'
+
+    if len(data) > settings.POSTER_CACHE_MAX_DOWNLOAD:
+        logger.warning('Poster %s exceeds POSTER_CACHE_MAX_DOWNLOAD', url)
+        return 'failed'
+    try:
+        resized = _resize(data)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning('Poster %s is not a usable image: %s', url, error)
+        return 'failed'
+
+    _write_atomic(image_path, resized)
+    _write_atomic(meta_path, json.dumps({
+        'url': url,
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'fetched_at': time.time(),
+        'size': len(resized),
+        'digest': hashlib.sha256(resized).hexdigest()[:16],
+    }).encode())
+    evict()
+    return 'stored'
+
+
+def _write_atomic(path, data):
+    temporary = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+
+
+def evict():
+    """Delete least recently served posters until the cache fits POSTER_CACHE_MAX_BYTES."""
+    with _eviction_lock:
+        entries = []
+        total = 0
+        for image_path in cache_dir().glob('*.jpg'):
+            try:
+                stat = image_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, image_path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, image_path in entries:
+            if total <= settings.POSTER_CACHE_MAX_BYTES:
+                break
+            image_path.unlink(missing_ok=True)
+            image_path.with_suffix('.json').unlink(missing_ok=True)
+            total -= size
+
+
+def _run_fetch(url):
+    try:
+        fetch(url)
+    except Exception:
+        logger.exception('Poster fetch of %s crashed', url)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(url)
+
+
+def schedule_fetch(url):
+    """Queue a background download of `url` unless one is already running."""
+    global _executor
+    with _executor_lock:
+        if url in _in_flight:
+            return
+        _in_flight.add(url)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.POSTER_CACHE_WORKERS,
+                                           thread_name_prefix='poster-fetch')
+    _executor.submit(_run_fetch, url)
@@ -0,0 +1,100 @@
+"""
+Maintenance of the denormalized rating aggregates stored on Movie
+(review_count, rating_sum and the rating_<n>_count histogram).
+
+Incremental updates are single UPDATE statements with F() expressions, so
+concurrent reviews on the same movie never overwrite each other. They are
+driven by the Review signal handlers in movies/signals.py and therefore
+cover the views, the admin and cascading deletes alike.
+"""
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import AGGREGATE_FIELDS, Movie, Review
+
+
+def apply_rating(movie_id, rating, delta, using=None):
+    """Add (delta=1) or remove (delta=-1) one review of `rating` stars."""
+    (Movie.objects.using(using)
+     .filter(pk=movie_id)
+     .update(**{
+         'review_count': F('review_count') + delta,
+         'rating_sum': F('rating_sum') + delta * rating,
+         f'rating_{rating}_count': F(f'rating_{rating}_count') + delta,
+         'last_updated_date': timezone.now(),
+     }))
+
+
+def review_saved(review, created, using=None):
+    if created:
+        apply_rating(review.movie_id, review.rating, 1, using)
+    else:
+        old_rating = getattr(review, '_loaded_rating', None)
+        old_movie_id = getattr(review, '_loaded_movie_id', None)
+        if old_rating is None or old_movie_id is None:
+            # Instance was not loaded from the database; nothing to diff
+            # against, so resynchronise this movie from scratch.
+            recompute([review.movie_id], using)
+        elif (old_rating, old_movie_id) != (review.rating, review.movie_id):
+            apply_rating(old_movie_id, old_rating, -1, using)
+            apply_rating(review.movie_id, review.rating, 1, using)
+    review._loaded_rating = review.rating
+    review._loaded_movie_id = review.movie_id
+
+
+def review_deleted(review, using=None):
+    # Subtract what is stored, not what may have been edited in memory.
+    rating = getattr(review, '_loaded_rating', None) or review.rating
+    movie_id = getattr(review, '_loaded_movie_id', None) or review.movie_id
+    apply_rating(movie_id, rating, -1, using)
+
+
+def _aggregates_by_movie(movie_ids, using):
+    rows = (Review.objects.using(using)
+            .filter(movie_id__in=movie_ids)
+            .values('movie_id')
+            .annotate(
+                review_count=Count('id'),
+                rating_sum=Sum('rating'),
+                **{f'rating_{stars}_count': Count('id', filter=Q(rating=stars))
+                   for stars in range(1, 6)},
+            ))
+    return {row.pop('movie_id'): row for row in rows}
+
+
+def recompute(movie_ids=None, using=None, batch_size=1000):
+    """
+    Recompute the aggregates from the Review table, one GROUP BY per batch
+    of movies, writing back only the movies whose stored values drifted.
+    Returns the number of movies that were corrected.
+    """
+    movies = Movie.objects.using(using).only('id', *AGGREGATE_FIELDS).order_by('id')
+    if movie_ids is not None:
+        movies = movies.filter(id__in=movie_ids)
+
+    fixed = 0
+    empty = dict.fromkeys(AGGREGATE_FIELDS, 0)
+    batch = []
+
+    def flush(batch):
+        aggregates = _aggregates_by_movie([movie.id for movie in batch], using)
+        stale = []
+        for movie in batch:
+            expected = aggregates.get(movie.id, empty)
+            if any(getattr(movie, field) != expected[field] for field in AGGREGATE_FIELDS):
+                for field in AGGREGATE_FIELDS:
+                    setattr(movie, field, expected[field])
+                movie.last_updated_date = timezone.now()
+                stale.append(movie)
+        if stale:
+            Movie.objects.using(using).bulk_update(stale, (*AGGREGATE_FIELDS, 'last_updated_date'))
+        return len(stale)
+
+    for movie in movies.iterator(chunk_size=batch_size):
+        batch.append(movie)
+        if len(batch) >= batch_size:
+            fixed += flush(batch)
+            batch = []
+    if batch:
+        fixed += flush(batch)
+    return fixed
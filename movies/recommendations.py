@@ -0,0 +1,366 @@
+"""
+Movie recommendations, precomputed in batch jobs so that serving one is a
+single indexed lookup.
+
+"Customers who bought this also bought" (MovieNeighbor, refresh())
+---------------------------------------------------------------------
+
+Two movies are similar when they are bought in the same orders. The
+similarity of movies A and B is the cosine of their order vectors,
+
+    orders with both A and B / sqrt(orders with A * orders with B),
+
+so a blockbuster that is in every other basket does not crowd out the
+movies that are specifically bought together with A.
+
+The scores are precomputed into MovieNeighbor: the CO_PURCHASE_TOP_K best
+neighbors of every movie, ranked from 0. The detail page then reads a
+movie's neighbors with one indexed lookup, however large the order
+history is.
+
+refresh() does the batch work inside the database. A self-join of
+cart_item on the order, grouped by movie pair and ranked with a window
+function, yields the top-K rows directly. The join reads only the two
+covering indexes on Item. Movies are handled CO_PURCHASE_BATCH_SIZE at
+a time, so neither the database nor Python ever holds more than one
+batch of pairs.
+
+The first refresh (or one with full=True) covers every movie. After
+that, only movies bought since the last refresh are recomputed; the
+RecommendationState row records how far it got. Those are exactly the
+movies whose co-purchase counts changed. Other movies' scores drift
+slightly as order counts grow, which the next full refresh corrects.
+
+"Recommended for you" (UserRecommendation, refresh_personal())
+--------------------------------------------------------------
+
+Item-based collaborative filtering on the review ratings. Each rating is
+centred on NEUTRAL_RATING: 4 and 5 stars count as liking the movie, 1
+and 2 as disliking it. Two movies are similar when the same users like
+(or dislike) both; their similarity is the cosine of their centred
+rating vectors, over users who rated both. A user's score for a movie
+they have not reviewed is the sum, over the movies they rated, of
+centred rating * similarity. The PERSONAL_RECOMMENDATIONS_TOP_N best
+movies are stored per user.
+
+Both steps run in SQL over temporary tables, in batches of movies and
+then of users. Only each user's PERSONAL_RECOMMENDATIONS_MAX_REVIEWS most
+recent reviews are used, which bounds the rating self-join. Users with
+no usable review get no rows, and the home page shows them the featured
+sampler instead.
+"""
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from cart.models import Item, Order
+from moviesstore import page_cache
+
+from .models import MovieNeighbor, RecommendationState, Review, UserRecommendation
+
+ORDER_COUNTS_TABLE = 'recommendations_order_counts'
+RATINGS_TABLE = 'recommendations_ratings'
+NORMS_TABLE = 'recommendations_rating_norms'
+SIMILAR_TABLE = 'recommendations_similar'
+NEUTRAL_RATING = 3
+
+
+def neighbors(movie, limit=None):
+    """The movies most often bought together with `movie`, best first."""
+    limit = limit or settings.CO_PURCHASE_TOP_K
+    rows = (MovieNeighbor.objects.filter(movie_id=movie.id)
+            .select_related('neighbor').order_by('rank')[:limit])
+    return [row.neighbor for row in rows]
+
+
+def for_user(user, limit=None):
+    """The movies recommended to `user`, best first (empty if none yet)."""
+    limit = limit or settings.PERSONAL_RECOMMENDATIONS_TOP_N
+    rows = (UserRecommendation.objects.filter(user_id=user.id)
+            .select_related('movie').order_by('rank')[:limit])
+    return [row.movie for row in rows]
+
+
+def _order_counts(cursor, connection):
+    """Fill a temporary table with the number of orders of every movie sold."""
+    quote = connection.ops.quote_name
+    item = Item._meta
+    movie_column = quote(item.get_field('movie').column)
+    order_column = quote(item.get_field('order').column)
+    cursor.execute(f'DROP TABLE IF EXISTS {ORDER_COUNTS_TABLE}')
+    cursor.execute(f'CREATE TEMPORARY TABLE {ORDER_COUNTS_TABLE} '
+                   f'(movie_id integer PRIMARY KEY, orders integer NOT NULL)')
+    cursor.execute(
+        f'INSERT INTO {ORDER_COUNTS_TABLE} (movie_id, orders) '
+        f'SELECT {movie_column}, COUNT(DISTINCT {order_column}) '
+        f'FROM {quote(item.db_table)} GROUP BY {movie_column}')
+
+
+def _neighbors_sql(connection, batch_size):
+    quote = connection.ops.quote_name
+    item = Item._meta
+    table = quote(item.db_table)
+    movie = quote(item.get_field('movie').column)
+    order = quote(item.get_field('order').column)
+    placeholders = ', '.join(['%s'] * batch_size)
+    # Within one movie's partition sqrt(orders of the movie) is constant,
+    # so ranking by co_purchases^2 / orders of the neighbor gives the
+    # cosine order without needing SQRT in the database.
+    together = f'COUNT(DISTINCT a.{order})'
+    return f"""
+        SELECT movie_id, neighbor_id, co_purchases, movie_orders, neighbor_orders FROM (
+            SELECT a.{movie} AS movie_id, b.{movie} AS neighbor_id,
+                   {together} AS co_purchases,
+                   MAX(na.orders) AS movie_orders, MAX(nb.orders) AS neighbor_orders,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY a.{movie}
+                       ORDER BY {together} * {together} * 1.0 / MAX(nb.orders) DESC,
+                                {together} DESC, b.{movie}
+                   ) AS position
+            FROM {table} a
+            JOIN {table} b ON b.{order} = a.{order} AND b.{movie} <> a.{movie}
+            JOIN {ORDER_COUNTS_TABLE} na ON na.movie_id = a.{movie}
+            JOIN {ORDER_COUNTS_TABLE} nb ON nb.movie_id = b.{movie}
+            WHERE a.{movie} IN ({placeholders})
+            GROUP BY a.{movie}, b.{movie}
+            HAVING {together} >= %s
+        ) ranked
+        WHERE position <= %s
+        ORDER BY movie_id, position
+    """
+
+
+def _refresh_batch(cursor, connection, using, movie_ids, top_k, min_support):
+    cursor.execute(_neighbors_sql(connection, len(movie_ids)),
+                   [*movie_ids, min_support, top_k])
+    rows = []
+    rank = {}
+    for movie_id, neighbor_id, co_purchases, movie_orders, neighbor_orders in cursor.fetchall():
+        rank[movie_id] = rank.get(movie_id, -1) + 1
+        rows.append(MovieNeighbor(
+            movie_id=movie_id, neighbor_id=neighbor_id, rank=rank[movie_id],
+            co_purchases=co_purchases,
+            score=co_purchases / (movie_orders * neighbor_orders) ** 0.5))
+    with transaction.atomic(using=using):
+        MovieNeighbor.objects.using(using).filter(movie_id__in=movie_ids).delete()
+        MovieNeighbor.objects.using(using).bulk_create(rows)
+    return len(rows)
+
+
+def _keyset(cursor, table, column, batch_size):
+    """Yield the distinct values of `column` in `table`, batch_size at a time."""
+    last = 0
+    while True:
+        cursor.execute(f'SELECT DISTINCT {column} FROM {table} WHERE {column} > %s '
+                       f'ORDER BY {column} LIMIT %s', [last, batch_size])
+        values = [row[0] for row in cursor.fetchall()]
+        if not values:
+            return
+        yield values
+        last = values[-1]
+
+
+def _batches(cursor, using, after_order_id, last_order_id, full, batch_size):
+    """Yield lists of the movie ids to recompute, in id order."""
+    if not full:
+        movie_ids = sorted(Item.objects.using(using)
+                           .filter(order_id__gt=after_order_id, order_id__lte=last_order_id)
+                           .values_list('movie_id', flat=True).distinct())
+        for start in range(0, len(movie_ids), batch_size):
+            yield movie_ids[start:start + batch_size]
+        return
+    yield from _keyset(cursor, ORDER_COUNTS_TABLE, 'movie_id', batch_size)
+
+
+def refresh(full=False, top_k=None, min_support=None, batch_size=None, using=None):
+    """
+    Recompute the neighbors of the movies bought since the last refresh
+    (of every movie with `full`, or if there was no refresh yet). Returns
+    counts of the movies recomputed and the neighbor rows written.
+    """
+    top_k = top_k or settings.CO_PURCHASE_TOP_K
+    min_support = min_support or settings.CO_PURCHASE_MIN_SUPPORT
+    batch_size = batch_size or settings.CO_PURCHASE_BATCH_SIZE
+    using = using or router.db_for_write(MovieNeighbor)
+    connection = connections[using]
+
+    state, _ = RecommendationState.objects.using(using).get_or_create(id=1)
+    full = full or state.refreshed_at is None
+    # Orders placed while this runs are picked up by the next refresh.
+    last_order_id = Order.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0
+    if not full and last_order_id <= state.last_order_id:
+        return {'movies': 0, 'neighbors': 0}
+
+    counts = {'movies': 0, 'neighbors': 0}
+    with connection.cursor() as cursor:
+        _order_counts(cursor, connection)
+        try:
+            for batch in _batches(cursor, using, state.last_order_id, last_order_id, full, batch_size):
+                counts['neighbors'] += _refresh_batch(cursor, connection, using, batch,
+                                                      top_k, min_support)
+                counts['movies'] += len(batch)
+            if full:
+                # Movies whose orders have all been deleted since.
+                quote = connection.ops.quote_name
+                cursor.execute(
+                    f'DELETE FROM {quote(MovieNeighbor._meta.db_table)} '
+                    f'WHERE {quote(MovieNeighbor._meta.get_field("movie").column)} '
+                    f'NOT IN (SELECT movie_id FROM {ORDER_COUNTS_TABLE})')
+        finally:
+            cursor.execute(f'DROP TABLE IF EXISTS {ORDER_COUNTS_TABLE}')
+
+    state.last_order_id = last_order_id
+    state.refreshed_at = timezone.now()
+    state.save(using=using)
+    page_cache.invalidate()
+    return counts
+
+
+def _rating_tables(cursor, connection, max_reviews):
+    """
+    Fill the temporary tables of centred ratings (each user's most recent
+    `max_reviews` movies) and of the squared norm of every movie's ratings.
+    """
+    quote = connection.ops.quote_name
+    review = Review._meta
+    table = quote(review.db_table)
+    user = quote(review.get_field('user').column)
+    movie = quote(review.get_field('movie').column)
+    rating = quote(review.get_field('rating').column)
+    created = quote(review.get_field('created_date').column)
+    _drop_rating_tables(cursor)
+    cursor.execute(f'CREATE TEMPORARY TABLE {RATINGS_TABLE} '
+                   f'(user_id integer NOT NULL, movie_id integer NOT NULL, weight real NOT NULL)')
+    # A user who reviewed a movie more than once is counted once, with
+    # their average rating.
+    cursor.execute(f"""
+        INSERT INTO {RATINGS_TABLE} (user_id, movie_id, weight)
+        SELECT user_id, movie_id, weight FROM (
+            SELECT {user} AS user_id, {movie} AS movie_id,
+                   AVG({rating}) - {NEUTRAL_RATING} AS weight,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY {user} ORDER BY MAX({created}) DESC, {movie} DESC
+                   ) AS position
+            FROM {table}
+            GROUP BY {user}, {movie}
+        ) recent
+        WHERE position <= %s AND weight <> 0
+    """, [max_reviews])
+    cursor.execute(f'CREATE INDEX {RATINGS_TABLE}_user ON {RATINGS_TABLE} (user_id, movie_id, weight)')
+    cursor.execute(f'CREATE INDEX {RATINGS_TABLE}_movie ON {RATINGS_TABLE} (movie_id, user_id, weight)')
+    cursor.execute(f'CREATE TEMPORARY TABLE {NORMS_TABLE} '
+                   f'(movie_id integer PRIMARY KEY, norm real NOT NULL)')
+    cursor.execute(f'INSERT INTO {NORMS_TABLE} (movie_id, norm) '
+                   f'SELECT movie_id, SUM(weight * weight) FROM {RATINGS_TABLE} GROUP BY movie_id')
+    cursor.execute(f'CREATE TEMPORARY TABLE {SIMILAR_TABLE} '
+                   f'(movie_id integer NOT NULL, neighbor_id integer NOT NULL, similarity real NOT NULL)')
+
+
+def _drop_rating_tables(cursor):
+    for table in (RATINGS_TABLE, NORMS_TABLE, SIMILAR_TABLE):
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def _similar_movies(cursor, movie_ids, neighbors, min_co_raters):
+    """Store the `neighbors` movies most similar to each of `movie_ids`."""
+    placeholders = ', '.join(['%s'] * len(movie_ids))
+    dot = 'SUM(a.weight * b.weight)'
+    # As in _neighbors_sql, ranking by dot^2 / norm of the neighbor gives
+    # the cosine order within a movie's partition (dot is positive).
+    cursor.execute(f"""
+        SELECT movie_id, neighbor_id, dot, movie_norm, neighbor_norm FROM (
+            SELECT a.movie_id AS movie_id, b.movie_id AS neighbor_id, {dot} AS dot,
+                   MAX(na.norm) AS movie_norm, MAX(nb.norm) AS neighbor_norm,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY a.movie_id
+                       ORDER BY {dot} * {dot} / MAX(nb.norm) DESC, b.movie_id
+                   ) AS position
+            FROM {RATINGS_TABLE} a
+            JOIN {RATINGS_TABLE} b ON b.user_id = a.user_id AND b.movie_id <> a.movie_id
+            JOIN {NORMS_TABLE} na ON na.movie_id = a.movie_id
+            JOIN {NORMS_TABLE} nb ON nb.movie_id = b.movie_id
+            WHERE a.movie_id IN ({placeholders})
+            GROUP BY a.movie_id, b.movie_id
+            HAVING {dot} > 0 AND COUNT(*) >= %s
+        ) ranked
+        WHERE position <= %s
+    """, [*movie_ids, min_co_raters, neighbors])
+    rows = [(movie_id, neighbor_id, dot / (movie_norm * neighbor_norm) ** 0.5)
+            for movie_id, neighbor_id, dot, movie_norm, neighbor_norm in cursor.fetchall()]
+    cursor.executemany(f'INSERT INTO {SIMILAR_TABLE} (movie_id, neighbor_id, similarity) '
+                       f'VALUES (%s, %s, %s)', rows)
+
+
+def _recommend(cursor, connection, using, user_ids, top_n):
+    """Replace the stored recommendations of `user_ids`."""
+    quote = connection.ops.quote_name
+    review = Review._meta
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    score = 'SUM(r.weight * s.similarity)'
+    cursor.execute(f"""
+        SELECT user_id, movie_id, score FROM (
+            SELECT r.user_id AS user_id, s.neighbor_id AS movie_id, {score} AS score,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY r.user_id ORDER BY {score} DESC, s.neighbor_id
+                   ) AS position
+            FROM {RATINGS_TABLE} r
+            JOIN {SIMILAR_TABLE} s ON s.movie_id = r.movie_id
+            WHERE r.user_id IN ({placeholders})
+              AND NOT EXISTS (
+                  SELECT 1 FROM {quote(review.db_table)} seen
+                  WHERE seen.{quote(review.get_field('user').column)} = r.user_id
+                    AND seen.{quote(review.get_field('movie').column)} = s.neighbor_id)
+            GROUP BY r.user_id, s.neighbor_id
+            HAVING {score} > 0
+        ) ranked
+        WHERE position <= %s
+        ORDER BY user_id, position
+    """, [*user_ids, top_n])
+    rows = []
+    rank = {}
+    for user_id, movie_id, score in cursor.fetchall():
+        rank[user_id] = rank.get(user_id, -1) + 1
+        rows.append(UserRecommendation(user_id=user_id, movie_id=movie_id,
+                                       rank=rank[user_id], score=score))
+    with transaction.atomic(using=using):
+        UserRecommendation.objects.using(using).filter(user_id__in=user_ids).delete()
+        UserRecommendation.objects.using(using).bulk_create(rows)
+    return len(rows)
+
+
+def refresh_personal(top_n=None, neighbors=None, max_reviews=None, min_co_raters=None,
+                     batch_size=None, using=None):
+    """
+    Recompute the "recommended for you" movies of every user from the
+    review ratings. Returns counts of the users with ratings and of the
+    recommendation rows written.
+    """
+    top_n = top_n or settings.PERSONAL_RECOMMENDATIONS_TOP_N
+    neighbors = neighbors or settings.PERSONAL_RECOMMENDATIONS_NEIGHBORS
+    max_reviews = max_reviews or settings.PERSONAL_RECOMMENDATIONS_MAX_REVIEWS
+    min_co_raters = min_co_raters or settings.PERSONAL_RECOMMENDATIONS_MIN_CO_RATERS
+    batch_size = batch_size or settings.PERSONAL_RECOMMENDATIONS_BATCH_SIZE
+    using = using or router.db_for_write(UserRecommendation)
+    connection = connections[using]
+
+    counts = {'users': 0, 'recommendations': 0}
+    with connection.cursor() as cursor:
+        _rating_tables(cursor, connection, max_reviews)
+        try:
+            for movie_ids in _keyset(cursor, NORMS_TABLE, 'movie_id', batch_size):
+                _similar_movies(cursor, movie_ids, neighbors, min_co_raters)
+            cursor.execute(f'CREATE INDEX {SIMILAR_TABLE}_movie ON {SIMILAR_TABLE} '
+                           f'(movie_id, neighbor_id, similarity)')
+            for user_ids in _keyset(cursor, RATINGS_TABLE, 'user_id', batch_size):
+                counts['recommendations'] += _recommend(cursor, connection, using,
+                                                        user_ids, top_n)
+                counts['users'] += len(user_ids)
+            # Users whose reviews have all been deleted (or are neutral).
+            quote = connection.ops.quote_name
+            cursor.execute(
+                f'DELETE FROM {quote(UserRecommendation._meta.db_table)} '
+                f'WHERE {quote(UserRecommendation._meta.get_field("user").column)} '
+                f'NOT IN (SELECT user_id FROM {RATINGS_TABLE})')
+        finally:
+            _drop_rating_tables(cursor)
+    return counts
@@ -0,0 +1,174 @@
+"""
+Full-text search over Movie.name and Movie.description.
+
+On SQLite the catalog is mirrored into an FTS5 virtual table
+(movies_movie_fts) which is kept in sync by the signal handlers in
+movies/signals.py. Other database backends fall back to icontains filters.
+"""
+import re
+
+from django.db import connections, router, transaction
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Movie
+
+FTS_TABLE = 'movies_movie_fts'
+
+# bm25() weights for the (name, description) columns: a hit in the title
+# counts for much more than a hit somewhere in the synopsis.
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Unique sort key of ranked search results, best match first.
+RANK_ORDERING = ('search_rank', 'id')
+
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, "
+    "tokenize='unicode61 remove_diacritics 2', "
+    "prefix='2 3')"
+)
+DROP_TABLE_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_enabled(using=None):
+    """Return True if the database holding movies supports the FTS5 index."""
+    using = using or router.db_for_read(Movie)
+    return connections[using].vendor == 'sqlite'
+
+
+def build_match_query(term):
+    """
+    Turn free text typed by a user into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix query, so "star wa" matches
+    "Star Wars" and FTS5 operators typed by the user are treated as text.
+    Returns None if the term has no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(term.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search(queryset, term, ranked=True):
+    """
+    Narrow a Movie queryset to the movies matching `term`.
+
+    The matching rows are looked up through the FTS5 index instead of a
+    leading-wildcard LIKE. With `ranked`, each row is annotated with
+    `search_rank` (lower is better) and the best matches come first; keyset
+    pagination pages such results by RANK_ORDERING. Pass ranked=False when
+    only the set of matches matters (counting them, for instance).
+    """
+    if not fts_enabled(queryset.db):
+        queryset = queryset.filter(name__icontains=term)
+        if not ranked:
+            return queryset
+        # No relevance without the index: every match ranks the same.
+        return (queryset
+                .annotate(search_rank=Value(0.0, output_field=FloatField()))
+                .order_by(*RANK_ORDERING))
+
+    match = build_match_query(term)
+    if match is None:
+        queryset = queryset.none()
+        if not ranked:
+            return queryset
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    matching_ids = RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        (match,),
+    )
+    queryset = queryset.filter(id__in=matching_ids)
+    if not ranked:
+        return queryset
+
+    table = Movie._meta.db_table
+    rank = RawSQL(
+        f"SELECT bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+        (NAME_WEIGHT, DESCRIPTION_WEIGHT, match),
+    )
+    return (queryset
+            .annotate(search_rank=rank)
+            .order_by(*RANK_ORDERING))
+
+
+def index_movie(movie, using=None):
+    """Insert or refresh the index entry of a single movie."""
+    using = using or router.db_for_write(Movie)
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [movie.id])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (%s, %s, %s)",
+            [movie.id, movie.name, movie.description],
+        )
+
+
+def index_movies(rows, using=None):
+    """
+    Insert or refresh the index entries of many movies at once, given
+    (id, name, description) rows. For bulk writes that skip model signals.
+    """
+    using = using or router.db_for_write(Movie)
+    if not fts_enabled(using) or not rows:
+        return
+    with connections[using].cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                           [(row[0],) for row in rows])
+        _insert_rows(cursor, rows)
+
+
+def unindex_movie(movie_id, using=None):
+    """Remove a movie from the index."""
+    using = using or router.db_for_write(Movie)
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [movie_id])
+
+
+def rebuild_index(using=None, batch_size=2000):
+    """
+    Drop and repopulate the whole index from the movies table.
+
+    Returns the number of movies indexed. Use this after bulk loads that
+    bypass model signals (bulk_create, bulk_update, raw SQL).
+    """
+    using = using or router.db_for_write(Movie)
+    if not fts_enabled(using):
+        return 0
+
+    rows = (Movie.objects.using(using)
+            .order_by('id')
+            .values_list('id', 'name', 'description'))
+    count = 0
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(DROP_TABLE_SQL)
+        cursor.execute(CREATE_TABLE_SQL)
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _insert_rows(cursor, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            _insert_rows(cursor, batch)
+            count += len(batch)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def _insert_rows(cursor, rows):
+    cursor.executemany(
+        f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (%s, %s, %s)",
+        rows,
+    )
@@ -0,0 +1,70 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import autocomplete, images, ratings, search
+from .models import Movie, Review
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Movie)
+def index_saved_movie(sender, instance, using, **kwargs):
+    """Keep the full-text index in step with the movie that was just saved."""
+    search.index_movie(instance, using=using)
+
+
+@receiver(post_save, sender=Movie)
+def render_movie_image(sender, instance, using, raw=False, **kwargs):
+    """
+    Generate the resized renditions of a newly uploaded image once the
+    save is committed, so the write lock is not held while rendering.
+    """
+    if raw:
+        return
+    transaction.on_commit(lambda: _render_image(instance, using), using=using)
+
+
+def _render_image(movie, using):
+    try:
+        images.update_renditions(movie, using=using)
+    except images.RENDER_ERRORS:
+        # Unreadable or oversized upload: pages fall back to the original file.
+        logger.exception('Could not render image of movie %s', movie.pk)
+
+
+@receiver(post_delete, sender=Movie)
+def delete_movie_renditions(sender, instance, using, **kwargs):
+    """Remove a deleted movie's rendition files once the delete is committed."""
+    renditions = instance.image_renditions
+    if renditions:
+        transaction.on_commit(lambda: images.delete_renditions(renditions), using=using)
+
+
+@receiver(post_delete, sender=Movie)
+def unindex_deleted_movie(sender, instance, using, **kwargs):
+    """Drop a deleted movie from the full-text index."""
+    search.unindex_movie(instance.id, using=using)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def refresh_autocomplete_index(sender, using, **kwargs):
+    """Have the typeahead index reloaded once the change is committed."""
+    transaction.on_commit(autocomplete.invalidate, using=using)
+
+
+@receiver(post_save, sender=Review)
+def update_ratings_on_save(sender, instance, created, using, raw=False, **kwargs):
+    """Fold a new or edited review into its movie's rating aggregates."""
+    if raw:
+        return
+    ratings.review_saved(instance, created, using)
+
+
+@receiver(post_delete, sender=Review)
+def update_ratings_on_delete(sender, instance, using, **kwargs):
+    """Take a deleted review out of its movie's rating aggregates."""
+    ratings.review_deleted(instance, using)
@@ -0,0 +1,35 @@
+from django import template
+from django.utils.html import format_html
+
+from movies.images import rendition_urls
+from movies.posters import poster_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def movie_picture(movie, size, css_class='', style=''):
+    """
+    Render a movie's image at one of the MOVIE_IMAGE_RENDITIONS sizes, as a
+    <picture> offering WebP with a JPEG fallback. Uploads not rendered yet
+    use the original file; external posters (image_url) go through the
+    local poster cache.
+    """
+    urls = rendition_urls(movie, size)
+    if urls is not None:
+        return format_html(
+            '<picture>'
+            '<source srcset="{}" type="image/webp">'
+            '<img src="{}" width="{}" height="{}" class="{}" style="{}" alt="{}" loading="lazy">'
+            '</picture>',
+            urls['webp'], urls['jpeg'], urls['width'], urls['height'],
+            css_class, style, movie.name,
+        )
+    if movie.image:
+        src = movie.image.url
+    elif movie.image_url:
+        src = poster_url(movie.image_url)
+    else:
+        return ''
+    return format_html('<img src="{}" class="{}" style="{}" alt="{}" loading="lazy">',
+                       src, css_class, style, movie.name)
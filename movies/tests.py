@@ -1,3 +1,758 @@
-from django.test import TestCase
+import io
+import re
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from PIL import Image
+
+from cart.models import Item, Order
+from moviesstore import page_cache
+
+from . import autocomplete, catalog_io, images, posters, recommendations, search
+from .models import Movie, MovieNeighbor, RecommendationState, Review, UserRecommendation
+
+
+@override_settings(REVIEWS_PAGE_SIZE=10)
+class MovieShowQueryCountTests(TestCase):
+    """The detail page must not issue a query per review."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='secret')
+        cls.movie = Movie.objects.create(
+            name='Inception', price=10, description='Dreams within dreams.',
+            image_url='https://example.com/inception.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def add_reviews(self, count):
+        for n in range(count):
+            author = User.objects.create_user(f'author{Review.objects.count()}')
+            Review.objects.create(user=author, movie=self.movie, comment=f'Review {n}', rating=4)
+
+    def test_query_count_is_independent_of_review_count(self):
+        self.client.force_login(self.viewer)
+        url = reverse('movies.show', args=[self.movie.id])
+        # session + user, movie, reviews joined with their authors,
+        # co-purchased movies
+        for review_count in (1, 5, 25):
+            self.add_reviews(review_count - self.movie.reviews.count())
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_reviews_are_paginated_newest_first(self):
+        self.add_reviews(25)
+        url = reverse('movies.show', args=[self.movie.id])
+        response = self.client.get(url)
+        first_page = list(response.context['template_data']['reviews'])
+        self.assertEqual(len(first_page), 10)
+        self.assertEqual(first_page[0].comment, 'Review 24')
+
+        cursor = response.context['template_data']['page'].next_cursor
+        response = self.client.get(url, {'cursor': cursor})
+        second_page = list(response.context['template_data']['reviews'])
+        self.assertEqual(second_page[0].comment, 'Review 14')
+
+
+class FullTextSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alien = Movie.objects.create(
+            name='Alien', description='In space no one can hear you scream.',
+            price=5, image_url='https://example.com/alien.jpg')
+        cls.space_jam = Movie.objects.create(
+            name='Space Jam', description='Basketball with cartoons.',
+            price=5, image_url='https://example.com/jam.jpg')
+        cls.amelie = Movie.objects.create(
+            name='Amélie', description='A shy waitress in Paris.',
+            price=5, image_url='https://example.com/amelie.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, term):
+        return [movie.name for movie in search.search(Movie.objects.all(), term)]
+
+    def test_matches_prefixes_and_ignores_accents_and_operators(self):
+        self.assertEqual(self.names('ali'), ['Alien'])
+        self.assertEqual(self.names('amelie'), ['Amélie'])
+        self.assertEqual(self.names('shy PARIS'), ['Amélie'])
+        self.assertEqual(self.names('NOT "alien'), [])
+        self.assertEqual(self.names('!!!'), [])
+
+    def test_title_hits_rank_above_description_hits(self):
+        self.assertEqual(self.names('space'), ['Space Jam', 'Alien'])
+
+        # The catalog pages through search results best match first.
+        url = reverse('movies.index')
+        response = self.client.get(url, {'search': 'space', 'page_size': 1})
+        page = response.context['template_data']['page']
+        self.assertEqual([movie.name for movie in page], ['Space Jam'])
+        response = self.client.get(url, {'search': 'space', 'page_size': 1,
+                                         'cursor': page.next_cursor})
+        page = response.context['template_data']['page']
+        self.assertEqual([movie.name for movie in page], ['Alien'])
+        self.assertIsNone(page.next_cursor)
+
+        data = self.client.get(reverse('api.movies'), {'search': 'space', 'fields': 'name'}).json()
+        self.assertEqual([movie['name'] for movie in data['results']], ['Space Jam', 'Alien'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.alien.name = 'Aliens'
+        self.alien.save()
+        self.assertEqual(self.names('aliens'), ['Aliens'])
+        self.alien.delete()
+        self.assertEqual(self.names('alien'), [])
+
+    def test_rebuild_command_catches_up_with_bulk_writes(self):
+        # update() skips the signals that keep the index in step.
+        Movie.objects.filter(id=self.space_jam.id).update(name='Zardoz')
+        self.assertEqual(self.names('zardoz'), [])
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 movies', out.getvalue())
+        self.assertEqual(self.names('zardoz'), ['Zardoz'])
+        self.assertEqual(self.names('jam'), [])
+
+
+class RatingAggregateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'critic{n}') for n in range(3)]
+        cls.heat = Movie.objects.create(name='Heat', price=5, description='A heist.',
+                                        image_url='https://example.com/heat.jpg')
+        cls.ronin = Movie.objects.create(name='Ronin', price=5, description='A chase.',
+                                         image_url='https://example.com/ronin.jpg')
+
+    def aggregates(self, movie):
+        movie.refresh_from_db()
+        return movie.review_count, movie.rating_sum, movie.rating_histogram
+
+    def review(self, movie, user, rating):
+        return Review.objects.create(movie=movie, user=user, rating=rating, comment='Fine.')
+
+    def test_create_edit_move_and_delete(self):
+        first = self.review(self.heat, self.users[0], 4)
+        self.review(self.heat, self.users[1], 2)
+        self.assertEqual(self.aggregates(self.heat),
+                         (2, 6, {1: 0, 2: 1, 3: 0, 4: 1, 5: 0}))
+
+        first.rating = 5
+        first.save()
+        self.assertEqual(self.aggregates(self.heat),
+                         (2, 7, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}))
+
+        # Moving a review takes its stars along to the other movie.
+        first = Review.objects.get(id=first.id)
+        first.movie = self.ronin
+        first.rating = 3
+        first.save()
+        self.assertEqual(self.aggregates(self.heat),
+                         (1, 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}))
+        self.assertEqual(self.aggregates(self.ronin),
+                         (1, 3, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0}))
+
+        first.delete()
+        self.assertEqual(self.aggregates(self.ronin),
+                         (0, 0, {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}))
+
+    def test_saving_a_stale_instance_keeps_the_aggregates(self):
+        stale = Movie.objects.get(id=self.heat.id)
+        self.review(self.heat, self.users[0], 4)
+        stale.price = 6
+        stale.save()
+        stale.save(update_fields=['price', 'review_count'])
+        self.assertEqual(self.aggregates(self.heat),
+                         (1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}))
+        self.assertEqual(self.heat.price, 6)
+
+    def test_reconcile_ratings_repairs_drift(self):
+        self.review(self.heat, self.users[0], 4)
+        Movie.objects.filter(id=self.heat.id).update(review_count=9, rating_5_count=3)
+        out = io.StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn('Corrected rating aggregates on 1 movies', out.getvalue())
+        self.assertEqual(self.aggregates(self.heat),
+                         (1, 4, {1: 0, 2: 0, 3: 0, 4: 1, 5: 0}))
+        self.assertEqual(self.aggregates(self.ronin)[0], 0)
+
+    def test_admin_sorts_by_average_not_total(self):
+        for user in self.users:
+            self.review(self.heat, user, 2)
+        self.review(self.ronin, self.users[0], 5)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        # average_rating is the fourth column of list_display.
+        response = self.client.get(reverse('admin:movies_movie_changelist'), {'o': '-4'})
+        names = [movie.name for movie in response.context['cl'].result_list]
+        self.assertEqual(names, ['Ronin', 'Heat'])
+
+
+class CatalogPageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(
+            name='Heat', price=8, description='A heist.',
+            image_url='https://example.com/heat.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_request_is_served_from_cache(self):
+        url = reverse('movies.index')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertContains(response, 'Heat')
+
+    def test_query_string_is_part_of_the_key(self):
+        self.client.get(reverse('movies.index'), {'genre': 'DRAMA'})
+        response = self.client.get(reverse('movies.index'), {'genre': 'ACTION'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_movie_change_invalidates_cached_pages(self):
+        url = reverse('movies.index')
+        self.client.get(url)
+        self.movie.name = 'Heat (1995)'
+        self.movie.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Heat (1995)')
+
+    def test_generation_does_not_restart_at_a_fixed_value(self):
+        first = page_cache.generation()
+        # As after a restart or an eviction of the counter.
+        cache.clear()
+        self.assertNotEqual(page_cache.generation(), first)
+
+    def test_visitors_share_pages_with_forms_but_get_their_own_csrf_token(self):
+        url = reverse('movies.show', args=[self.movie.id])
+        clients = [Client(enforce_csrf_checks=True) for _ in range(2)]
+        responses = [client.get(url) for client in clients]
+        self.assertEqual([response['X-Cache'] for response in responses], ['MISS', 'HIT'])
+        cookies = [client.cookies[settings.CSRF_COOKIE_NAME].value for client in clients]
+        self.assertNotEqual(cookies[0], cookies[1])
+        for client, response in zip(clients, responses):
+            self.assertNotContains(response, page_cache.CSRF_PLACEHOLDER)
+            token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"',
+                              response.content.decode()).group(1)
+            added = client.post(reverse('cart.add', args=[self.movie.id]),
+                                {'quantity': '1', 'csrfmiddlewaretoken': token})
+            self.assertEqual(added.status_code, 302)
+
+    def test_users_do_not_share_cached_pages(self):
+        url = reverse('movies.index')
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user('cinephile'))
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Logout (cinephile)')
+
+
+class PosterOriginHandler(BaseHTTPRequestHandler):
+    """Stand-in for a remote poster host, serving one 1200x1800 PNG."""
+    etag = '"poster-v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        if not self.path.startswith('/poster.png'):
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 1800), 'navy').save(buffer, 'PNG')
+        body = buffer.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PosterCacheTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PosterOriginHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.origin = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        PosterOriginHandler.requests.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(POSTER_CACHE_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_fetch_stores_resized_copy(self):
+        url = f'{self.origin}/poster.png'
+        self.assertEqual(posters.fetch(url), 'stored')
+        path, metadata = posters.cached_file(url)
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (600, 900))
+            self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(metadata['etag'], PosterOriginHandler.etag)
+
+    def test_revalidation_uses_etag(self):
+        url = f'{self.origin}/poster.png'
+        posters.fetch(url)
+        self.assertEqual(posters.fetch(url), 'not-modified')
+        self.assertEqual(len(PosterOriginHandler.requests), 2)
+
+    def test_view_redirects_until_cached_then_serves_locally(self):
+        url = f'{self.origin}/poster.png'
+        proxy_url = posters.poster_url(url)
+        with self.settings(POSTER_CACHE_REFRESH=3600):
+            posters.fetch(url)
+            response = self.client.get(proxy_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age=', response['Cache-Control'])
+
+        response = self.client.get(proxy_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        missing = f'{self.origin}/poster.png?uncached'
+        with mock.patch.object(posters, 'schedule_fetch') as schedule_fetch:
+            response = self.client.get(posters.poster_url(missing))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], missing)
+        schedule_fetch.assert_called_once_with(missing)
+
+    def test_tampered_token_is_rejected(self):
+        token = posters.poster_url(f'{self.origin}/poster.png').split('/')[-2]
+        response = self.client.get(reverse('movies.poster', args=[token[:-1] + 'x']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_least_recently_served_posters_are_evicted(self):
+        first, second = f'{self.origin}/poster.png', f'{self.origin}/poster.png?copy'
+        posters.fetch(first)
+        size = posters.read_metadata(first)['size']
+        with self.settings(POSTER_CACHE_MAX_BYTES=size + size // 2):
+            posters.fetch(second)
+        self.assertIsNone(posters.cached_file(first))
+        self.assertIsNotNone(posters.cached_file(second))
+
+
+@override_settings(MOVIE_IMAGE_RENDITIONS={'thumbnail': (40, 40), 'card': (80, 80)})
+class ImageRenditionTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(MEDIA_ROOT=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, size=(200, 100), color='red'):
+        data = io.BytesIO()
+        Image.new('RGB', size, color).save(data, 'PNG')
+        return SimpleUploadedFile(name, data.getvalue(), content_type='image/png')
+
+    def create(self, name='Heat', **fields):
+        return Movie.objects.create(name=name, price=10, description='-', **fields)
+
+    def assertStored(self, renditions, exists=True):
+        names = images.rendition_files(renditions)
+        self.assertEqual(len(names), 4)
+        for name in names:
+            self.assertEqual(default_storage.exists(name), exists, name)
+
+    def test_upload_generates_renditions_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = self.create(image=self.upload('heat.png'))
+        movie.refresh_from_db()
+        renditions = movie.image_renditions
+        self.assertEqual(renditions['source'], movie.image.name)
+        self.assertEqual((renditions['card']['width'], renditions['card']['height']), (80, 40))
+        self.assertStored(renditions)
+        self.assertTrue(images.rendition_urls(movie, 'thumbnail')['webp'].endswith('.webp'))
+
+    def test_replacing_or_clearing_the_image_deletes_old_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = self.create(image=self.upload('heat.png'))
+        old = movie.image_renditions
+        movie.image = self.upload('heat-2.png', color='blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.save()
+        self.assertStored(old, exists=False)
+        self.assertStored(movie.image_renditions)
+
+        current = movie.image_renditions
+        movie.image = None
+        movie.image_url = 'https://example.com/heat.jpg'
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.save()
+        movie.refresh_from_db()
+        self.assertEqual(movie.image_renditions, {})
+        self.assertStored(current, exists=False)
+
+    def test_deleting_the_movie_deletes_its_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = self.create(image=self.upload('heat.png'))
+        renditions = movie.image_renditions
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.delete()
+        self.assertStored(renditions, exists=False)
+
+    def test_oversized_upload_is_logged_not_raised(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000), \
+                self.assertLogs('movies.signals', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            movie = self.create(image=self.upload('bomb.png'))
+        movie.refresh_from_db()
+        self.assertEqual(movie.image_renditions, {})
+
+    def test_catalog_import_drops_renditions_of_replaced_images(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = self.create(image=self.upload('heat.png'))
+        old = movie.image_renditions
+        row = {'name': 'Heat', 'price': '10', 'description': '-', 'image': 'movie_images/other.png'}
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_io.import_rows([(2, row)])
+        movie.refresh_from_db()
+        self.assertEqual(movie.image.name, 'movie_images/other.png')
+        self.assertEqual(movie.image_renditions, {})
+        self.assertStored(old, exists=False)
+
+    def test_backfill_command(self):
+        # Without running the on-commit callbacks, nothing is rendered.
+        movies = [self.create(name=f'Movie {n}', image=self.upload(f'{n}.png')) for n in range(2)]
+        self.create(name='Remote', image_url='https://example.com/remote.jpg')
+        out = io.StringIO()
+        call_command('generate_image_renditions', stdout=out)
+        self.assertIn('Rendered 2 movies (0 failed)', out.getvalue())
+        for movie in movies:
+            movie.refresh_from_db()
+            self.assertStored(movie.image_renditions)
+
+        out = io.StringIO()
+        call_command('generate_image_renditions', stdout=out)
+        self.assertIn('Rendered 0 movies (0 failed)', out.getvalue())
+
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            call_command('generate_image_renditions', str(movies[0].id), '--force',
+                         stdout=out, stderr=err)
+        self.assertIn('Rendered 0 movies (1 failed)', out.getvalue())
+        self.assertIn(f'Movie {movies[0].id}', err.getvalue())
+
+
+class CatalogImportExportTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Movie.objects.create(name='Heat', price=8, description='A heist.',
+                             image_url='https://example.com/heat.jpg')
+
+    def write(self, name, text):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_import_upserts_by_name_and_reports_invalid_rows(self):
+        path = self.write('movies.csv', (
+            'name,price,description,genre,image_url\n'
+            'Heat,9.50,A heist in LA.,Action,https://example.com/heat.jpg\n'
+            'Alien,7,In space.,sci-fi,https://example.com/alien.jpg\n'
+            'Bad Genre,5,,Western,https://example.com/x.jpg\n'
+            'No Image,5,,DRAMA,\n'
+        ))
+        out, err = io.StringIO(), io.StringIO()
+        with self.assertNumQueries(7):
+            call_command('import_movies', path, stdout=out, stderr=err)
+        self.assertIn('1 created, 1 updated, 0 unchanged, 2 invalid', out.getvalue())
+        self.assertIn("Line 4: unknown genre 'Western'", err.getvalue())
+        self.assertIn('Line 5: either image or image_url is required', err.getvalue())
+
+        heat = Movie.objects.get(name='Heat')
+        self.assertEqual((str(heat.price), heat.genre), ('9.50', 'ACTION'))
+        self.assertEqual(Movie.objects.get(name='Alien').genre, 'SCIFI')
+        self.assertEqual([m.name for m in search.search(Movie.objects.all(), 'space')], ['Alien'])
+
+    def test_export_round_trips_through_import(self):
+        path = f'{self.directory}/movies.jsonl'
+        call_command('export_movies', path, stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('import_movies', path, '--key', 'id', stdout=out)
+        self.assertIn('1 rows', out.getvalue())
+        self.assertIn('0 created, 0 updated, 1 unchanged, 0 invalid', out.getvalue())
+
+    def test_import_from_stdin_leaves_it_open(self):
+        stdin = io.StringIO('name,price,description,genre,image_url\n'
+                            'Alien,7,In space.,SCIFI,https://example.com/alien.jpg\n')
+        with mock.patch('sys.stdin', stdin):
+            call_command('import_movies', '-', stdout=io.StringIO())
+        self.assertFalse(stdin.closed)
+        self.assertTrue(Movie.objects.filter(name='Alien').exists())
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write('movies.jsonl',
+                          '{"name": "Alien", "price": "7", "image_url": "https://example.com/a.jpg"}\n')
+        call_command('import_movies', path, '--dry-run', stdout=io.StringIO())
+        self.assertFalse(Movie.objects.filter(name='Alien').exists())
+
+
+class CoPurchaseRecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer')
+        cls.movies = [
+            Movie.objects.create(name=name, price=10, description=name,
+                                 image_url=f'https://example.com/{name}.jpg')
+            for name in ('Alien', 'Aliens', 'Predator', 'Blockbuster', 'Heat')]
+
+    def setUp(self):
+        cache.clear()
+
+    def order(self, *movies):
+        order = Order.objects.create(user=self.buyer, total=10 * len(movies))
+        Item.objects.bulk_create(Item(order=order, movie=movie, price=10, quantity=1)
+                                 for movie in movies)
+        return order
+
+    def names(self, movie):
+        return [neighbor.name for neighbor in recommendations.neighbors(movie)]
+
+    def test_neighbors_are_ranked_by_cosine_similarity(self):
+        alien, aliens, predator, blockbuster, heat = self.movies
+        self.order(alien, aliens)
+        self.order(alien, aliens, blockbuster)
+        self.order(alien, predator)
+        # Blockbuster shares as many orders with Alien as Aliens does but
+        # is in every basket, so it ranks lower.
+        self.order(alien, blockbuster)
+        self.order(blockbuster, heat)
+        self.order(blockbuster, heat)
+        self.order(blockbuster)
+
+        counts = recommendations.refresh()
+        self.assertEqual(counts['movies'], 5)
+        self.assertEqual(self.names(alien), ['Aliens', 'Predator', 'Blockbuster'])
+        self.assertEqual(self.names(heat), ['Blockbuster'])
+        top = MovieNeighbor.objects.get(movie=alien, rank=0)
+        self.assertEqual(top.co_purchases, 2)
+        self.assertAlmostEqual(top.score, 2 / (4 * 2) ** 0.5)
+
+    def test_refresh_only_recomputes_movies_bought_since(self):
+        alien, aliens, predator, blockbuster, heat = self.movies
+        self.order(alien, aliens)
+        recommendations.refresh()
+        self.assertEqual(recommendations.refresh(), {'movies': 0, 'neighbors': 0})
+
+        order = self.order(heat, predator)
+        counts = recommendations.refresh(top_k=3)
+        self.assertEqual(counts['movies'], 2)
+        self.assertEqual(RecommendationState.objects.get().last_order_id, order.id)
+        self.assertEqual(self.names(heat), ['Predator'])
+        self.assertEqual(self.names(alien), ['Aliens'])
+
+    def test_full_refresh_drops_movies_without_orders(self):
+        alien, aliens = self.movies[:2]
+        order = self.order(alien, aliens)
+        recommendations.refresh()
+        order.delete()
+        recommendations.refresh(full=True)
+        self.assertFalse(MovieNeighbor.objects.exists())
+
+    def test_detail_page_shows_neighbors(self):
+        alien, aliens = self.movies[:2]
+        self.order(alien, aliens)
+        response = self.client.get(reverse('movies.show', args=[alien.id]))
+        self.assertNotContains(response, 'Customers who bought this also bought')
+
+        call_command('refresh_recommendations', stdout=io.StringIO())
+        response = self.client.get(reverse('movies.show', args=[alien.id]))
+        self.assertContains(response, 'Customers who bought this also bought')
+        self.assertEqual(response.context['template_data']['also_bought'], [aliens])
+
+
+class PersonalRecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = {
+            name: Movie.objects.create(name=name, price=10, description=name,
+                                       image_url=f'https://example.com/{name}.jpg')
+            for name in ('Alien', 'Aliens', 'Predator', 'Notebook', 'Titanic')}
+        cls.users = {name: User.objects.create_user(name) for name in ('ann', 'bob', 'cy', 'dee')}
+
+    def rate(self, user, **ratings):
+        for name, rating in ratings.items():
+            Review.objects.create(user=self.users[user], movie=self.movies[name],
+                                  comment='-', rating=rating)
+
+    def names(self, user):
+        return [movie.name for movie in recommendations.for_user(self.users[user])]
+
+    def test_recommends_movies_liked_by_users_with_similar_ratings(self):
+        self.rate('ann', Alien=5, Aliens=5, Notebook=1, Predator=4)
+        self.rate('bob', Alien=4, Aliens=5, Notebook=2, Titanic=1)
+        self.rate('cy', Alien=5, Notebook=1)
+        self.rate('dee', Notebook=5, Titanic=5)
+
+        counts = recommendations.refresh_personal()
+        self.assertEqual(counts['users'], 4)
+        # Cy agrees with Ann and Bob: more sci-fi, no romance.
+        self.assertEqual(self.names('cy'), ['Aliens'])
+        # Only Ann rated Predator: too little evidence to relate it to anything.
+        self.assertEqual(self.names('bob'), [])
+        # Reviewed movies are never recommended.
+        self.assertNotIn('Alien', self.names('ann'))
+
+    def test_neutral_and_removed_reviews_drop_the_feed(self):
+        self.rate('ann', Alien=5, Aliens=5)
+        self.rate('bob', Alien=5, Aliens=5)
+        self.rate('cy', Alien=5)
+        recommendations.refresh_personal()
+        self.assertEqual(self.names('cy'), ['Aliens'])
+
+        Review.objects.filter(user=self.users['cy']).update(rating=3)
+        recommendations.refresh_personal()
+        self.assertFalse(UserRecommendation.objects.filter(user=self.users['cy']).exists())
+
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = {}
+        for name, reviews in (('The Dark Knight', 5), ('Dark City', 1), ('Darkman', 9),
+                              ('Amélie', 2), ('Heat', 0)):
+            cls.movies[name] = Movie.objects.create(
+                name=name, price=10, description=name, review_count=reviews,
+                image_url='https://example.com/poster.jpg')
+
+    def setUp(self):
+        cache.clear()
+        autocomplete._state.update(index=None, rebuilding=False)
+        autocomplete.build()
+
+    def names(self, term):
+        return [result['name'] for result in autocomplete.suggest(term)]
+
+    def test_matches_name_and_word_prefixes(self):
+        # Names starting with the prefix first, then by number of reviews.
+        self.assertEqual(self.names('dark'), ['Darkman', 'Dark City', 'The Dark Knight'])
+        self.assertEqual(self.names('  DARK   c'), ['Dark City'])
+        self.assertEqual(self.names('kni'), ['The Dark Knight'])
+        self.assertEqual(self.names('ame'), ['Amélie'])
+        self.assertEqual(self.names('zzz'), [])
+        self.assertEqual(self.names('?!'), [])
+
+    def test_endpoint_does_not_query_the_database(self):
+        url = reverse('movies.autocomplete')
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'hea'})
+        self.assertEqual(response.json(), {'results': [
+            {'id': self.movies['Heat'].id, 'name': 'Heat'}]})
+
+    def test_movie_changes_reload_the_index(self):
+        self.assertEqual(self.names('heat'), ['Heat'])
+        with mock.patch.object(autocomplete, '_schedule_rebuild',
+                               side_effect=autocomplete.build) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                movie = self.movies['Heat']
+                movie.name = 'Heathers'
+                movie.save()
+            # The first lookup after the change still answers from the old
+            # index and reloads it (here synchronously).
+            self.assertEqual(self.names('heat'), ['Heat'])
+            rebuild.assert_called_once()
+        self.assertEqual(self.names('heat'), ['Heathers'])
+
+    def test_first_index_is_built_in_the_background(self):
+        autocomplete._state.update(index=None, rebuilding=False)
+        with mock.patch.object(autocomplete, '_schedule_rebuild') as rebuild:
+            self.assertEqual(self.names('heat'), [])
+            self.assertEqual(self.names('heat'), [])
+        rebuild.assert_called_once()
+
+
+@override_settings(MOVIES_PRICE_BAND_EDGES=[5, 10])
+class FacetedBrowsingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, genre, price in (('Alien', 'SCIFI', '4.99'), ('Heat', 'ACTION', '9.99'),
+                                   ('Ronin', 'ACTION', '12.00'), ('Up', 'FAMILY', '5.00'),
+                                   ('Dune', 'SCIFI', '15.50')):
+            Movie.objects.create(name=name, genre=genre, price=price, description=name,
+                                 image_url='https://example.com/poster.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **params):
+        response = self.client.get(reverse('movies.index'), params)
+        data = response.context['template_data']
+        names = [movie.name for movie in data['movies']]
+        genres = {genre['code']: genre['count'] for genre in data['genre_facets'] if genre['count']}
+        bands = [band['count'] for band in data['price_facets']]
+        return names, genres, bands
+
+    def test_filters_combine_and_counts_ignore_their_own_facet(self):
+        names, genres, bands = self.get()
+        self.assertEqual(names, ['Alien', 'Dune', 'Heat', 'Ronin', 'Up'])
+        self.assertEqual(genres, {'ACTION': 2, 'FAMILY': 1, 'SCIFI': 2})
+        self.assertEqual(bands, [1, 2, 2])
+
+        names, genres, bands = self.get(genre=['ACTION', 'SCIFI'], min_price='5', max_price='10')
+        self.assertEqual(names, ['Heat'])
+        # Genres are counted within the price range, bands within the genres.
+        self.assertEqual(genres, {'ACTION': 1, 'FAMILY': 1})
+        self.assertEqual(bands, [1, 1, 2])
+
+        names, genres, bands = self.get(search='dune', min_price='bogus', genre='NOPE')
+        self.assertEqual(names, ['Dune'])
+        self.assertEqual(genres, {'SCIFI': 1})
+
+    def test_counts_take_one_query_per_facet_and_are_cached(self):
+        url = reverse('movies.index')
+        # movies, genre counts, price band counts
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'genre': 'ACTION', 'page_size': 1})
+        cursor = response.context['template_data']['page'].next_cursor
+        with self.assertNumQueries(1):
+            self.client.get(url, {'genre': 'ACTION', 'page_size': 1, 'cursor': cursor})
+
+        Movie.objects.create(name='Ran', genre='ACTION', price='8.00', description='-',
+                             image_url='https://example.com/poster.jpg')
+        _, genres, _ = self.get(genre='ACTION', page_size=1, cursor=cursor)
+        self.assertEqual(genres['ACTION'], 3)
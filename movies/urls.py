@@ -3,6 +3,8 @@ from . import views
 urlpatterns = [
     path('', views.index, name='movies.index'),
     path('<int:id>/', views.show, name='movies.show'),
+    path('autocomplete/', views.autocomplete, name='movies.autocomplete'),
+    path('poster/<str:token>/', views.poster, name='movies.poster'),
     path('<int:id>/review/create/', views.create_review, name='movies.create_review'),
     path('<int:id>/review/<int:review_id>/edit/', views.edit_review, name='movies.edit_review'),
     path('<int:id>/review/<int:review_id>/delete/', views.delete_review, name='movies.delete_review'),
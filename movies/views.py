@@ -1,46 +1,113 @@
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponseNotModified, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from .models import Movie, Review
+from . import facets, posters, recommendations, search
+from .autocomplete import suggest
 from django.contrib.auth.decorators import login_required
+from moviesstore.pagination import get_page_size, paginate
+from moviesstore.page_cache import cache_catalog_page
 
+
+@cache_catalog_page
 def index(request):
     """
-    Display a list of movies.
-    Optionally filter by 'search' and 'genre' GET parameters.
+    Display a page of movies ordered by (name, id), or best match first
+    when searching. Optionally filter by the 'search' GET parameter, any
+    number of 'genre' parameters and a 'min_price' (inclusive) to
+    'max_price' (exclusive) range; movies.facets counts the matches per
+    genre and price band. The 'cursor' parameter selects the page (keyset
+    pagination, see moviesstore.pagination).
     """
     search_term = request.GET.get('search', '')
-    genre_filter = request.GET.get('genre', '')
+    genres = facets.parse_genres(request.GET.getlist('genre'))
+    min_price = facets.parse_price(request.GET.get('min_price'))
+    max_price = facets.parse_price(request.GET.get('max_price'))
 
     # Start with all movies
     movies = Movie.objects.all()
+    ordering = ('name', 'id')
 
-    # Filter by search term if provided
+    # Filter by search term if provided (full-text index lookup), most
+    # relevant first
     if search_term:
-        movies = movies.filter(name__icontains=search_term)
+        movies = search.search(movies, search_term)
+        ordering = search.RANK_ORDERING
+
+    # Filter by the selected genres and price range
+    movies = facets.filter_movies(movies, genres, min_price, max_price)
 
-    # Filter by genre if provided (and not blank)
-    if genre_filter:
-        movies = movies.filter(genre=genre_filter)
+    page_size = get_page_size(request, settings.MOVIES_PAGE_SIZE, settings.MOVIES_MAX_PAGE_SIZE)
+    page = paginate(movies, ordering, request.GET.get('cursor'), page_size)
 
-    # Pass available genre choices to the template
+    genre_facets, price_facets = facets.options(search_term, genres, min_price, max_price)
     template_data = {
         'title': 'Movies',
-        'movies': movies,
-        'genres': Movie.GENRE_CHOICES,  # e.g. [('ACTION','Action'), ('COMEDY','Comedy'), ...]
-        'selected_genre': genre_filter, # to mark the dropdown as "selected"
+        'movies': page.object_list,
+        'page': page,
+        'genre_facets': genre_facets,   # every genre with its count and selection
+        'price_facets': price_facets,   # every price band with its count
+        'selected_genres': genres,
+        'min_price': min_price,
+        'max_price': max_price,
         'search_term': search_term,     # so we can preserve search text
     }
     return render(request, 'movies/index.html', {'template_data': template_data})
 
+# The add-to-cart and review forms embed a CSRF token.
+@cache_catalog_page
 def show(request, id):
     """
     Display details of a specific movie.
     """
     movie = get_object_or_404(Movie, id=id)
-    reviews = Review.objects.filter(movie=movie)
+    # Authors come in with the reviews (one JOIN instead of a query per
+    # review); reviews are paged newest first on (created_date, id).
+    reviews = Review.objects.filter(movie=movie).select_related('user')
+    page = paginate(reviews, ('-created_date', '-id'), request.GET.get('cursor'),
+                    settings.REVIEWS_PAGE_SIZE)
 
-    template_data = {'title': movie.name, 'movie': movie, 'reviews': reviews}
+    template_data = {'title': movie.name, 'movie': movie, 'reviews': page.object_list, 'page': page,
+                     'also_bought': recommendations.neighbors(movie)}
     return render(request, 'movies/show.html', {'template_data': template_data})
 
+def autocomplete(request):
+    """
+    Suggestions for the search box as JSON: the movies whose name, or a
+    word in it, starts with ?q=. Served from the in-memory index in
+    movies.autocomplete, without a database query.
+    """
+    results = suggest(request.GET.get('q', ''))
+    response = JsonResponse({'results': results})
+    response['Cache-Control'] = f'public, max-age={settings.AUTOCOMPLETE_MAX_AGE}'
+    return response
+
+def poster(request, token):
+    """
+    Serve the locally cached copy of an external poster (Movie.image_url).
+    Until the background download has finished, redirect to the origin.
+    """
+    url = posters.url_from_token(token)
+    if url is None:
+        raise Http404('Unknown poster.')
+    cached = posters.cached_file(url)
+    if cached is None:
+        posters.schedule_fetch(url)
+        response = redirect(url)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    path, metadata = cached
+    etag = f'"{metadata["digest"]}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={settings.POSTER_CACHE_MAX_AGE}'
+    return response
+
 @login_required
 def create_review(request, id):
     if (request.method == 'POST'
@@ -53,7 +120,9 @@ def create_review(request, id):
         review.rating = int(request.POST['rating'])
         review.movie = movie
         review.user = request.user
-        review.save()
+        # The movie's rating aggregates are updated in the same transaction.
+        with transaction.atomic():
+            review.save()
         return redirect('movies.show', id=id)
     else:
         return redirect('movies.show', id=id)
@@ -73,7 +142,8 @@ def edit_review(request, id, review_id):
         review = Review.objects.get(id=review_id)
         review.comment = request.POST['comment']
         review.rating = int(request.POST['rating'])
-        review.save()
+        with transaction.atomic():
+            review.save()
         return redirect('movies.show', id=id)
     else:
         return redirect('movies.show', id=id)
@@ -81,6 +151,7 @@ def edit_review(request, id, review_id):
 @login_required
 def delete_review(request, id, review_id):
     review = get_object_or_404(Review, id=review_id, user=request.user)
-    review.delete()
+    with transaction.atomic():
+        review.delete()
     return redirect('movies.show', id=id)
 
@@ -1,9 +1,17 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.db.models import Count, F, FloatField, Prefetch, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from movies.models import Movie, Review
+from movies.templatetags.movie_images import movie_picture
+from cart import exports, sales
 from cart.models import Order, Item
 
 # Inline for Reviews in the Movie admin
@@ -16,7 +24,7 @@ class ReviewInline(admin.TabularInline):
 # Movie Admin Configuration
 class MovieAdmin(admin.ModelAdmin):
     save_on_top = True
-    list_display = ('name', 'price', 'genre', 'image_thumbnail')
+    list_display = ('name', 'price', 'genre', 'average_rating', 'review_count', 'image_thumbnail')
     search_fields = ('name', 'genre')
     list_filter = ('genre',)
     ordering = ('name',)
@@ -32,10 +40,8 @@ class MovieAdmin(admin.ModelAdmin):
         """
         Display a larger preview of the image (uploaded or via URL) on the detail page.
         """
-        if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" style="max-height: 200px;" />')
-        elif obj.image_url:
-            return mark_safe(f'<img src="{obj.image_url}" style="max-height: 200px;" />')
+        if obj.image or obj.image_url:
+            return movie_picture(obj, 'card', style='max-height: 200px;')
         return "No Image Available"
     image_preview.short_description = "Image Preview"
 
@@ -43,13 +49,26 @@ class MovieAdmin(admin.ModelAdmin):
         """
         Display a small thumbnail of the image for the list view.
         """
-        if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" style="max-height: 50px;" />')
-        elif obj.image_url:
-            return mark_safe(f'<img src="{obj.image_url}" style="max-height: 50px;" />')
+        if obj.image or obj.image_url:
+            return movie_picture(obj, 'thumbnail', style='max-height: 50px;')
         return "No Image"
     image_thumbnail.short_description = "Thumbnail"
 
+    def get_queryset(self, request):
+        # The mean of the stored aggregates, so the column sorts by average
+        # rating rather than by total stars (NULL for unreviewed movies).
+        return super().get_queryset(request).annotate(
+            avg_rating=Cast('rating_sum', FloatField()) / NullIf('review_count', 0))
+
+    @admin.display(description='Avg Rating', ordering='avg_rating')
+    def average_rating(self, obj):
+        """
+        Average rating from the stored aggregates (no per-row GROUP BY).
+        """
+        if obj.average_rating is None:
+            return "-"
+        return f"{obj.average_rating:.1f}"
+
 admin.site.register(Movie, MovieAdmin)
 
 # Review Admin Configuration
@@ -94,27 +113,85 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline]
     autocomplete_fields = ['user']
     list_select_related = ('user',)
+    actions = ['export_csv']
+    # Adds a "Sales dashboard" link above the changelist.
+    change_list_template = 'admin/cart/order/change_list.html'
+    dashboard_periods = (7, 30, 90, 365)
 
     def user_link(self, obj):
         url = reverse("admin:auth_user_change", args=[obj.user.pk])
         return mark_safe(f'<a href="{url}">{obj.user.username}</a>')
     user_link.short_description = 'User'
 
-    @admin.display(description='Total Amount')
+    def get_queryset(self, request):
+        """
+        Compute the per-order totals in the changelist query itself and
+        fetch every listed order's items (with movie names) in one more
+        query, instead of several queries per row.
+        """
+        items = Item.objects.select_related('movie').only(
+            'id', 'order_id', 'quantity', 'movie__id', 'movie__name')
+        return (super().get_queryset(request)
+                .annotate(
+                    _total_amount=Coalesce(Sum(F('items__price') * F('items__quantity')), 0),
+                    _item_count=Count('items'),
+                )
+                .prefetch_related(Prefetch('items', queryset=items)))
+
+    @admin.display(description='Total Amount', ordering='_total_amount')
     def total_amount(self, obj):
-        return sum(item.price * item.quantity for item in obj.items.all())
+        return obj._total_amount
 
+    @admin.display(description='Item Count', ordering='_item_count')
     def item_count(self, obj):
-        return obj.items.count()
-    item_count.short_description = 'Item Count'
+        return obj._item_count
 
+    @admin.display(description='Items in Order')
     def item_summary(self, obj):
         items = obj.items.all()
         if not items:
             return "No items"
         summary = "<br>".join([f"{item.movie.name} (Qty: {item.quantity})" for item in items])
         return mark_safe(summary)
-    item_summary.short_description = 'Items in Order'
+
+    @admin.action(description='Export selected orders with their items as CSV')
+    def export_csv(self, request, queryset):
+        """
+        Stream one CSV row per item. With "select all", the changelist's
+        date filters carry over into the export query.
+        """
+        items = exports.order_items(orders=queryset)
+        response = StreamingHttpResponse(exports.stream_csv(items), content_type='text/csv')
+        filename = f"orders-{timezone.localdate():%Y-%m-%d}.csv"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def get_urls(self):
+        dashboard = path('sales-dashboard/', self.admin_site.admin_view(self.sales_dashboard),
+                         name='cart_order_sales_dashboard')
+        return [dashboard] + super().get_urls()
+
+    def sales_dashboard(self, request):
+        """
+        Revenue per genre per day and the week's top movies, read from the
+        daily rollup tables (cart.sales), never from the Item table.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in self.dashboard_periods:
+            days = 30
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales dashboard',
+            'opts': self.model._meta,
+            'periods': self.dashboard_periods,
+            **sales.dashboard(days),
+        }
+        return TemplateResponse(request, 'admin/cart/order/sales_dashboard.html', context)
 
 admin.site.register(Order, OrderAdmin)
 
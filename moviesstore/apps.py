@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MoviesstoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'moviesstore'
+
+    def ready(self):
+        # Register the signal handlers that invalidate cached pages.
+        from . import signals  # noqa: F401
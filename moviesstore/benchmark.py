@@ -0,0 +1,274 @@
+"""
+Benchmark suite for the storefront's hot paths.
+
+seed() fills the database with a synthetic catalog (movies, reviews,
+users with order history) using bulk inserts, then rebuilds the search
+index and rating aggregates that the signal handlers would normally keep
+up to date, and the co-purchase recommendations. Generated rows are
+recognisable by BENCH_PREFIX.
+
+run() requests each scenario through the Django test client and measures
+latency and SQL query count, over every database alias (read replicas
+included). Each request runs in its own transaction, which is rolled
+back: whatever it wrote (carts, orders, sessions) is discarded, so the
+suite can run against a seeded development database repeatedly, and the
+SQLite write lock is only held for one request at a time. The page cache
+is invalidated before every request unless `cached` is set, so the
+numbers describe the views themselves.
+
+compare() checks results against a stored baseline: any extra query, or
+a p50 slower than the baseline by more than `tolerance`, is a regression.
+"""
+import math
+import platform
+import random
+import statistics
+import time
+import uuid
+from contextlib import ExitStack
+from decimal import Decimal
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cart.models import Cart, CartLine, Item, Order
+from home.featured import invalidate_pool
+from movies import autocomplete, ratings, recommendations, search
+from movies.models import Movie, Review
+
+from . import page_cache
+
+BENCH_PREFIX = 'bench-'
+
+WORDS = (
+    'night', 'city', 'dark', 'love', 'last', 'star', 'river', 'storm', 'silent', 'golden',
+    'shadow', 'king', 'queen', 'return', 'empire', 'secret', 'lost', 'winter', 'summer',
+    'fire', 'ice', 'dream', 'heart', 'stone', 'iron', 'glass', 'ghost', 'wild', 'blue',
+    'red', 'machine', 'garden', 'ocean', 'desert', 'mountain', 'island', 'journey', 'war',
+    'peace', 'hunter', 'game', 'road', 'train', 'house', 'mirror', 'door', 'song', 'dance',
+    'edge', 'light', 'echo', 'thunder', 'velvet', 'crimson', 'hidden', 'broken', 'final',
+)
+GENRES = [code for code, _ in Movie.GENRE_CHOICES]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _bulk_insert(model, objects, batch_size):
+    count = 0
+    for batch in _batches(objects, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def seed(movies=100_000, reviews=2_000_000, users=5_000, orders_per_user=5,
+         batch_size=5_000, random_seed=0, log=print):
+    """Insert a synthetic catalog and return the number of rows per model."""
+    rng = random.Random(random_seed)
+    start = time.perf_counter()
+
+    def sentence(low, high):
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+    password = make_password(None)
+    existing_users = User.objects.filter(username__startswith=BENCH_PREFIX).count()
+    user_count = _bulk_insert(User, (
+        User(username=f'{BENCH_PREFIX}user-{existing_users + n}', password=password)
+        for n in range(users)), batch_size)
+    user_ids = list(User.objects.filter(username__startswith=BENCH_PREFIX)
+                    .order_by('id').values_list('id', flat=True))
+    new_user_ids = user_ids[existing_users:]
+    log(f'users: {user_count} ({time.perf_counter() - start:.1f}s)')
+
+    movie_count = _bulk_insert(Movie, (
+        Movie(name=f'{sentence(1, 3).title()} {n}',
+              description=sentence(12, 40),
+              price=Decimal(rng.randint(199, 2999)) / 100,
+              genre=rng.choice(GENRES),
+              image_url=f'https://example.com/{BENCH_PREFIX}posters/{n}.jpg')
+        for n in range(movies)), batch_size)
+    movie_prices = dict(Movie.objects.filter(image_url__contains=f'/{BENCH_PREFIX}posters/')
+                        .values_list('id', 'price'))
+    movie_ids = list(movie_prices)
+    log(f'movies: {movie_count} ({time.perf_counter() - start:.1f}s)')
+
+    # Half of the reviews go to the top 1% of movies, like a real catalog
+    # where a few blockbusters collect most of them.
+    popular = movie_ids[:max(len(movie_ids) // 100, 1)]
+    review_count = _bulk_insert(Review, (
+        Review(user_id=rng.choice(user_ids),
+               movie_id=rng.choice(popular if rng.random() < 0.5 else movie_ids),
+               comment=sentence(3, 15), rating=rng.randint(1, 5))
+        for _ in range(reviews)), batch_size)
+    log(f'reviews: {review_count} ({time.perf_counter() - start:.1f}s)')
+
+    order_count = item_count = 0
+    for user_batch in _batches(new_user_ids, max(batch_size // max(orders_per_user, 1), 1)):
+        with transaction.atomic():
+            orders = []
+            lines = []
+            for user_id in user_batch:
+                for _ in range(orders_per_user):
+                    picks = rng.sample(movie_ids, min(rng.randint(1, 4), len(movie_ids)))
+                    quantities = [rng.randint(1, 3) for _ in picks]
+                    total = sum(int(movie_prices[m]) * q for m, q in zip(picks, quantities))
+                    orders.append(Order(user_id=user_id, total=total))
+                    lines.append(list(zip(picks, quantities)))
+            Order.objects.bulk_create(orders)
+            items = [Item(order=order, movie_id=movie_id, quantity=quantity,
+                          price=int(movie_prices[movie_id]))
+                     for order, order_lines in zip(orders, lines)
+                     for movie_id, quantity in order_lines]
+            Item.objects.bulk_create(items, batch_size=batch_size)
+        order_count += len(orders)
+        item_count += len(items)
+    log(f'orders: {order_count} with {item_count} items ({time.perf_counter() - start:.1f}s)')
+
+    # bulk_create skips the signal handlers; catch up on what they maintain.
+    search.rebuild_index()
+    ratings.recompute()
+    recommendations.refresh(full=True)
+    recommendations.refresh_personal()
+    invalidate_pool()
+    autocomplete.invalidate()
+    page_cache.invalidate()
+    log(f'search index, rating aggregates and recommendations rebuilt ({time.perf_counter() - start:.1f}s)')
+    return {'users': user_count, 'movies': movie_count, 'reviews': review_count,
+            'orders': order_count, 'items': item_count}
+
+
+def _fill_cart(user, movies):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    CartLine.objects.bulk_create((CartLine(cart=cart, movie=movie, quantity=1) for movie in movies),
+                                 ignore_conflicts=True)
+
+
+def scenarios():
+    """
+    Return [(name, prepare)] where prepare(client) sets up one iteration
+    and returns (method, url, data).
+    """
+    order = (Order.objects.filter(user__username__startswith=BENCH_PREFIX).order_by('id')
+             .select_related('user').first()
+             or Order.objects.order_by('id').select_related('user').first())
+    if order is None:
+        raise ValueError('No orders found; run seed_benchmark_data first.')
+    user = order.user
+    movie = Movie.objects.order_by('-review_count', 'id').first()
+    cart_movies = list(Movie.objects.order_by('id')[:3])
+    term = movie.name.split()[0]
+
+    def get(url):
+        return lambda client: ('get', url, None)
+
+    def logged_in(prepare):
+        def wrapped(client):
+            client.force_login(user)
+            return prepare(client)
+        return wrapped
+
+    def cart_page(client):
+        _fill_cart(user, cart_movies)
+        return 'get', reverse('cart.index'), None
+
+    def purchase(client):
+        _fill_cart(user, cart_movies)
+        return 'post', reverse('cart.purchase'), {'checkout_token': str(uuid.uuid4())}
+
+    index = reverse('movies.index')
+    return [
+        ('movies.index', get(index)),
+        ('movies.index.search', get(f'{index}?search={term}')),
+        ('movies.index.genre', get(f'{index}?genre={movie.genre}')),
+        ('movies.index.search_genre', get(f'{index}?search={term}&genre={movie.genre}')),
+        ('movies.show', get(reverse('movies.show', args=[movie.id]))),
+        ('home.index', get(reverse('home.index'))),
+        ('home.index.personal', logged_in(get(reverse('home.index')))),
+        ('cart.index', logged_in(cart_page)),
+        ('cart.purchase', logged_in(purchase)),
+        ('accounts.orders', logged_in(get(reverse('accounts.orders')))),
+    ]
+
+
+def _percentile(ordered, q):
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def run(iterations=20, warmup=2, only=None, cached=False, log=print):
+    """Measure every scenario and return the machine-readable results."""
+    results = {}
+    for name, prepare in scenarios():
+        if only and name not in only:
+            continue
+        timings = []
+        queries = status = None
+        for iteration in range(warmup + iterations):
+            client = Client(HTTP_HOST='localhost')
+            with transaction.atomic():
+                method, url, data = prepare(client)
+                if not cached:
+                    page_cache.invalidate()
+                with ExitStack() as stack:
+                    captured = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                                for alias in connections]
+                    start = time.perf_counter()
+                    response = getattr(client, method)(url, data)
+                    elapsed = time.perf_counter() - start
+                transaction.set_rollback(True)
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries = sum(len(context) for context in captured)
+                status = response.status_code
+        timings.sort()
+        results[name] = {
+            'status': status,
+            'queries': queries,
+            'min_ms': round(timings[0], 3),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(_percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+        }
+        log(f"{name:<28}{results[name]['p50_ms']:>10.1f} ms{queries:>6} queries")
+
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'iterations': iterations,
+            'cached': cached,
+            'movies': Movie.objects.count(),
+            'reviews': Review.objects.count(),
+            'orders': Order.objects.count(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2, min_delta_ms=1.0):
+    """Return a list of regression messages (empty if none)."""
+    regressions = []
+    for name, base in baseline['scenarios'].items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append(f"{name}: {current['queries']} queries (baseline {base['queries']})")
+        slower = current['p50_ms'] - base['p50_ms']
+        if slower > min_delta_ms and current['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {current['p50_ms']:.1f} ms "
+                               f"(baseline {base['p50_ms']:.1f} ms)")
+    return regressions
@@ -0,0 +1,119 @@
+"""
+Primary/replica database routing.
+
+With aliases listed in REPLICA_DATABASES, reads go to a randomly chosen
+replica and writes go to 'default' (the primary). A request is served
+entirely from the primary when:
+
+* it is not a safe method (POST checkouts, review forms, ...), so a view
+  that reads and then writes sees a consistent database;
+* it arrives within REPLICA_STICKY_SECONDS of a request by the same
+  browser that wrote something, so the user sees their own order or
+  review even if the replicas lag behind. PrimaryStickinessMiddleware
+  tracks this with a cookie.
+
+Sessions and auth are always read from the primary: they are small,
+written on login and must never be stale. So is everything outside a
+request (management commands, background threads, benchmark seeding),
+which often reads back rows it has just written.
+
+Migrations only run on the primary; replicas get the schema through
+replication like any other change.
+
+With REPLICA_DATABASES empty (the default) everything goes to 'default'.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PRIMARY_ONLY_APPS = {'admin', 'auth', 'contenttypes', 'sessions'}
+STICKY_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Per-request state: [pinned to primary, wrote to the primary].
+_state = contextvars.ContextVar('db_router_state', default=None)
+
+
+@contextmanager
+def request_scope(pinned=False):
+    state = [pinned, False]
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Send every read in the block to the primary."""
+    state = _state.get()
+    if state is None:
+        with request_scope(pinned=True):
+            yield
+        return
+    previous = state[0]
+    state[0] = True
+    try:
+        yield
+    finally:
+        state[0] = previous
+
+
+def primary_pinned():
+    state = _state.get()
+    return state is not None and state[0]
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        state = _state.get()
+        if (not replicas or state is None or state[0]
+                or model._meta.app_label in PRIMARY_ONLY_APPS):
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            state[1] = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+class PrimaryStickinessMiddleware:
+    """Pin unsafe and just-wrote requests to the primary database."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        pinned = request.method not in SAFE_METHODS
+        try:
+            pinned = pinned or float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pass
+
+        with request_scope(pinned) as state:
+            response = self.get_response(request)
+            wrote = state[1]
+        if wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + seconds)),
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,116 @@
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE movie (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price REAL NOT NULL);
+CREATE TABLE review (
+    id INTEGER PRIMARY KEY,
+    movie_id INTEGER NOT NULL REFERENCES movie(id),
+    rating INTEGER NOT NULL,
+    comment TEXT NOT NULL
+);
+CREATE INDEX review_movie ON review(movie_id);
+"""
+
+# sqlite3.connect's own default busy timeout, in seconds.
+STOCK_TIMEOUT = 5.0
+
+
+class Command(BaseCommand):
+    help = ('Measure SQLite read throughput while writes are in flight, with the '
+            'stock configuration and with SQLITE_PRAGMAS + BEGIN IMMEDIATE. '
+            'Runs against a scratch database, never the real one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--movies', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        configurations = [
+            ('stock', [], 'DEFERRED', STOCK_TIMEOUT),
+            ('tuned', [f'PRAGMA {name}={value}' for name, value in settings.SQLITE_PRAGMAS.items()],
+             'IMMEDIATE', settings.DATABASES['default']['OPTIONS'].get('timeout', STOCK_TIMEOUT)),
+        ]
+        self.stdout.write(f"{'config':<8}{'reads/s':>12}{'writes/s':>12}{'locked errors':>16}")
+        for name, pragmas, mode, timeout in configurations:
+            with tempfile.TemporaryDirectory() as directory:
+                path = Path(directory) / 'bench.sqlite3'
+                self.seed(path, options['movies'])
+                reads, writes, errors = self.run(path, pragmas, mode, timeout, options)
+            seconds = options['seconds']
+            self.stdout.write(f'{name:<8}{reads / seconds:>12.0f}{writes / seconds:>12.0f}{errors:>16}')
+
+    def seed(self, path, movies):
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT INTO movie (id, name, price) VALUES (?, ?, ?)',
+                         ((n, f'Movie {n}', 9.99) for n in range(1, movies + 1)))
+        conn.commit()
+        conn.close()
+
+    def connect(self, path, pragmas, timeout):
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                               check_same_thread=False)
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def run(self, path, pragmas, mode, timeout, options):
+        deadline = time.perf_counter() + options['seconds']
+        movies = options['movies']
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def reader():
+            conn = self.connect(path, pragmas, timeout)
+            done = errors = 0
+            while time.perf_counter() < deadline:
+                movie_id = random.randint(1, movies)
+                try:
+                    conn.execute('SELECT m.name, COUNT(r.id), AVG(r.rating) FROM movie m '
+                                 'LEFT JOIN review r ON r.movie_id = m.id WHERE m.id = ?',
+                                 (movie_id,)).fetchall()
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+            conn.close()
+            with lock:
+                counts['reads'] += done
+                counts['errors'] += errors
+
+        def writer():
+            conn = self.connect(path, pragmas, timeout)
+            done = errors = 0
+            while time.perf_counter() < deadline:
+                try:
+                    conn.execute(f'BEGIN {mode}')
+                    for _ in range(5):
+                        conn.execute('INSERT INTO review (movie_id, rating, comment) VALUES (?, ?, ?)',
+                                     (random.randint(1, movies), random.randint(1, 5), 'Great!'))
+                    conn.execute('COMMIT')
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+            conn.close()
+            with lock:
+                counts['writes'] += done
+                counts['errors'] += errors
+
+        threads = ([threading.Thread(target=reader) for _ in range(options['readers'])]
+                   + [threading.Thread(target=writer) for _ in range(options['writers'])])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counts['reads'], counts['writes'], counts['errors']
@@ -0,0 +1,45 @@
+import json
+import logging
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moviesstore import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Measure latency and query counts of the storefront pages and compare them '
+            'with a stored baseline. Seed data with seed_benchmark_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario (repeatable).')
+        parser.add_argument('--cached', action='store_true',
+                            help='Keep the catalog page cache warm between requests.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against results saved with --output.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed p50 slowdown against the baseline (0.2 = 20%%).')
+
+    def handle(self, *args, **options):
+        # Slow pages are the point here; don't log every one of them.
+        logging.getLogger('moviesstore.metrics').setLevel(logging.ERROR)
+        try:
+            results = benchmark.run(iterations=options['iterations'], warmup=options['warmup'],
+                                    only=options['scenarios'], cached=options['cached'],
+                                    log=self.stdout.write)
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f"Results written to {options['output']}.")
+
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+            regressions = benchmark.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
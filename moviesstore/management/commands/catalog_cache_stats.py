@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from moviesstore import page_cache
+
+
+class Command(BaseCommand):
+    help = ('Report the hit ratio of the catalog page cache. Counters are kept in the '
+            'cache itself, so use a shared backend (e.g. FileBasedCache) to see the '
+            'figures of the web workers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset the counters after reporting them.')
+
+    def handle(self, *args, **options):
+        stats = page_cache.stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} "
+            f"hit_ratio={stats['hit_ratio']:.1%}")
+        if options['reset']:
+            page_cache.reset_stats()
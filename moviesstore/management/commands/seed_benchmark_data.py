@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from moviesstore import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a large synthetic catalog for benchmark_storefront. '
+            'Use a scratch copy of the database: the rows are not removed afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=100_000)
+        parser.add_argument('--reviews', type=int, default=2_000_000)
+        parser.add_argument('--users', type=int, default=5_000)
+        parser.add_argument('--orders-per-user', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed; the same seed generates the same data.')
+
+    def handle(self, *args, **options):
+        counts = benchmark.seed(
+            movies=options['movies'], reviews=options['reviews'], users=options['users'],
+            orders_per_user=options['orders_per_user'], batch_size=options['batch_size'],
+            random_seed=options['seed'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            'Inserted ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'))
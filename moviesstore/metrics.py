@@ -0,0 +1,216 @@
+"""
+Per-route request metrics.
+
+RequestMetricsMiddleware measures every request and files it under the
+resolved URL name (movies.index, cart.purchase, ...):
+
+* wall time through the whole middleware stack,
+* number of SQL queries and time spent in them (on every database alias),
+* time spent rendering templates (through InstrumentedDjangoTemplates,
+  the TEMPLATES backend),
+* response size.
+
+The last METRICS_WINDOW samples per route are kept in memory, so p50, p95
+and p99 describe recent traffic of this process. They are shown to staff
+at /metrics/ and exported as Prometheus summaries at /metrics/prometheus/.
+Requests over METRICS_QUERY_BUDGET queries or over their route's latency
+budget (METRICS_ROUTE_LATENCY_BUDGETS, else METRICS_LATENCY_BUDGET
+seconds) are logged as warnings.
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+# (name, Prometheus metric, help text)
+METRICS = (
+    ('duration', 'moviesstore_request_duration_seconds', 'Wall time of the request.'),
+    ('queries', 'moviesstore_request_db_queries', 'SQL queries run by the request.'),
+    ('db_time', 'moviesstore_request_db_duration_seconds', 'Time spent in SQL queries.'),
+    ('template_time', 'moviesstore_request_template_duration_seconds',
+     'Time spent rendering templates.'),
+    ('size', 'moviesstore_response_size_bytes', 'Size of the response body.'),
+)
+QUANTILES = (0.5, 0.95, 0.99)
+UNRESOLVED = 'unresolved'
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+_routes = {}
+
+
+class RollingHistogram:
+    """The most recent `window` samples plus running totals."""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Nearest-rank quantile of the samples in the window."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def record(route, values):
+    with _lock:
+        histograms = _routes.get(route)
+        if histograms is None:
+            histograms = _routes[route] = {
+                name: RollingHistogram(settings.METRICS_WINDOW) for name, _, _ in METRICS}
+        for name, value in values.items():
+            histograms[name].add(value)
+
+
+def snapshot():
+    """
+    Return [{'route': ..., 'count': n, 'duration': {'p50': ..., 'p95': ...,
+    'p99': ..., 'sum': ...}, 'queries': {...}, ...}] sorted by route.
+    """
+    rows = []
+    with _lock:
+        for route in sorted(_routes):
+            histograms = _routes[route]
+            row = {'route': route, 'count': histograms['duration'].count}
+            for name, histogram in histograms.items():
+                row[name] = {f'p{round(q * 100)}': histogram.quantile(q) for q in QUANTILES}
+                row[name]['sum'] = histogram.sum
+            rows.append(row)
+    return rows
+
+
+def latency_budget(route):
+    """The number of seconds a request to `route` may take before it is logged."""
+    return settings.METRICS_ROUTE_LATENCY_BUDGETS.get(route, settings.METRICS_LATENCY_BUDGET)
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """Render the current metrics in the Prometheus text exposition format."""
+    rows = snapshot()
+    lines = []
+    for name, metric, help_text in METRICS:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} summary')
+        for row in rows:
+            route = _label(row['route'])
+            for q in QUANTILES:
+                value = row[name][f'p{round(q * 100)}']
+                lines.append(f'{metric}{{route="{route}",quantile="{q}"}} {value:g}')
+            lines.append(f'{metric}_sum{{route="{route}"}} {row[name]["sum"]:g}')
+            lines.append(f'{metric}_count{{route="{route}"}} {row["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class _RequestStats:
+    __slots__ = ('queries', 'db_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - start
+
+
+class RequestMetricsMiddleware:
+    """Record metrics for every request; keep it first in MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        route = match.view_name if match is not None else UNRESOLVED
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        record(route, {
+            'duration': duration,
+            'queries': stats.queries,
+            'db_time': stats.db_time,
+            'template_time': stats.template_time,
+            'size': size,
+        })
+
+        if (stats.queries > settings.METRICS_QUERY_BUDGET
+                or duration > latency_budget(route)):
+            logger.warning(
+                'Over budget: %s %s (%s) took %.0f ms with %d queries '
+                '(%.0f ms SQL, %.0f ms templates)',
+                request.method, request.path, route, duration * 1000, stats.queries,
+                stats.db_time * 1000, stats.template_time * 1000)
+        return response
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,165 @@
+"""
+Response caching for the catalog pages (movie list, movie detail, about).
+
+Rendered pages are stored in the CATALOG_CACHE_ALIAS cache under a key
+made of the URL path, the normalised query string and who is looking:
+anonymous visitors share one copy, logged-in users get their own (the
+navbar shows their name). Every key also carries a generation number that
+moviesstore/signals.py bumps whenever a Movie or Review is saved or
+deleted, so a change invalidates every cached page at once; the timeout is
+only a safety net.
+
+Forms on cached pages still need the visitor's own CSRF token. While a
+page is rendered for the cache, the csrf_placeholder context processor
+puts CSRF_PLACEHOLDER where the token goes, and every response (hit or
+miss) gets the requesting visitor's token in its place. Anonymous
+visitors therefore share one copy of pages with forms too.
+
+Works with any Django cache backend, including LocMemCache and
+FileBasedCache (use the latter to share entries and hit/miss counters
+between worker processes). Requests that moviesstore/db_router.py pins
+to the primary database bypass the cache.
+"""
+import functools
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .db_router import primary_pinned
+
+GENERATION_KEY = 'page_cache:generation'
+HITS_KEY = 'page_cache:hits'
+MISSES_KEY = 'page_cache:misses'
+# Stands in for the CSRF token in cached pages.
+CSRF_PLACEHOLDER = 'page-cache-csrf-token'
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _generation(cache):
+    # Starts from the clock rather than 1, so a restarted process or an
+    # evicted key never reuses a generation that already had pages.
+    return cache.get_or_set(GENERATION_KEY, time.time_ns, timeout=None)
+
+
+def generation():
+    """
+    The current generation number, for other caches of data derived from
+    the catalog (see movies/facets.py) that should go stale with the pages.
+    """
+    return _generation(_cache())
+
+
+def invalidate():
+    """Make every cached catalog page stale."""
+    cache = _cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def _count(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def stats():
+    """Return the hit/miss counters and hit ratio since the last reset."""
+    cache = _cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def csrf_placeholder(request):
+    """
+    Context processor: forms rendered for the page cache get
+    CSRF_PLACEHOLDER instead of the visitor's CSRF token.
+    """
+    if getattr(request, '_page_cache_rendering', False):
+        return {'csrf_token': CSRF_PLACEHOLDER}
+    return {}
+
+
+def _insert_csrf_token(request, content):
+    placeholder = CSRF_PLACEHOLDER.encode()
+    if placeholder not in content:
+        return content
+    # get_token() also has CsrfViewMiddleware set the cookie if needed.
+    return content.replace(placeholder, get_token(request).encode())
+
+
+def _page_key(request, generation):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    if request.user.is_authenticated:
+        audience = f'user:{request.user.pk}'
+    else:
+        audience = 'anon'
+    raw = '|'.join([request.method, request.path, query, audience])
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'page_cache:{generation}:{digest}'
+
+
+def cache_catalog_page(view=None):
+    """
+    Cache a view's GET responses until the catalog changes. CSRF tokens in
+    its forms are filled in per request.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            # Requests pinned to the primary just wrote something; a copy
+            # rendered from a lagging replica could hide that write.
+            if request.method not in ('GET', 'HEAD') or primary_pinned():
+                return view_func(request, *args, **kwargs)
+
+            cache = _cache()
+            key = _page_key(request, _generation(cache))
+            cached = cache.get(key)
+            if cached is not None:
+                _count(cache, HITS_KEY)
+                content, content_type = cached
+                response = HttpResponse(_insert_csrf_token(request, content),
+                                        content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count(cache, MISSES_KEY)
+            request._page_cache_rendering = True
+            try:
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+            finally:
+                request._page_cache_rendering = False
+            if not response.streaming:
+                if response.status_code == 200 and not response.cookies:
+                    cache.set(key, (response.content, response['Content-Type']),
+                              timeout=settings.CATALOG_CACHE_TIMEOUT)
+                response.content = _insert_csrf_token(request, response.content)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
@@ -0,0 +1,141 @@
+"""
+Keyset (cursor) pagination shared by the listing views.
+
+Instead of OFFSET, every page is fetched with a WHERE clause that starts
+right after the last row of the previous page, so with a matching index a
+deep page costs the same as the first one. Cursors are opaque URL-safe
+tokens that encode the sort key of the row a page starts after (or before).
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': list(values), 'd': direction},
+                         default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, key_length):
+    """
+    Return (values, direction) for a cursor token, or None if the token is
+    missing or malformed (callers then fall back to the first page). The
+    values' types are checked by paginate(), against the sort key.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['k'], payload['d']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+    if (not isinstance(values, list) or len(values) != key_length
+            or direction not in (NEXT, PREVIOUS)):
+        return None
+    return values, direction
+
+
+def _keyset_filter(ordering, values, forward):
+    """
+    Build the row-value comparison "(a, b) > (x, y)" as
+    a > x OR (a = x AND b > y), honouring "-field" descending keys.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _reverse(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPage:
+    """One page of results plus the cursors of its neighbours."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def get_page_size(request, default, maximum):
+    """Read an optional ?page_size= parameter, clamped to [1, maximum]."""
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def paginate(queryset, ordering, cursor=None, page_size=20):
+    """
+    Return the KeysetPage of `queryset` identified by `cursor`.
+
+    `ordering` must be a unique sort key (end it with the primary key), for
+    example ('name', 'id') or ('-created_date', '-id').
+    """
+    ordering = list(ordering)
+    key_names = [field.lstrip('-') for field in ordering]
+    decoded = decode_cursor(cursor, len(ordering))
+
+    if decoded is None:
+        values, direction = None, NEXT
+    else:
+        values, direction = decoded
+    forward = direction == NEXT
+
+    if values is not None:
+        try:
+            queryset = queryset.filter(_keyset_filter(ordering, values, forward))
+        except (ValueError, TypeError, ValidationError):
+            # The cursor decoded, but its values do not fit the sort key
+            # (a tampered or outdated token): start from the first page.
+            values, forward = None, True
+    queryset = queryset.order_by(*(ordering if forward else _reverse(ordering)))
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    def key_of(obj):
+        if isinstance(obj, dict):
+            return [obj[name] for name in key_names]
+        return [getattr(obj, name) for name in key_names]
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or not forward:
+            next_cursor = encode_cursor(key_of(rows[-1]), NEXT)
+        if values is not None and (forward or has_more):
+            previous_cursor = encode_cursor(key_of(rows[0]), PREVIOUS)
+    return KeysetPage(rows, next_cursor, previous_cursor)
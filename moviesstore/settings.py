@@ -41,15 +41,18 @@ INSTALLED_APPS = [
     'movies',
     'accounts',
     'cart',
+    'api',
     'moviesstore'
 ]
 
 MIDDLEWARE = [
+    'moviesstore.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'moviesstore.db_router.PrimaryStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,7 +61,8 @@ ROOT_URLCONF = 'moviesstore.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for moviesstore.metrics.
+        'BACKEND': 'moviesstore.metrics.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'moviesstore/templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -67,6 +71,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                # CSRF tokens of pages rendered for the page cache
+                'moviesstore.page_cache.csrf_placeholder',
             ],
         },
     },
@@ -74,17 +80,98 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'moviesstore.wsgi.application'
 
+# Request metrics (see moviesstore/metrics.py). Requests above either budget
+# are logged as warnings by the 'moviesstore.metrics' logger.
+METRICS_WINDOW = 1000                 # samples kept per route
+METRICS_QUERY_BUDGET = 20
+METRICS_LATENCY_BUDGET = 0.5          # seconds
+# Per-route overrides of METRICS_LATENCY_BUDGET. Routes that hash a
+# password (PBKDF2 is deliberately slow) take longer than any page.
+METRICS_ROUTE_LATENCY_BUDGETS = dict.fromkeys(
+    ['accounts.login', 'accounts.signup', 'api.session', 'admin:login',
+     'password_reset_confirm'], 3.0)
+# Lets Prometheus scrape /metrics/prometheus/ without a staff login.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Applied to every new SQLite connection. WAL lets readers proceed while a
+# write is in flight. The busy timeout is the 'timeout' option below, not a
+# pragma: a busy_timeout pragma here would silently override it.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # durable in WAL mode except on power loss
+    'cache_size': -20000,           # negative = KiB, i.e. ~20 MB page cache
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open across requests (re-checked before reuse)
+        # so the pragmas above are not re-applied on every request.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a writer waits for the lock instead of failing with
+            # "database is locked".
+            'timeout': 20,
+            # Take the write lock when a transaction starts, so two
+            # transactions never deadlock upgrading read locks to write.
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    }
+}
+
+# Read replicas: DB_REPLICAS is a comma-separated list of SQLite files kept
+# in sync with the primary (two local files work for trying it out). Reads
+# are spread over them; see moviesstore/db_router.py for what stays on the
+# primary.
+REPLICA_DATABASES = []
+for _index, _name in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    _alias = f'replica{_index}'
+    DATABASES[_alias] = {
+        **DATABASES['default'],
+        'NAME': _name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(_alias)
+
+DATABASE_ROUTERS = ['moviesstore.db_router.PrimaryReplicaRouter']
+
+# After a request writes to the database, the same browser reads from the
+# primary for this many seconds (longer than the worst replication lag).
+REPLICA_STICKY_SECONDS = 10
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory works out of the box; switch to
+# 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION
+# to share cached pages between worker processes. A shared backend is also
+# what carries Movie changes to the featured pool (home/featured.py) and
+# the autocomplete index of every worker; with local memory, other workers
+# catch up only when those expire.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'moviesstore',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
     }
 }
 
+# Catalog page cache (see moviesstore/page_cache.py). Entries are invalidated
+# when a Movie or Review changes; the timeout is only a safety net.
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -135,6 +222,19 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies plus .gz/.br variants into
+# STATIC_ROOT; moviesstore.wsgi serves them ahead of Django
+# (see moviesstore/staticfiles.py).
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'moviesstore.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -146,3 +246,71 @@ STATICFILES_DIRS = [
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+
+# Bounding boxes (width, height) of the resized copies generated for every
+# uploaded movie image (see movies/images.py)
+MOVIE_IMAGE_RENDITIONS = {
+    'thumbnail': (120, 120),
+    'card': (400, 400),
+    'detail': (900, 900),
+}
+
+# Local cache of posters referenced by Movie.image_url (see movies/posters.py)
+POSTER_CACHE_DIR = os.getenv('POSTER_CACHE_DIR', BASE_DIR / 'var' / 'poster_cache')
+POSTER_CACHE_MAX_SIZE = (600, 900)           # bounding box of the stored copy
+POSTER_CACHE_MAX_BYTES = 200 * 1024 * 1024   # LRU eviction threshold
+POSTER_CACHE_MAX_DOWNLOAD = 10 * 1024 * 1024
+POSTER_CACHE_TIMEOUT = 10                    # seconds per download
+POSTER_CACHE_REFRESH = 7 * 24 * 60 * 60      # revalidate copies older than this
+POSTER_CACHE_MAX_AGE = 30 * 24 * 60 * 60     # browser Cache-Control max-age
+POSTER_CACHE_WORKERS = 2
+
+# Catalog pagination (keyset, see moviesstore/pagination.py)
+MOVIES_PAGE_SIZE = 24
+MOVIES_MAX_PAGE_SIZE = 96
+REVIEWS_PAGE_SIZE = 10
+
+# JSON API pages (see api/views.py): default and largest ?page_size=
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Price bands offered as catalog facets (see movies/facets.py): the bands
+# are "under 5", "5 to 10", "10 to 20" and "20 and up"
+MOVIES_PRICE_BAND_EDGES = [5, 10, 20]
+ORDERS_PAGE_SIZE = 10
+
+# Largest quantity of a single movie accepted in the cart and at checkout
+CART_MAX_QUANTITY = 10
+
+# Seconds an anonymous cart is kept after its last change before
+# purge_anonymous_carts deletes it. Matches Django's SESSION_COOKIE_AGE
+# (two weeks), after which the visitor's session can no longer reach it.
+CART_ANONYMOUS_TTL = 60 * 60 * 24 * 14
+
+# Seconds before the home page's featured-movie ID pool is reloaded even
+# without a Movie change (see home/featured.py)
+FEATURED_POOL_TTL = 600
+
+# Search box typeahead (see movies/autocomplete.py): suggestions returned,
+# prefixes remembered per process, and browser Cache-Control max-age
+AUTOCOMPLETE_RESULTS = 8
+AUTOCOMPLETE_CACHE_SIZE = 2048
+AUTOCOMPLETE_MAX_AGE = 60
+
+# "Customers who bought this also bought" (see movies/recommendations.py):
+# neighbors stored and shown per movie, orders two movies must share to be
+# neighbors, and movies recomputed per query by refresh_recommendations
+CO_PURCHASE_TOP_K = 8
+CO_PURCHASE_MIN_SUPPORT = 1
+CO_PURCHASE_BATCH_SIZE = 500
+
+# "Recommended for you" on the home page (see movies/recommendations.py):
+# movies stored and shown per user, similar movies kept per rated movie,
+# recent reviews used per user, users who must have rated two movies for
+# them to count as similar, and movies/users handled per query by
+# refresh_personal_recommendations
+PERSONAL_RECOMMENDATIONS_TOP_N = 6
+PERSONAL_RECOMMENDATIONS_NEIGHBORS = 20
+PERSONAL_RECOMMENDATIONS_MAX_REVIEWS = 100
+PERSONAL_RECOMMENDATIONS_MIN_CO_RATERS = 2
+PERSONAL_RECOMMENDATIONS_BATCH_SIZE = 500
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from movies.models import Movie, Review
+from . import page_cache
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_pages(sender, **kwargs):
+    """The catalog changed: every cached catalog page is stale."""
+    page_cache.invalidate()
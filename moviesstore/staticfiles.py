@@ -0,0 +1,220 @@
+"""
+Static file pipeline.
+
+CompressedManifestStaticFilesStorage is Django's ManifestStaticFilesStorage
+(content-hashed filenames such as css/style.3f2a9c1b04e7.css) that also
+writes .gz and .br variants of every compressible file during
+collectstatic. `brotli` is in requirements.txt; where it is missing, only
+the .gz variants are written.
+
+StaticFilesApp is a WSGI wrapper around the Django application that
+answers requests under STATIC_URL straight from STATIC_ROOT. It never
+reaches Django's middleware or URL resolver. It serves the precompressed
+variant the client accepts, and it sends immutable cache headers for
+hashed filenames.
+"""
+import gzip
+import json
+import mimetypes
+import os
+from email.utils import formatdate
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are produced without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml',
+    '.ico', '.ttf', '.otf', '.eot',
+}
+# A variant is only kept if it saves at least this fraction of the bytes.
+MIN_SAVING = 0.05
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+def compress_file(path):
+    """Write path.gz (and path.br) next to `path`; return the variants written."""
+    data = Path(path).read_bytes()
+    written = []
+    variants = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            Path(f'{path}{suffix}').write_bytes(compressed)
+            written.append(f'{path}{suffix}')
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                compress_file(self.path(name))
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            # A stylesheet references a file that does not exist (style.css
+            # points at img/background.jpg). Keep the reference as written
+            # rather than aborting collectstatic.
+            return name
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            # collectstatic has not been run (fresh checkout, test runs):
+            # link the unhashed file instead of failing the whole page.
+            return FileSystemStorage.url(self, name)
+
+
+class StaticFile:
+    """A file under STATIC_ROOT plus its precompressed variants."""
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in (
+                'application/javascript', 'application/json', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL
+        # (encoding, path, size, etag), best encoding first; each encoding
+        # has its own ETag since the bytes differ.
+        version = f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+        self.variants = []
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if os.path.exists(path + suffix):
+                self.variants.append((encoding, path + suffix, os.path.getsize(path + suffix),
+                                      f'"{version}-{encoding}"'))
+        self.variants.append((None, path, stat.st_size, f'"{version}"'))
+
+    def pick(self, accept_encoding):
+        """The variant to send for an Accept-Encoding header value."""
+        accepted = parse_accept_encoding(accept_encoding)
+        best = self.variants[-1]
+        best_quality = 0.0
+        for variant in self.variants[:-1]:
+            quality = accepted.get(variant[0], accepted.get('*', 0.0))
+            # Ties go to the earlier (smaller) variant.
+            if quality > best_quality:
+                best, best_quality = variant, quality
+        return best
+
+
+def parse_accept_encoding(header):
+    """Map each coding of an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = max(0.0, min(quality, 1.0))
+    return accepted
+
+
+def scan_static_root(root, manifest_name='staticfiles.json'):
+    """Map URL paths (relative to STATIC_URL) to StaticFile entries."""
+    root = Path(root)
+    if not root.is_dir():
+        return {}
+    immutable = set()
+    manifest = root / manifest_name
+    if manifest.exists():
+        immutable = set(json.loads(manifest.read_text()).get('paths', {}).values())
+
+    files = {}
+    for path in root.rglob('*'):
+        if not path.is_file() or path.suffix in ('.gz', '.br') or path.name == manifest_name:
+            continue
+        name = path.relative_to(root).as_posix()
+        files[name] = StaticFile(str(path), name in immutable)
+    return files
+
+
+class StaticFilesApp:
+    """
+    WSGI wrapper serving STATIC_ROOT ahead of Django. The file index is
+    built once at startup; run collectstatic before starting the server.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.prefix = '/' + (prefix or settings.STATIC_URL).strip('/') + '/'
+        self.files = scan_static_root(root or settings.STATIC_ROOT)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not self.files or not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+        static_file = self.files.get(path[len(self.prefix):])
+        if static_file is None:
+            return self.application(environ, start_response)
+
+        method = environ.get('REQUEST_METHOD')
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return []
+
+        encoding, file_path, size, etag = static_file.pick(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        headers = [
+            ('Cache-Control', static_file.cache_control),
+            ('ETag', etag),
+            ('Last-Modified', static_file.last_modified),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if environ.get('HTTP_IF_NONE_MATCH') == etag:
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers += [
+            ('Content-Type', static_file.content_type),
+            ('Content-Length', str(size)),
+        ]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return []
+        file_handle = open(file_path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(file_handle, 64 * 1024)
+        return _iter_file(file_handle)
+
+
+def _iter_file(file_handle, block_size=64 * 1024):
+    with file_handle:
+        while True:
+            block = file_handle.read(block_size)
+            if not block:
+                return
+            yield block
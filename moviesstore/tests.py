@@ -0,0 +1,390 @@
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.templatetags.static import static
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from cart.models import Order
+from movies import search
+from movies.models import Movie
+
+from . import benchmark, metrics
+from .pagination import NEXT, encode_cursor, paginate
+from .db_router import STICKY_COOKIE, PrimaryReplicaRouter, request_scope, use_primary
+from .staticfiles import IMMUTABLE_CACHE_CONTROL, StaticFilesApp
+
+
+def django_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'django']
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for n in range(7):
+            Movie.objects.create(name=f'Movie {n}', genre='ACTION' if n % 2 else 'DRAMA',
+                                 price=5, description='A movie.',
+                                 image_url='https://example.com/poster.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, page):
+        return [movie.name for movie in page]
+
+    def test_forward_and_back(self):
+        movies = Movie.objects.all()
+        first = paginate(movies, ('name', 'id'), None, 3)
+        self.assertEqual(self.names(first), ['Movie 0', 'Movie 1', 'Movie 2'])
+        self.assertIsNone(first.previous_cursor)
+        second = paginate(movies, ('name', 'id'), first.next_cursor, 3)
+        self.assertEqual(self.names(second), ['Movie 3', 'Movie 4', 'Movie 5'])
+        last = paginate(movies, ('name', 'id'), second.next_cursor, 3)
+        self.assertEqual(self.names(last), ['Movie 6'])
+        self.assertIsNone(last.next_cursor)
+
+        back = paginate(movies, ('name', 'id'), last.previous_cursor, 3)
+        self.assertEqual(self.names(back), self.names(second))
+        back = paginate(movies, ('name', 'id'), back.previous_cursor, 3)
+        self.assertEqual(self.names(back), self.names(first))
+        self.assertIsNone(back.previous_cursor)
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        movies = Movie.objects.all()
+        for cursor in ('not-a-cursor', encode_cursor(['a', 'x'], NEXT),
+                       encode_cursor([None, None], NEXT), encode_cursor(['a'], NEXT)):
+            page = paginate(movies, ('name', 'id'), cursor, 3)
+            self.assertEqual(self.names(page), ['Movie 0', 'Movie 1', 'Movie 2'], cursor)
+        page = paginate(Movie.objects.all(), ('-id',), encode_cursor([[1]], NEXT), 3)
+        self.assertEqual(len(page), 3)
+
+    def test_crafted_cursor_is_not_a_server_error(self):
+        cursor = encode_cursor(['a', 'x'], NEXT)
+        for name in ('movies.index', 'api.movies'):
+            response = self.client.get(reverse(name), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200, name)
+
+    def test_genre_filtered_walk(self):
+        url = reverse('movies.index')
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(url, {'genre': 'ACTION', 'page_size': 2, 'cursor': cursor or ''})
+            page = response.context['template_data']['page']
+            seen += self.names(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['Movie 1', 'Movie 3', 'Movie 5'])
+
+
+class SQLiteConnectionTests(SimpleTestCase):
+
+    def test_new_connections_get_the_configured_pragmas(self):
+        # The test database lives in memory, where WAL does not apply, so
+        # open a file database with the same settings.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_dict = {**connections['default'].settings_dict,
+                         'NAME': str(Path(directory) / 'pragmas.sqlite3')}
+        wrapper = connections['default'].__class__(settings_dict, alias='pragma_check')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            def pragma(name):
+                return cursor.execute(f'PRAGMA {name}').fetchone()[0]
+
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('synchronous'), 1)     # NORMAL
+            self.assertEqual(pragma('temp_store'), 2)      # MEMORY
+            self.assertEqual(pragma('cache_size'), -20000)
+            # The 'timeout' option, not overridden by an init_command pragma.
+            self.assertEqual(pragma('busy_timeout'), 20000)
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+
+class StaticFilesTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(STATIC_ROOT=cls.static_root)
+        cls.settings_override.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.app = StaticFilesApp(django_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.static_root)
+        super().tearDownClass()
+
+    def get(self, path, **headers):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'wsgi.input': io.BytesIO()}
+        environ.update(headers)
+        response = {}
+
+        def start_response(status, response_headers):
+            response['status'] = status
+            response['headers'] = dict(response_headers)
+
+        response['body'] = b''.join(self.app(environ, start_response))
+        return response
+
+    def test_collectstatic_writes_hashed_and_gzipped_files(self):
+        hashed = static('css/style.css')
+        self.assertRegex(hashed, r'^/static/css/style\.[0-9a-f]{12}\.css$')
+        self.assertTrue(Path(self.static_root, hashed[len('/static/'):] + '.gz').exists())
+
+    def test_serves_precompressed_variant_with_immutable_headers(self):
+        response = self.get(static('css/style.css'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(response['headers']['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['headers']['Content-Length'], str(len(response['body'])))
+
+    def test_identity_when_client_does_not_accept_gzip(self):
+        response = self.get(static('css/style.css'))
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertIn(b'.bg-index', response['body'])
+
+    def test_accept_encoding_is_parsed_into_tokens_and_q_values(self):
+        url = static('css/style.css')
+        for header, expected in (
+                ('gzip;q=0, deflate', None),
+                ('x-gzip', None),
+                ('GZIP;q=0.5', 'gzip'),
+                ('*', 'gzip'),
+                ('*, gzip;q=0', None),
+                ('identity', None)):
+            encoding = self.get(url, HTTP_ACCEPT_ENCODING=header)['headers'].get('Content-Encoding')
+            self.assertEqual(encoding, expected, header)
+
+    def test_prefers_brotli_when_accepted(self):
+        path = Path(self.static_root, static('css/style.css')[len('/static/'):])
+        brotli_path = Path(f'{path}.br')
+        brotli_path.write_bytes(b'brotli bytes')
+        self.addCleanup(brotli_path.unlink)
+        app = StaticFilesApp(django_app)
+        for header, expected in (('gzip, deflate, br', 'br'), ('br;q=0.5, gzip', 'gzip'),
+                                 ('br;q=0, gzip', 'gzip')):
+            encoding, _, _, _ = app.files[static('css/style.css')[len('/static/'):]].pick(header)
+            self.assertEqual(encoding, expected, header)
+
+    def test_conditional_request_returns_304(self):
+        etag = self.get(static('css/style.css'))['headers']['ETag']
+        response = self.get(static('css/style.css'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['status'], '304 Not Modified')
+
+    def test_other_paths_fall_through_to_django(self):
+        self.assertEqual(self.get('/movies/')['body'], b'django')
+        self.assertEqual(self.get('/static/css/missing.css')['body'], b'django')
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TestCase):
+    """The test database is the primary; 'replica' is a separate SQLite file."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registered after the test runner has set up its databases, so the
+        # replica is a real second file rather than a mirror of 'default'.
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'NAME': str(Path(cls.replica_dir) / 'replica.sqlite3'),
+            'TEST': {**connections.settings['default']['TEST'], 'NAME': None},
+        }
+        cls.databases = cls.databases | {'replica'}
+        # Stands in for replication copying the primary's schema; migrate
+        # itself leaves replicas alone.
+        with override_settings(REPLICA_DATABASES=[]):
+            call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        shutil.rmtree(cls.replica_dir)
+        cls.databases = cls.databases - {'replica'}
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reviewer', password='secret')
+        cls.movie = Movie.objects.create(name='Primary Only', price=5, description='New.')
+
+    def setUp(self):
+        cache.clear()
+        Movie.objects.using('replica').create(name='Replica Only', price=5, description='Old.')
+
+    def test_router_reads_from_replica_and_writes_to_primary(self):
+        router = PrimaryReplicaRouter()
+        with request_scope():
+            self.assertEqual(router.db_for_read(Movie), 'replica')
+            self.assertEqual(router.db_for_read(User), 'default')
+            self.assertEqual(router.db_for_write(Movie), 'default')
+            with use_primary():
+                self.assertEqual(router.db_for_read(Movie), 'default')
+        self.assertTrue(router.allow_migrate('default', 'movies'))
+        self.assertFalse(router.allow_migrate('replica', 'movies'))
+
+    def test_reads_outside_a_request_see_their_own_writes(self):
+        movie = Movie.objects.create(name='Just Imported', price=1, description='')
+        self.assertTrue(Movie.objects.filter(pk=movie.pk).exists())
+        self.assertEqual(PrimaryReplicaRouter().db_for_read(Movie), 'default')
+
+    def test_write_is_recorded_in_request_scope(self):
+        with request_scope() as state:
+            Movie.objects.create(name='Written', price=1, description='')
+        self.assertTrue(state[1])
+
+    def test_catalog_reads_go_to_replica(self):
+        response = self.client.get(reverse('movies.index'))
+        self.assertContains(response, 'Replica Only')
+        self.assertNotContains(response, 'Primary Only')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_user_reads_primary_after_posting_a_review(self):
+        self.client.force_login(self.user)
+        # The movie is not on the replica yet; the POST itself is pinned.
+        response = self.client.post(
+            reverse('movies.create_review', args=[self.movie.id]),
+            {'comment': 'Fresh take', 'rating': 4})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        self.assertContains(response, 'Fresh take')
+        response = self.client.get(reverse('movies.index'))
+        self.assertContains(response, 'Primary Only')
+
+        # Once the window is over, reads go back to the (lagging) replica.
+        self.client.cookies.pop(STICKY_COOKIE)
+        response = self.client.get(reverse('movies.index'))
+        self.assertContains(response, 'Replica Only')
+        self.assertNotContains(response, 'Primary Only')
+
+
+class RequestMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        Movie.objects.create(name='Heat', price=8, description='A heist.')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_records_queries_templates_and_size_per_route(self):
+        response = self.client.get(reverse('movies.index'))
+        [row] = metrics.snapshot()
+        self.assertEqual(row['route'], 'movies.index')
+        self.assertEqual(row['count'], 1)
+        self.assertGreater(row['queries']['p50'], 0)
+        self.assertGreater(row['template_time']['p50'], 0)
+        self.assertEqual(row['size']['p99'], len(response.content))
+
+    def test_percentiles_use_the_rolling_window(self):
+        histogram = metrics.RollingHistogram(window=100)
+        for value in range(1, 201):
+            histogram.add(value)
+        self.assertEqual(histogram.quantile(0.5), 150)
+        self.assertEqual(histogram.quantile(0.99), 199)
+        self.assertEqual(histogram.count, 200)
+
+    def test_metrics_page_is_staff_only(self):
+        response = self.client.get(reverse('metrics.index'))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        self.client.get(reverse('movies.index'))
+        response = self.client.get(reverse('metrics.index'))
+        self.assertContains(response, 'movies.index')
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_prometheus_export_requires_staff_or_token(self):
+        self.client.get(reverse('movies.index'))
+        url = reverse('metrics.prometheus')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE moviesstore_request_duration_seconds summary', body)
+        self.assertIn('moviesstore_request_db_queries_count{route="movies.index"} 1', body)
+        self.assertIn('quantile="0.95"', body)
+
+    @override_settings(METRICS_QUERY_BUDGET=0)
+    def test_logs_requests_over_budget(self):
+        with self.assertLogs('moviesstore.metrics', 'WARNING') as logs:
+            self.client.get(reverse('movies.index'))
+        self.assertIn('movies.index', logs.output[0])
+
+    @override_settings(METRICS_LATENCY_BUDGET=0)
+    def test_password_routes_have_their_own_latency_budget(self):
+        with self.assertLogs('moviesstore.metrics', 'WARNING'):
+            self.client.get(reverse('movies.index'))
+        with self.assertNoLogs('moviesstore.metrics', 'WARNING'):
+            response = self.client.post(reverse('accounts.login'),
+                                        {'username': 'staff', 'password': 'secret'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(metrics.latency_budget('accounts.login'), 3.0)
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(movies=40, reviews=300, users=4, orders_per_user=2,
+                       batch_size=50, log=lambda message: None)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_keeps_search_and_ratings_in_step(self):
+        movie = Movie.objects.order_by('-review_count').first()
+        self.assertEqual(movie.review_count, movie.reviews.count())
+        term = movie.name.split()[0]
+        self.assertIn(movie, search.search(Movie.objects.all(), term))
+
+    def test_every_scenario_succeeds_and_leaves_no_trace(self):
+        orders = Order.objects.count()
+        results = benchmark.run(iterations=2, warmup=0, log=lambda message: None)
+        self.assertEqual(len(results['scenarios']), len(benchmark.scenarios()))
+        for name, result in results['scenarios'].items():
+            self.assertEqual(result['status'], 200, name)
+            self.assertGreater(result['queries'], 0, name)
+        self.assertEqual(Order.objects.count(), orders)
+
+    def test_each_request_is_rolled_back_on_its_own(self):
+        # No transaction spans the run, so the write lock is released
+        # between requests.
+        depth = len(connections['default'].atomic_blocks)
+        depths = []
+
+        def prepare(client):
+            depths.append(len(connections['default'].atomic_blocks))
+            return 'get', reverse('movies.index'), None
+
+        with mock.patch.object(benchmark, 'scenarios',
+                               return_value=[('first', prepare), ('second', prepare)]):
+            benchmark.run(iterations=1, warmup=0, log=lambda message: None)
+        self.assertEqual(depths, [depth + 1, depth + 1])
+
+    def test_compare_flags_extra_queries_and_slowdowns(self):
+        results = {'scenarios': {'movies.show': {'queries': 5, 'p50_ms': 30.0}}}
+        self.assertEqual(benchmark.compare(results, results), [])
+        baseline = {'scenarios': {'movies.show': {'queries': 4, 'p50_ms': 10.0}}}
+        regressions = benchmark.compare(results, baseline)
+        self.assertEqual(len(regressions), 2)
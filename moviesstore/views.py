@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden
+from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics
+
+
+@staff_member_required
+def metrics_index(request):
+    template_data = {}
+    template_data['title'] = 'Request Metrics'
+    template_data['routes'] = metrics.snapshot()
+    template_data['window'] = settings.METRICS_WINDOW
+    return render(request, 'moviesstore/metrics.html', {'template_data': template_data})
+
+
+def metrics_prometheus(request):
+    # Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>".
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    authorized = request.user.is_active and request.user.is_staff
+    if token and constant_time_compare(header, f'Bearer {token}'):
+        authorized = True
+    if not authorized:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.prometheus_text(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -15,4 +15,9 @@ load_dotenv()
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'moviesstore.settings')
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+# Collected static files are answered before Django is involved at all.
+from moviesstore.staticfiles import StaticFilesApp  # noqa: E402
+
+application = StaticFilesApp(django_application)